@@ -1,21 +1,250 @@
 # Import libraries
 # Flask
 import flask
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context, g
 
-# Pickle
-import pickle
+# JSON, environment and admin token comparison
+import json
+import os
+import hmac
+from concurrent.futures import ThreadPoolExecutor
 
-# Pandas
-import pandas as pd
+# Numpy
+import numpy as np
+
+# Checks of the feature values against the model signature
+from common.mlmodel import check_feature_values, missing_required_features
+
+# Models served, reloaded without restarting
+from model_registry import ModelRegistry
+
+# Loading in stages and health of the process
+from startup import Startup
+
+# Size of a page of search results
+from common.customer_search import PAGE_SIZE
+
+# Counters and timers of the requests
+import metrics
+from metrics import record_shadow, set_outcome, stage
+
+# Explanations of the scores
+from common.explanations import (
+    get_global_feature_importance,
+    get_local_feature_importance,
+    get_main_important_features
+)
 
 # Create Flask objects
 app = flask.Flask(__name__)
 
-# Load the model
-model = pickle.load(open("/data/model/model.pkl", "rb"))
-# Load the data
-df = pd.read_csv("/data/cleaned_data/test_data_cleaned.csv")
+# Paths of the model and the data
+MODEL_DIR = os.environ.get("MODEL_DIR", "/data/model")
+DATA_PATH = os.environ.get("DATA_PATH", "/data/cleaned_data/test_data_cleaned.csv")
+# Candidate model served next to the active one: in its shadow (MODEL_ROUTING=shadow) or for
+# a share of the customers (MODEL_ROUTING=ab and CANDIDATE_SHARE=0.1)
+CANDIDATE_MODEL_DIR = os.environ.get("CANDIDATE_MODEL_DIR") or None
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "active")
+CANDIDATE_SHARE = float(os.environ.get("CANDIDATE_SHARE", 0))
+# Models wanted by the admin endpoints, shared by the workers and kept across restarts
+MODEL_STATE_PATH = os.environ.get("MODEL_STATE_PATH", os.path.join(os.path.dirname(MODEL_DIR), "model_state.json"))
+# Seconds between two checks of the state and of the model files (0 to only reload on admin calls)
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 10))
+# Token of the admin endpoints (Authorization: Bearer <token>), disabled when empty
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Load the models and the customers in a background thread, answering the health checks
+# meanwhile (BACKGROUND_LOADING=1, set by gunicorn.conf.py), or right away when this module
+# is imported (tests, scripts and development server)
+BACKGROUND_LOADING = os.environ.get("BACKGROUND_LOADING", "0") == "1"
+# Number of customers scored together by the batch endpoint
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 1000))
+# Largest number of points of a what-if sweep
+MAX_SWEEP_POINTS = int(os.environ.get("MAX_SWEEP_POINTS", 10000))
+# Largest number of similar customers returned
+MAX_NEIGHBOURS = int(os.environ.get("MAX_NEIGHBOURS", 100))
+# Largest number of customers of a page of search results
+MAX_SEARCH_RESULTS = int(os.environ.get("MAX_SEARCH_RESULTS", 100))
+
+# Models, customers and what is precomputed for them (see model_registry.py), None until loaded
+registry = None
+startup = Startup()
+# Shadow scoring runs after the answers, one batch at a time
+shadow_executor = ThreadPoolExecutor(max_workers=1)
+
+# Load the models, the customers and what is precomputed for them. Each model times its own
+# steps, up to a warm-up scoring (see ModelVersion), shown by /health/ready.
+def load(startup):
+    global registry
+    with startup.stage("models"):
+        registry = ModelRegistry(DATA_PATH, MODEL_DIR, MODEL_STATE_PATH, CANDIDATE_MODEL_DIR, MODEL_ROUTING, CANDIDATE_SHARE)
+
+# Follow the changes of the state and of the model files in a background thread
+def watch_models():
+    if MODEL_WATCH_INTERVAL > 0:
+        registry.watch(MODEL_WATCH_INTERVAL)
+
+# Load everything, then follow the changes of the models
+def load_and_watch(startup):
+    load(startup)
+    watch_models()
+
+# Start serving in a gunicorn worker: load in the background, or only follow the changes of
+# the models when they were loaded before the fork (API_PRELOAD=1)
+def start_worker():
+    if startup.ready:
+        watch_models()
+    else:
+        startup.start(load_and_watch)
+
+if not BACKGROUND_LOADING:
+    startup.run(load)
+    if not startup.ready:
+        raise RuntimeError(f"The API could not be loaded: {startup.error}")
+
+# Model answering the request: the version asked for with ?model=, or the one of the routing
+# for this customer. None when the version asked for is not in memory.
+def pick_model(customer_id=None):
+    if "model" in request.args:
+        model = registry.get(request.args["model"])
+    else:
+        model = registry.pick(customer_id)
+    if model is not None:
+        g.model_version = model.uuid
+    return model
+
+# Answer to a request for a model version that is not in memory
+def unknown_model():
+    set_outcome("unknown_model")
+    return f"Error: Unknown model version {request.args['model']}. Please try again !"
+
+# Score customers with the shadow model and record how far it is from the model that answered
+def compare_shadow(model, shadow, positions, probabilities):
+    try:
+        shadow_probabilities = shadow.predict_positions(positions)
+        record_shadow(model.uuid, shadow.uuid, np.abs(shadow_probabilities[:, 1] - probabilities[:, 1]))
+    except Exception:
+        app.logger.exception("Shadow scoring with model %s failed", shadow.uuid)
+
+# Probabilities of customers of the store, scored again by the shadow model after the answer
+def predict_positions(model, positions):
+    probabilities = model.predict_positions(positions)
+    shadow = registry.shadow_of(model)
+    if shadow is not None:
+        shadow_executor.submit(compare_shadow, model, shadow, positions, probabilities)
+    return probabilities
+
+# Put feature values (a dict) into a row in the order of a model, on top of the row of a
+# customer when given. Returns the row, or None and the problems found
+def make_row(model, values, baseline=None):
+    errors = check_feature_values(values, model.signature)
+    if baseline is None:
+        missing = missing_required_features(values, model.signature)
+        if missing:
+            errors.append(f"Missing required features: {', '.join(missing[:10])}" + (" ..." if len(missing) > 10 else ""))
+        row = np.full(len(model.features), np.nan)
+    else:
+        row = np.array(baseline, dtype=np.float64)
+    if errors:
+        return None, errors
+    for name, value in values.items():
+        row[model.feature_positions[name]] = np.nan if value is None else value
+    return row, []
+
+# Put the probabilities of one customer into the API response format
+def format_prediction(probabilities):
+    # Get the good customer proba
+    good_customer_proba = float(probabilities[0])
+    # Get the bad customer proba
+    bad_customer_proba = float(probabilities[1])
+    # Put the prediction into text (same rule as model.predict)
+    if bad_customer_proba <= good_customer_proba:
+        translated_result = "Good customer, offer him his credit !"
+    else:
+        translated_result = "Bad customer, offer him a coffee !"
+
+    return {
+        "Probability of the customer being a good one": good_customer_proba,
+        "Probability of the customer being a bad one": bad_customer_proba,
+        "Result of the analysis": translated_result,
+    }
+
+@app.before_request
+def start_request():
+    metrics.start_request()
+
+# Only the health checks and the metrics are answered while loading
+@app.before_request
+def check_ready():
+    if not startup.ready and request.endpoint not in ("health_live", "health_ready", "metrics"):
+        set_outcome("not_ready")
+        return "Error: The API is still loading. Please try again !", 503
+
+# Tell the clients which model answered, so they can drop what they cached from another one,
+# and count the request
+@app.after_request
+def add_model_version(response):
+    if registry is None:
+        return metrics.finish_request(response, "")
+    model_version = g.get("model_version") or registry.active.uuid
+    response.headers["X-Model-Version"] = model_version
+    return metrics.finish_request(response, model_version)
+
+# The process answers, and its loading didn't fail
+@app.route("/health/live", methods=["GET"], endpoint="health_live")
+def health_live():
+    if startup.error is not None:
+        return jsonify({"Live": False, "Error": startup.error}), 503
+    return jsonify({"Live": True})
+
+# Everything is loaded and warmed up in every worker: the stages of the loading of this worker with
+# their time, and the models served
+@app.route("/health/ready", methods=["GET"], endpoint="health_ready")
+def health_ready():
+    response = startup.describe()
+    if startup.ready:
+        response["Models"] = registry.describe()
+    return jsonify(response), 200 if response["Ready"] else 503
+
+# Metrics of the API in the Prometheus text format
+@app.route("/metrics", methods=["GET"], endpoint="metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# Check the admin token of a request, returns the error to answer or None
+def check_admin_token():
+    if not ADMIN_TOKEN:
+        return "Error: The admin endpoints are disabled. Set ADMIN_TOKEN to use them !"
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+        set_outcome("unauthorized")
+        return "Error: Bad admin token. Please try again !"
+    return None
+
+# Models in memory and routing of the worker answering
+@app.route("/api/v1/admin/models", methods=["GET"])
+def api_models():
+    error = check_admin_token()
+    if error is not None:
+        return error
+    return jsonify(registry.describe())
+
+# Load new models and change the routing without restarting. Every key of the body is optional:
+# an empty body loads the model directories again if their files changed.
+@app.route("/api/v1/admin/reload", methods=["POST"])
+def api_reload():
+    error = check_admin_token()
+    if error is not None:
+        return error
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    if not isinstance(body, dict) or not set(body) <= {"active", "candidate", "routing", "candidate_share", "promote"}:
+        return """Error: Bad reload request. <br>The request body should look like {"candidate": "/data/model_v2", "routing": "shadow"}, {"routing": "ab", "candidate_share": 0.1} or {"promote": true}"""
+    # The models are loaded and checked next to the ones serving, which keep answering meanwhile
+    error = registry.update_state(**body)
+    if error is not None:
+        return f"Error: The models could not be loaded, the ones serving are kept. {error}"
+    return jsonify(registry.describe())
 
 @app.route("/api/v1/customer", methods=["GET"])
 def api_id():
@@ -23,32 +252,288 @@ def api_id():
         try:
             customer_id=int(request.args["id"])
         except ValueError:
+            set_outcome("invalid_id")
             return "Error: Are you sure you typed the customer ID correctly ? Please try again !"
     else:
+        set_outcome("missing_id")
         return """Error: No id provided. Please provide a customer ID. <br>The request should look like /api/v1/customer?id=12456"""
-    # Select the customer in the dataframe
-    customer = df.loc[df["SK_ID_CURR"]==customer_id, :]
-    if customer.shape[0] != 1:
+    model = pick_model(customer_id)
+    if model is None:
+        return unknown_model()
+    # Select the customer in the store
+    with stage("lookup", model.uuid):
+        position = model.store.position(customer_id)
+    if position is None:
+        set_outcome("bad_id")
         return "Error: Bad customer ID provided. Please try again !"
-    # Make the predictions
-    results = model.predict_proba(customer)
-    result = model.predict(customer)
-    # Get the good customer proba
-    good_customer_proba = results[0][0]
-    # Get the bad customer proba
-    bad_customer_proba = results[0][1]
-    # Put the prediction into text
-    if result == 0:
-        translated_result = "Good customer, offer him his credit !"
+    # Make the prediction and create the response before convert it to JSON format
+    response = format_prediction(predict_positions(model, [position])[0])
+    with stage("serialize", model.uuid):
+        return jsonify(response)
+
+@app.route("/api/v1/customer/explain", methods=["GET"])
+def api_explain():
+    if "id" in request.args:
+        try:
+            customer_id=int(request.args["id"])
+        except ValueError:
+            set_outcome("invalid_id")
+            return "Error: Are you sure you typed the customer ID correctly ? Please try again !"
     else:
-        translated_result = "Bad customer, offer him a coffee !"
-        
-    # Create the response before convert it to JSON format
+        set_outcome("missing_id")
+        return """Error: No id provided. Please provide a customer ID. <br>The request should look like /api/v1/customer/explain?id=12456&top=10"""
+    try:
+        top = int(request.args.get("top", 10))
+    except ValueError:
+        return "Error: The number of features (top) should be an integer. Please try again !"
+    model = pick_model(customer_id)
+    if model is None:
+        return unknown_model()
+    if top < 1 or top > len(model.features):
+        return f"Error: The number of features (top) should be between 1 and {len(model.features)}. Please try again !"
+    # Select the customer in the store
+    position = model.store.position(customer_id)
+    if position is None:
+        set_outcome("bad_id")
+        return "Error: Bad customer ID provided. Please try again !"
+    # Get the shap values of the customer only and the mean of every customer
+    with stage("shap", model.uuid):
+        customer_shap_values = model.shap_store.values([position])[0]
+    local_feature_importance = get_local_feature_importance(customer_shap_values, model.features)
+    # Partial until the SHAP store is filled offline, the share of the customers it covers is in the response
+    global_feature_importance = get_global_feature_importance(model.shap_store.global_importance(), model.features)
+    positive_important_features, negative_important_features = get_main_important_features(
+        local_feature_importance, global_feature_importance, top
+    )
     response = {
-        "Probability of the customer being a good one": good_customer_proba,
-        "Probability of the customer being a bad one": bad_customer_proba,
-        "Result of the analysis": translated_result,
+        "SK_ID_CURR": customer_id,
+        "Most positive features": positive_important_features.to_dict(orient="records"),
+        "Most negative features": negative_important_features.to_dict(orient="records"),
+        "Share of the customers in the global importance": model.shap_store.completion(),
     }
     return jsonify(response)
 
-app.run(host="0.0.0.0", port=5001)
+@app.route("/api/v1/customer/neighbours", methods=["GET"])
+def api_neighbours():
+    if "id" in request.args:
+        try:
+            customer_id=int(request.args["id"])
+        except ValueError:
+            set_outcome("invalid_id")
+            return "Error: Are you sure you typed the customer ID correctly ? Please try again !"
+    else:
+        set_outcome("missing_id")
+        return """Error: No id provided. Please provide a customer ID. <br>The request should look like /api/v1/customer/neighbours?id=12456&k=10"""
+    try:
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        return "Error: The number of neighbours (k) should be an integer. Please try again !"
+    if k < 1 or k > MAX_NEIGHBOURS:
+        return f"Error: The number of neighbours (k) should be between 1 and {MAX_NEIGHBOURS}. Please try again !"
+    model = pick_model(customer_id)
+    if model is None:
+        return unknown_model()
+    # Select the customer in the store
+    store = model.store
+    position = store.position(customer_id)
+    if position is None:
+        set_outcome("bad_id")
+        return "Error: Bad customer ID provided. Please try again !"
+    # Find the closest customers and score them together
+    with stage("neighbours", model.uuid):
+        positions, distances = model.neighbour_index.query(store.values[position], k, exclude=position)
+    probabilities = predict_positions(model, positions) if len(positions) > 0 else []
+    neighbours = []
+    for neighbour, distance, neighbour_probabilities in zip(positions, distances, probabilities):
+        response = {"SK_ID_CURR": int(store.ids[neighbour]), "Distance": float(distance)}
+        response.update(format_prediction(neighbour_probabilities))
+        neighbours.append(response)
+    return jsonify({"SK_ID_CURR": customer_id, "Neighbours": neighbours})
+
+# Page of the customers whose ID starts with some digits (q) and is between min and max
+@app.route("/api/v1/customers/search", methods=["GET"])
+def api_search():
+    prefix = request.args.get("q", "").strip()
+    if prefix and not (prefix.isascii() and prefix.isdigit()):
+        return "Error: The search (q) should be the first digits of a customer ID. Please try again !"
+    try:
+        low = int(request.args["min"]) if "min" in request.args else None
+        high = int(request.args["max"]) if "max" in request.args else None
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        return "Error: min, max, offset and limit should be integers. Please try again !"
+    if offset < 0 or limit < 1 or limit > MAX_SEARCH_RESULTS:
+        return f"Error: The offset should be positive and the limit between 1 and {MAX_SEARCH_RESULTS}. Please try again !"
+    model = pick_model()
+    if model is None:
+        return unknown_model()
+    with stage("search", model.uuid):
+        ids, total = model.customer_index.search(prefix, low, high, offset, limit)
+    return jsonify({"Customers": ids, "Total": total, "Offset": offset, "Limit": limit})
+
+# Score a list of customer IDs with a model chunk by chunk, yielding one result per ID
+def score_ids(model, ids):
+    for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+        chunk = ids[start:start + BATCH_CHUNK_SIZE]
+        # Parse the IDs, keeping None for the ones we can't read
+        parsed_ids = []
+        for raw_id in chunk:
+            try:
+                parsed_ids.append(int(str(raw_id)))
+            except ValueError:
+                parsed_ids.append(None)
+        # Select all the known customers of the chunk at once
+        positions = {}
+        for customer_id in parsed_ids:
+            if customer_id in model.store and customer_id not in positions:
+                positions[customer_id] = len(positions)
+        # Make the predictions for the whole chunk
+        if positions:
+            results = predict_positions(model, [model.store.position(customer_id) for customer_id in positions])
+        for raw_id, customer_id in zip(chunk, parsed_ids):
+            if customer_id is None:
+                yield {"SK_ID_CURR": raw_id, "Error": "Are you sure you typed the customer ID correctly ?"}
+            elif customer_id not in positions:
+                yield {"SK_ID_CURR": customer_id, "Error": "Bad customer ID provided."}
+            else:
+                response = {"SK_ID_CURR": customer_id}
+                response.update(format_prediction(results[positions[customer_id]]))
+                yield response
+
+# Score raw feature rows with a model chunk by chunk, yielding one result per row
+def score_rows(model, rows):
+    for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+        chunk = rows[start:start + BATCH_CHUNK_SIZE]
+        # Check each row before putting the valid ones together
+        errors = {}
+        valid_rows = []
+        for i, row in enumerate(chunk):
+            if not isinstance(row, dict):
+                errors[i] = "The row should be an object mapping feature names to values."
+                continue
+            values, row_errors = make_row(model, row)
+            if row_errors:
+                errors[i] = " ".join(row_errors)
+                continue
+            valid_rows.append(values)
+        # Make the predictions for the valid rows of the chunk
+        if valid_rows:
+            results = iter(model.predict_values(np.array(valid_rows)))
+        for i, row in enumerate(chunk):
+            response = {"row": start + i}
+            if i in errors:
+                response["Error"] = errors[i]
+            else:
+                response["SK_ID_CURR"] = row["SK_ID_CURR"]
+                response.update(format_prediction(next(results)))
+            yield response
+
+@app.route("/api/v1/customers/score", methods=["POST"])
+def api_batch():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not ("ids" in body or "rows" in body):
+        return """Error: No ids or rows provided. <br>The request body should look like {"ids": [12456, 12457]} or {"rows": [{"SK_ID_CURR": 12456, ...}]}"""
+    ids = body.get("ids", [])
+    rows = body.get("rows", [])
+    if not isinstance(ids, list) or not isinstance(rows, list):
+        return "Error: ids and rows should be lists. Please try again !"
+    # The whole batch is scored by the same model
+    model = pick_model()
+    if model is None:
+        return unknown_model()
+
+    # Stream one JSON line per result so memory stays bounded for big batches
+    # (in the request context, so the stages are still timed for this endpoint)
+    def generate():
+        for response in score_ids(model, ids):
+            yield json.dumps(response) + "\n"
+        for response in score_rows(model, rows):
+            yield json.dumps(response) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Values taken by a swept feature: a list of values, or {"start": ..., "stop": ..., "num": ...}
+def sweep_values(model, feature, spec):
+    if isinstance(spec, dict):
+        values = np.linspace(float(spec["start"]), float(spec["stop"]), int(spec.get("num", 20)))
+        # Integer features only take integer values
+        if model.signature[feature]["type"] == "long":
+            values = np.unique(np.round(values))
+        return values.tolist()
+    if not isinstance(spec, list):
+        raise ValueError
+    return spec
+
+@app.route("/api/v1/score", methods=["POST"])
+def api_score():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("features", {}), dict):
+        return """Error: No features provided. <br>The request body should look like {"id": 12456, "features": {"AMT_CREDIT": 500000}} or {"features": {"SK_ID_CURR": 12456, ...}}"""
+    # Start from the customer of the store when an ID is given, from an empty row otherwise
+    customer_id = None
+    if "id" in body:
+        try:
+            customer_id = int(str(body["id"]))
+        except ValueError:
+            set_outcome("invalid_id")
+            return "Error: Are you sure you typed the customer ID correctly ? Please try again !"
+    model = pick_model(customer_id)
+    if model is None:
+        return unknown_model()
+    baseline = None
+    if customer_id is not None:
+        position = model.store.position(customer_id)
+        if position is None:
+            set_outcome("bad_id")
+            return "Error: Bad customer ID provided. Please try again !"
+        baseline = model.store.values[position]
+    row, errors = make_row(model, body.get("features", {}), baseline)
+    if errors:
+        return "Error: " + " ".join(errors)
+    response = {"SK_ID_CURR": int(row[model.feature_positions["SK_ID_CURR"]])}
+
+    sweep = body.get("sweep")
+    if not sweep:
+        response.update(format_prediction(model.predict_values(row[np.newaxis, :])[0]))
+        return jsonify(response)
+
+    # Sweep mode: vary one or two features over a grid and score all the points in one batch
+    if not isinstance(sweep, dict) or len(sweep) > 2:
+        return "Error: The sweep should map one or two features to their values. Please try again !"
+    axes = {}
+    for feature, spec in sweep.items():
+        if feature not in model.signature:
+            return f"Error: Unknown feature {feature} in the sweep. Please try again !"
+        try:
+            # Checked before building the values, a huge num or list would take the time and the memory first
+            size = int(spec.get("num", 20)) if isinstance(spec, dict) else len(spec) if isinstance(spec, list) else 0
+            if size > MAX_SWEEP_POINTS:
+                return f"Error: The sweep should have between 1 and {MAX_SWEEP_POINTS} points. Please try again !"
+            axes[feature] = sweep_values(model, feature, spec)
+        except (KeyError, TypeError, ValueError):
+            return f"Error: Bad values for the {feature} sweep. Please give a list or start, stop and num."
+        for value in axes[feature]:
+            errors += check_feature_values({feature: value}, model.signature)
+    if errors:
+        return "Error: " + " ".join(sorted(set(errors)))
+    n_points = int(np.prod([len(values) for values in axes.values()]))
+    if n_points == 0 or n_points > MAX_SWEEP_POINTS:
+        return f"Error: The sweep should have between 1 and {MAX_SWEEP_POINTS} points. Please try again !"
+
+    # Every combination of the swept values, on top of the row
+    grid = np.meshgrid(*[np.array(values, dtype=np.float64) for values in axes.values()], indexing="ij")
+    rows = np.repeat(row[np.newaxis, :], n_points, axis=0)
+    for feature, values in zip(axes, grid):
+        rows[:, model.feature_positions[feature]] = values.ravel()
+    probabilities = model.predict_values(rows)
+    response["Sweep"] = [
+        dict(zip(axes, (float(values.flat[i]) for values in grid)), **format_prediction(probabilities[i]))
+        for i in range(n_points)
+    ]
+    return jsonify(response)
+
+# Development server, production runs the app with gunicorn (see gunicorn.conf.py)
+if __name__ == "__main__":
+    watch_models()
+    app.run(host="0.0.0.0", port=5001)
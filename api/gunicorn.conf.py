@@ -0,0 +1,59 @@
+# Gunicorn configuration of the production server: gunicorn -c gunicorn.conf.py api:app
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# LightGBM uses all the cores for every prediction by default. With several workers
+# it only adds contention, and an OpenMP thread pool started in the master before
+# the fork can hang the workers, so use one thread unless told otherwise.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+# The workers write their metrics in this directory and /metrics adds them up. Emptied at each
+# start so the values of a previous run are not counted again.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "api_metrics"))
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+# Address and number of workers / threads per worker. With MICRO_BATCH=1 the threads of a worker
+# waiting for a score are batched together, so more threads make bigger batches.
+bind = os.environ.get("API_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("API_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("API_THREADS", 4))
+timeout = int(os.environ.get("API_TIMEOUT", 120))
+
+# By default each worker loads the models and the customers in a background thread after the
+# fork: the port opens right away and /health/ready tells when a worker can take the traffic.
+# The customers, SHAP values and neighbours are memory-mapped, so their pages are shared anyway.
+# With API_PRELOAD=1 they are loaded in the master before forking the workers, so the workers
+# share all the memory pages (copy-on-write), but the port only opens once everything is loaded.
+preload_app = os.environ.get("API_PRELOAD", "0") == "1"
+if not preload_app:
+    os.environ["BACKGROUND_LOADING"] = "1"
+    # Each loaded worker writes a file here, /health/ready waits for all of them (see startup.py)
+    os.environ["API_READY_DIR"] = os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "ready")
+    os.environ["API_WORKER_COUNT"] = str(workers)
+    os.makedirs(os.environ["API_READY_DIR"])
+
+# Move everything loaded so far out of the garbage collector's reach, so the collections
+# in the workers don't write in the shared pages (which would copy them)
+def when_ready(server):
+    gc.freeze()
+
+# Drop the live values (gauges) of a dead worker, its counters stay in the sums. Its
+# replacement loads again, so the server is not ready until it is.
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+    if os.environ.get("API_READY_DIR"):
+        try:
+            os.remove(os.path.join(os.environ["API_READY_DIR"], str(worker.pid)))
+        except FileNotFoundError:
+            pass
+
+# Each worker loads and follows the changes of the models in its own threads (threads don't
+# survive the fork)
+def post_worker_init(worker):
+    import api
+    api.start_worker()
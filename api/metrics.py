@@ -0,0 +1,109 @@
+# Metrics of the API, exposed in the Prometheus text format on /metrics:
+# - api_requests_total: requests by endpoint, outcome (success, missing_id, invalid_id, bad_id, not_ready, error) and model
+# - api_request_seconds: time to answer by endpoint and model
+# - api_stage_seconds: time of each stage of the answer (lookup, scale, trees, shap, serialize...)
+# - api_model_reloads_total: loads of new models by outcome (success, failure)
+# - api_shadow_difference: difference of the bad customer probability between the model answering
+#   and the candidate scored in its shadow
+# With gunicorn, the workers write their values in PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py)
+# and /metrics adds them up, whichever worker answers the scrape.
+# The stages of a request are also sent back in a Server-Timing header.
+
+# Import libraries
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+# Endpoints of the monitoring, not counted as requests
+UNCOUNTED_ENDPOINTS = ["metrics", "health_live", "health_ready"]
+
+# Buckets of the timings (seconds), from tens of microseconds for the lookups to seconds for the batches
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter(
+    "api_requests_total", "Requests answered", ["endpoint", "outcome", "model_version"]
+)
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "Time to answer a request", ["endpoint", "model_version"], buckets=BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "api_stage_seconds", "Time spent in a stage of a request", ["endpoint", "stage", "model_version"], buckets=BUCKETS
+)
+MODEL_RELOADS = Counter(
+    "api_model_reloads_total", "Loads of new models", ["outcome"]
+)
+SHADOW_DIFFERENCE = Histogram(
+    "api_shadow_difference", "Absolute difference of the bad customer probability with the shadow model",
+    ["model_version", "shadow_version"], buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1)
+)
+
+# Time a stage of the current request (or of the startup, model loads and batches scored in the background)
+@contextmanager
+def stage(name, model_version=""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        if has_request_context():
+            STAGE_SECONDS.labels(request.endpoint, name, model_version).observe(duration)
+            g.setdefault("stages", []).append((name, duration))
+        else:
+            STAGE_SECONDS.labels("background", name, model_version).observe(duration)
+
+# Remember the outcome of the current request when it is not a success
+def set_outcome(outcome):
+    g.outcome = outcome
+
+# Count a load of new models
+def count_reload(outcome):
+    MODEL_RELOADS.labels(outcome).inc()
+
+# Record the differences between the probabilities of the model answering and of the shadow model
+def record_shadow(model_version, shadow_version, differences):
+    histogram = SHADOW_DIFFERENCE.labels(model_version, shadow_version)
+    for difference in differences:
+        histogram.observe(float(difference))
+
+# Start the clock of a request
+def start_request():
+    g.start = time.perf_counter()
+
+# Count a request and its time once answered, and tell the client where the time went.
+# Streamed answers are timed when the server closes them, once their last line is sent.
+def finish_request(response, model_version):
+    if request.endpoint is None or request.endpoint in UNCOUNTED_ENDPOINTS or "start" not in g:
+        return response
+    outcome = g.get("outcome")
+    if outcome is None:
+        failed = not response.is_streamed and response.mimetype == "text/html" and response.get_data().startswith(b"Error")
+        outcome = "error" if failed else "success"
+    REQUESTS.labels(request.endpoint, outcome, model_version).inc()
+    histogram, start = REQUEST_SECONDS.labels(request.endpoint, model_version), g.start
+    if response.is_streamed:
+        response.call_on_close(lambda: histogram.observe(time.perf_counter() - start))
+    else:
+        histogram.observe(time.perf_counter() - start)
+    if g.get("stages"):
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={duration * 1000:.3f}" for name, duration in g.stages)
+    return response
+
+# Body and content type of the /metrics answer, summed over the workers in multiprocess mode
+def render():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
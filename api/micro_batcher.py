@@ -0,0 +1,96 @@
+# Scoring of single rows together: the concurrent requests of a worker put their row in a queue
+# and a background thread scores the rows waiting in one predict_proba call, then gives each
+# request its own probabilities. The pipeline and LightGBM have a fixed cost per call that is
+# much bigger than the cost of a row, so a batch of 16 rows costs about as much as one row.
+#
+# The batching adapts to the load: a request arriving alone is scored at once, and the thread
+# only waits for more requests (up to the window) when the last batch had several of them.
+
+# Import libraries
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Put in the queue to stop the scoring thread
+STOP = object()
+
+class MicroBatcher:
+    def __init__(self, predict, window, max_size):
+        # predict: probabilities of a 2D array of rows, window: seconds to wait for more rows
+        self.predict = predict
+        self.window = window
+        self.max_size = max_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.stopped = False
+        # Size of the last batch, to know if there is some load to wait for
+        self.last_size = 0
+
+    # Start the scoring thread, once per process (threads don't survive a fork)
+    def start(self):
+        with self.lock:
+            if self.pid != os.getpid() and not self.stopped:
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    # Probabilities of one row, scored with the rows of the concurrent requests
+    def predict_one(self, row):
+        if self.pid != os.getpid() and not self.stopped:
+            self.start()
+        future = Future()
+        with self.lock:
+            # Once stopped, the requests still running on the model score their row themselves
+            if self.stopped:
+                return self.predict(row[np.newaxis])[0]
+            self.queue.put((row, future))
+        return future.result()
+
+    # Stop the scoring thread once the rows already queued are scored, so the model it holds can be
+    # freed. The thread of a version swapped out would otherwise wait on its queue forever.
+    def stop(self):
+        with self.lock:
+            if not self.stopped:
+                self.stopped = True
+                self.queue.put(STOP)
+
+    # Rows waiting in the queue after the first one, up to the batch size
+    def collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + (self.window if self.last_size > 1 else 0)
+        while len(batch) < self.max_size:
+            try:
+                timeout = deadline - time.perf_counter()
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is STOP:
+                # Left for run, after this batch
+                self.queue.put(STOP)
+                break
+            batch.append(item)
+        return batch
+
+    # Score the batches one after the other, the requests arriving meanwhile make the next one
+    def run(self):
+        while True:
+            first = self.queue.get()
+            if first is STOP:
+                return
+            batch = self.collect(first)
+            self.last_size = len(batch)
+            try:
+                probabilities = self.predict(np.array([row for row, _ in batch]))
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            for (_, future), row_probabilities in zip(batch, probabilities):
+                future.set_result(row_probabilities)
@@ -0,0 +1,378 @@
+# Models served by the API, reloaded without restarting it. Each model (ModelVersion) holds
+# everything computed for it: pipeline, signature, compiled trees, score table, SHAP store and
+# neighbours index. The registry keeps at most two of them in memory:
+# - the active model, answering the requests
+# - an optional candidate, scored in the shadow of the active one or answering a share of the
+#   customers (A/B test), before being promoted
+# A new model is loaded and checked next to the ones serving, then swapped in with a single
+# assignment: the requests already running keep the model they started with.
+#
+# The wanted models are written in a state file shared by the gunicorn workers (see the admin
+# endpoints of api.py), each worker checks it and the model directories every few seconds.
+
+# Import libraries
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from common.feature_store import open_customer_store, data_checksum
+from common.mlmodel import read_model_uuid
+from common.native_model import NativePipeline, load_model
+from common.shap_store import open_shap_store
+from common.neighbours import open_neighbour_index
+from common.customer_search import CustomerIndex
+from score_cache import load_score_cache
+from tree_engine import TreeEngine
+from micro_batcher import MicroBatcher
+from metrics import count_reload, stage
+
+# Score the whole population once at load (SCORE_CACHE=1) and keep the table
+# next to the model to reuse it at the next load (SCORE_CACHE_PERSIST=1)
+SCORE_CACHE = os.environ.get("SCORE_CACHE", "0") == "1"
+SCORE_CACHE_PERSIST = os.environ.get("SCORE_CACHE_PERSIST", "0") == "1"
+# Weighting of the features in the similar customers index: scaled features only, or scaled
+# features weighted by their global SHAP importance (NEIGHBOURS_WEIGHTING=shap)
+NEIGHBOURS_WEIGHTING = os.environ.get("NEIGHBOURS_WEIGHTING", "scaled")
+# Scoring engine: the sklearn pipeline, or the compiled trees of tree_engine.py (INFERENCE_ENGINE=trees)
+INFERENCE_ENGINE = os.environ.get("INFERENCE_ENGINE", "pipeline")
+# File the model is loaded from: its native export when there is one for its version (auto), only
+# the native export (native) or only the pickled pipeline (pickle), see common/native_model.py
+MODEL_ARTIFACT = os.environ.get("MODEL_ARTIFACT", "auto")
+# Score the single rows of the concurrent requests together (MICRO_BATCH=1, see micro_batcher.py),
+# waiting up to MICRO_BATCH_WINDOW_MS for more requests under load, MICRO_BATCH_SIZE rows at most
+MICRO_BATCH = os.environ.get("MICRO_BATCH", "0") == "1"
+MICRO_BATCH_WINDOW_MS = float(os.environ.get("MICRO_BATCH_WINDOW_MS", 2))
+MICRO_BATCH_SIZE = int(os.environ.get("MICRO_BATCH_SIZE", 32))
+# Ways of serving the candidate: not at all, scored after the active model without answering
+# (shadow), or answering a share of the customers (ab)
+ROUTINGS = ["active", "shadow", "ab"]
+# Number of customers scored by the checks of a new model
+CHECK_ROWS = 10
+
+logger = logging.getLogger(__name__)
+
+# One model and what is computed for it, on the customers of the data file
+class ModelVersion:
+    def __init__(self, model_dir, data_path, store=None):
+        self.model_dir = model_dir
+        self.uuid = read_model_uuid(model_dir)
+        # Seconds of each step of the loading, in order
+        self.load_seconds = {}
+        with self.timed("model"):
+            # Pipeline, columns expected by the model in the order it was fitted on, and their types
+            self.pipeline, self.features, self.signature = load_model(model_dir, MODEL_ARTIFACT)
+            self.native = isinstance(self.pipeline, NativePipeline)
+            self.feature_positions = {feature: i for i, feature in enumerate(self.features)}
+            # Compile the trees with the scaler folded in, to score raw rows without the pipeline.
+            # Always for a native export, which scores without importing LightGBM this way.
+            self.tree_engine = TreeEngine(self.pipeline) if INFERENCE_ENGINE == "trees" or self.native else None
+            self.batcher = MicroBatcher(self.score_values, MICRO_BATCH_WINDOW_MS / 1000, MICRO_BATCH_SIZE) if MICRO_BATCH else None
+        with self.timed("customers"):
+            # The customers are shared with the model serving when the columns are the same
+            if store is None or store.features != self.features:
+                store = open_customer_store(data_path, self.features)
+            self.store = store
+            # Sorted IDs of the customers for the search
+            self.customer_index = CustomerIndex(store.ids)
+        with self.timed("check"):
+            self.check()
+        # Precompute the scores of the population, the table is only valid for this model and this data file
+        self.score_cache = None
+        if SCORE_CACHE:
+            with self.timed("score_cache"):
+                cache_path = os.path.join(model_dir, f"score_cache_{self.uuid}.npz") if SCORE_CACHE_PERSIST else None
+                self.score_cache = load_score_cache(self.score_values, store, self.uuid, data_checksum(data_path), cache_path)
+        with self.timed("shap_store"):
+            # SHAP values of the population saved on disk, only the customers not done yet are computed
+            self.shap_store = open_shap_store(model_dir, data_path, self.pipeline, store)
+        with self.timed("neighbours"):
+            # Nearest neighbours index of the population, saved next to the model
+            self.neighbour_index = open_neighbour_index(
+                model_dir, data_path, self.pipeline, store, self.shap_store if NEIGHBOURS_WEIGHTING == "shap" else None
+            )
+        with self.timed("warm_up"):
+            self.warm_up()
+        self.loaded_at = time.time()
+
+    # Time a step of the loading
+    @contextmanager
+    def timed(self, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.load_seconds[step] = round(time.perf_counter() - start, 3)
+
+    # Run each kind of computation of the requests once, so the first ones don't pay the first
+    # call costs: imports, SHAP explainer, scan of the SHAP store for the global importance
+    def warm_up(self):
+        if len(self.store) == 0:
+            return
+        values = self.store.values[:1]
+        self.score_values(values)
+        self.neighbour_index.query(values[0], 1, exclude=0)
+        self.shap_store.global_importance()
+        # The explainer is only needed for the customers whose SHAP values are not stored yet
+        if self.shap_store.completion() < 1:
+            with self.shap_store.lock:
+                self.shap_store.explainer.explain(self.store.rows([0]))
+
+    # Score a few customers and check the model gives probabilities for the two classes
+    def check(self):
+        probabilities = np.asarray(self.score_values(self.store.values[:CHECK_ROWS]))
+        if probabilities.shape != (min(CHECK_ROWS, len(self.store.ids)), 2):
+            raise ValueError(f"The model of {self.model_dir} should give two probabilities per customer")
+        if not np.all(np.isfinite(probabilities)) or not np.allclose(probabilities.sum(axis=1), 1):
+            raise ValueError(f"The model of {self.model_dir} gives probabilities that don't add up to 1")
+
+    # Probabilities of raw feature rows (a 2D array in model order). A single row is scored
+    # with the rows of the concurrent requests when micro-batching is on.
+    def predict_values(self, values):
+        if self.batcher is not None and len(values) == 1:
+            with stage("batch", self.uuid):
+                return self.batcher.predict_one(values[0])[np.newaxis]
+        return self.score_values(values)
+
+    # Probabilities of raw feature rows, scored right away
+    def score_values(self, values):
+        if self.tree_engine is not None:
+            with stage("trees", self.uuid):
+                return self.tree_engine.predict_proba(values)
+        # Same steps as pipeline.predict_proba, timed one by one
+        with stage("scale", self.uuid):
+            scaled = self.pipeline.named_steps["scaler"].transform(pd.DataFrame(values, columns=self.store.columns))
+        with stage("trees", self.uuid):
+            return self.pipeline.named_steps["model"].predict_proba(scaled)
+
+    # Probabilities of the customers at some positions of the store,
+    # read from the score table when there is one, computed otherwise
+    def predict_positions(self, positions):
+        if self.score_cache is not None:
+            with stage("score_cache", self.uuid):
+                return self.score_cache.probabilities[positions]
+        return self.predict_values(self.store.values[positions])
+
+    # Stop the scoring thread of the model once it is swapped out
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.stop()
+
+    # Description of the model for the admin endpoints
+    def describe(self):
+        return {
+            "Model version": self.uuid,
+            "Model directory": self.model_dir,
+            "Model artifact": "native" if self.native else "pickle",
+            "Load seconds": self.load_seconds,
+            "Loaded at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+        }
+
+# What identifies the files of a model directory: a change means a model to load
+def model_files_key(model_dir):
+    return tuple(
+        (name, os.stat(os.path.join(model_dir, name)).st_mtime_ns) for name in ["MLmodel", "model.pkl"]
+    ) + (model_dir, read_model_uuid(model_dir))
+
+# The active model and the optional candidate, with the way the candidate is served
+class ModelRegistry:
+    def __init__(self, data_path, model_dir, state_path, candidate_dir=None, routing="active", candidate_share=0.0):
+        self.data_path = data_path
+        self.state_path = state_path
+        # Default state, until an admin call writes the state file
+        self.default_state = {
+            "active": model_dir,
+            "candidate": candidate_dir,
+            "routing": routing,
+            "candidate_share": candidate_share,
+        }
+        # Reentrant: update_state checks the new state while holding it
+        self.lock = threading.RLock()
+        self.models = (None, None)
+        self.state = None
+        self.loaded_keys = None
+        self.failed_keys = None
+        self.failed_candidate_key = None
+        self.last_error = None
+        self.check()
+        if self.models[0] is None:
+            raise RuntimeError(f"No model could be loaded: {self.last_error}")
+
+    @property
+    def active(self):
+        return self.models[0]
+
+    @property
+    def candidate(self):
+        return self.models[1]
+
+    # Resident model of a version, None if it is not in memory
+    def get(self, model_version):
+        for model in self.models:
+            if model is not None and model.uuid == model_version:
+                return model
+        return None
+
+    # Model answering a customer: the candidate for its share of the customers in A/B mode,
+    # always the same one for a customer, the active model otherwise
+    def pick(self, customer_id=None):
+        active, candidate = self.models
+        state = self.state
+        if candidate is not None and customer_id is not None and state["routing"] == "ab":
+            if (customer_id * 2654435761 % 2 ** 32) / 2 ** 32 < state["candidate_share"]:
+                return candidate
+        return active
+
+    # Candidate to score in the shadow of a model answering, None if there is nothing to compare
+    def shadow_of(self, model):
+        active, candidate = self.models
+        if self.state["routing"] == "shadow" and candidate is not None and model is active:
+            return candidate
+        return None
+
+    # Wanted state: the state file when there is one, the default state otherwise
+    def read_state(self):
+        state = dict(self.default_state)
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as file:
+                state.update(json.load(file))
+        return state
+
+    # Apply a new wanted state in this worker, then write it for the other ones. The state is
+    # only written when its models load and pass the checks. Returns the error, None if all went well.
+    def update_state(self, **changes):
+        with self.lock:
+            state = dict(self.state)
+            # The candidate becomes the active model, the active model stays as candidate to roll back
+            if changes.pop("promote", False) and state["candidate"]:
+                state["active"], state["candidate"] = state["candidate"], state["active"]
+            state.update(changes)
+            error = self.check(state)
+            if error is not None:
+                return error
+            # Write in a temporary file first so a worker never reads a partial state
+            directory = os.path.dirname(os.path.abspath(self.state_path))
+            with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".json", delete=False) as file:
+                json.dump(state, file)
+            os.chmod(file.name, 0o644)
+            os.replace(file.name, self.state_path)
+            return None
+
+    # Load the models of the wanted state that are not in memory yet, check them and swap them in.
+    # The models serving stay in place when the active one fails. A candidate that fails is an
+    # error for a new state (admin call), and is dropped for the state read from the file, so a
+    # candidate deleted since never stops the active model from serving. Returns the error,
+    # None if all went well.
+    def check(self, state=None):
+        with self.lock:
+            new_state = state is not None
+            try:
+                state = self.read_state() if state is None else state
+                if not state.get("active"):
+                    raise ValueError("The active model directory is required")
+                if state["routing"] not in ROUTINGS:
+                    raise ValueError(f"Unknown routing {state['routing']}, it should be one of {', '.join(ROUTINGS)}")
+                state["candidate_share"] = float(state["candidate_share"])
+                if not 0 <= state["candidate_share"] <= 1:
+                    raise ValueError("The candidate share should be between 0 and 1")
+                active_key = model_files_key(state["active"])
+            except Exception as error:
+                self.last_error = str(error)
+                return self.last_error
+            candidate_key, candidate_error = None, None
+            if state.get("candidate"):
+                try:
+                    candidate_key = model_files_key(state["candidate"])
+                except Exception as error:
+                    if new_state:
+                        self.last_error = str(error)
+                        return self.last_error
+                    candidate_error = f"Candidate {state['candidate']} dropped: {error}"
+                # A candidate that failed is only tried again once its files change
+                if candidate_key is not None and candidate_key == self.failed_candidate_key and not new_state:
+                    candidate_key, candidate_error = None, self.last_error
+            keys = (active_key, candidate_key)
+            if keys == self.loaded_keys:
+                self.state = state
+                if candidate_error is not None:
+                    self.last_error = candidate_error
+                return None
+            # A model that failed is only tried again once its files change
+            if keys == self.failed_keys:
+                return self.last_error
+            try:
+                active = self.load(active_key)
+            except Exception as error:
+                return self.failed(keys, state, error)
+            candidate = None
+            try:
+                candidate = self.load(candidate_key)
+            except Exception as error:
+                if new_state:
+                    return self.failed(keys, state, error)
+                logger.exception("Could not load the candidate of %s, serving the active model alone", state)
+                self.failed_candidate_key = candidate_key
+                candidate_error = f"Candidate {state['candidate']} dropped: {error}"
+                keys = (active_key, None)
+            # Swap the models and their routing together
+            previous = self.models
+            self.models, self.state = (active, candidate), state
+            # The models no longer served are freed, the requests still running on them finish
+            for model in previous:
+                if model is not None and model not in self.models:
+                    model.close()
+            self.loaded_keys = keys
+            self.failed_keys = None
+            self.last_error = candidate_error
+            count_reload("success")
+            logger.info("Serving model %s (candidate %s, routing %s)",
+                        active.uuid, candidate.uuid if candidate else None, state["routing"])
+            return None
+
+    # Remember the models that failed to load, returns the error
+    def failed(self, keys, state, error):
+        logger.exception("Could not load the models of %s", state)
+        self.failed_keys = keys
+        self.last_error = str(error)
+        count_reload("failure")
+        return self.last_error
+
+    # Model of some files, reused when it is already in memory
+    def load(self, key):
+        if key is None:
+            return None
+        model_dir, model_version = key[-2:]
+        for model in self.models:
+            if model is not None and model.uuid == model_version and model.model_dir == model_dir:
+                return model
+        store = self.active.store if self.active is not None else None
+        with stage("load_model", model_version):
+            return ModelVersion(model_dir, self.data_path, store)
+
+    # Check the state and the model files every few seconds in a background thread.
+    # With gunicorn, each worker starts its own (see gunicorn.conf.py).
+    def watch(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.check()
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    # Description of the models and of the routing for the admin endpoints
+    def describe(self):
+        active, candidate = self.models
+        return {
+            "Active model": active.describe(),
+            "Candidate model": candidate.describe() if candidate is not None else None,
+            "Routing": self.state["routing"],
+            "Candidate share": self.state["candidate_share"],
+            "Last error": self.last_error,
+        }
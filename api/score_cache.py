@@ -0,0 +1,58 @@
+# Import libraries
+import os
+import tempfile
+
+import numpy as np
+
+# Number of customers scored together when the table is built
+BUILD_CHUNK_SIZE = 10000
+
+# Table of the scores of every customer of the store, computed once for a model and a data file.
+# Looking a score up replaces a run of the whole pipeline for the customers of the test population.
+class ScoreCache:
+    def __init__(self, model_uuid, data_checksum, ids, probabilities):
+        self.model_uuid = model_uuid
+        self.data_checksum = data_checksum
+        self.ids = ids
+        self.probabilities = probabilities
+
+    # Whether the table was computed with this model and this data file
+    def is_valid_for(self, model_uuid, data_checksum):
+        return self.model_uuid == model_uuid and self.data_checksum == data_checksum
+
+    # Score the whole store with vectorized batches (predict takes a 2D array of rows in model order)
+    @classmethod
+    def build(cls, predict, store, model_uuid, data_checksum):
+        probabilities = np.empty((len(store), 2))
+        for start in range(0, len(store), BUILD_CHUNK_SIZE):
+            chunk = store.values[start:start + BUILD_CHUNK_SIZE]
+            probabilities[start:start + len(chunk)] = predict(chunk)
+        return cls(model_uuid, data_checksum, store.ids, probabilities)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as file:
+            return cls(str(file["model_uuid"]), str(file["data_checksum"]), file["ids"], file["probabilities"])
+
+    # Write the table in a temporary file first so a reader never sees a partial file
+    def save(self, path):
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".npz", delete=False) as file:
+            np.savez(
+                file,
+                model_uuid=self.model_uuid,
+                data_checksum=self.data_checksum,
+                ids=self.ids,
+                probabilities=self.probabilities
+            )
+        os.replace(file.name, path)
+
+# Load the persisted table if it still matches the model and the data, build it otherwise
+def load_score_cache(predict, store, model_uuid, data_checksum, path=None):
+    if path is not None and os.path.exists(path):
+        cache = ScoreCache.load(path)
+        if cache.is_valid_for(model_uuid, data_checksum) and np.array_equal(cache.ids, store.ids):
+            return cache
+    cache = ScoreCache.build(predict, store, model_uuid, data_checksum)
+    if path is not None:
+        cache.save(path)
+    return cache
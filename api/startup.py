@@ -0,0 +1,84 @@
+# Loading of the API in stages. Under gunicorn each worker loads in a background thread and
+# answers the health checks meanwhile, so the port opens right away and the orchestrator sends
+# the traffic once /health/ready says everything is loaded and warmed up.
+#
+# The orchestrator's health check reaches one worker at random, so each loaded worker writes a
+# file in a directory shared by the workers, and /health/ready only says ready once all of them
+# have: otherwise the container could be healthy while some workers still answer 503.
+
+# Import libraries
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Directory of the files of the loaded workers, and number of workers to wait for
+# (set by gunicorn.conf.py). Without it the process is ready on its own.
+READY_DIR = os.environ.get("API_READY_DIR", "")
+WORKERS = int(os.environ.get("API_WORKER_COUNT", 1))
+
+# Stages of the loading of a process, with their time, and whether it is over
+class Startup:
+    def __init__(self, ready_dir=READY_DIR, workers=WORKERS):
+        self.ready_dir = ready_dir
+        self.workers = workers
+        self.started_at = time.time()
+        # Seconds of each stage in order, None for the stage running
+        self.stages = {}
+        self.ready = False
+        self.error = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    # Time a stage of the loading
+    @contextmanager
+    def stage(self, name):
+        self.stages[name] = None
+        start = time.perf_counter()
+        yield
+        self.stages[name] = round(time.perf_counter() - start, 3)
+
+    # Run the loading (a function of the startup) in this thread
+    def run(self, load):
+        try:
+            load(self)
+            self.ready = True
+            if self.ready_dir:
+                # Tell the other workers this one is loaded
+                open(os.path.join(self.ready_dir, str(os.getpid())), "w").close()
+        except Exception as error:
+            logger.exception("The API could not be loaded")
+            self.error = f"{type(error).__name__}: {error}"
+
+    # Run the loading in a background thread, once
+    def start(self, load):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, args=(load,), daemon=True)
+                self.thread.start()
+
+    # Number of workers loaded, this process alone without a shared directory
+    def workers_ready(self):
+        if not self.ready_dir:
+            return int(self.ready)
+        return len(os.listdir(self.ready_dir))
+
+    # Whether this process and every other worker are loaded
+    def all_ready(self):
+        return self.ready and self.workers_ready() >= self.workers
+
+    # State of the loading for the health endpoints
+    def describe(self):
+        return {
+            "Ready": self.all_ready(),
+            "Workers ready": f"{self.workers_ready()}/{self.workers}",
+            "Error": self.error,
+            "Seconds since start": round(time.time() - self.started_at, 3),
+            "Stages": {
+                name: seconds if seconds is not None else ("failed" if self.error else "running")
+                for name, seconds in list(self.stages.items())
+            },
+        }
@@ -0,0 +1,99 @@
+# Import libraries
+import numpy as np
+
+# Rows walked through the trees together, bigger chunks don't fit in the CPU caches
+CHUNK_SIZE = 1024
+
+# Fast scoring engine for the pipeline (StandardScaler + LGBMClassifier).
+# The scaler is folded into the split thresholds of the trees, and the trees are flattened
+# into numpy arrays, so scoring raw feature rows is a vectorized walk through the arrays of
+# all the trees at once, without the sklearn / imblearn / LightGBM wrappers.
+class TreeEngine:
+    def __init__(self, pipeline):
+        scaler = pipeline.named_steps["scaler"]
+        model = pipeline.named_steps["model"]
+        # The native models (common/native_model.py) read their trees without LightGBM
+        dump = model.dump_model() if hasattr(model, "dump_model") else model.booster_.dump_model()
+        if not dump["objective"].startswith("binary"):
+            raise ValueError(f"Only binary models can be compiled, not {dump['objective']}")
+        self.sigmoid = float(dump["objective"].split("sigmoid:")[1]) if "sigmoid:" in dump["objective"] else 1.0
+        n_features = dump["max_feature_idx"] + 1
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+
+        # One entry per node of every tree, leaves point to themselves
+        self.feature, self.threshold, self.nan_left = [], [], []
+        self.left, self.right, self.value = [], [], []
+        roots, depths = [], []
+        for tree in dump["tree_info"]:
+            roots.append(self.add_node(tree["tree_structure"], mean, scale))
+            depths.append(self.depth(tree["tree_structure"]))
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max(depths)
+        self.feature = np.array(self.feature, dtype=np.intp)
+        self.threshold = np.array(self.threshold, dtype=np.float64)
+        self.nan_right = ~np.array(self.nan_left, dtype=bool)
+        self.left = np.array(self.left, dtype=np.intp)
+        # Distance from the left child to the right child
+        self.step = np.array(self.right, dtype=np.intp) - self.left
+        self.value = np.array(self.value, dtype=np.float64)
+
+    # Add a node (and its children) to the arrays, returns its index
+    def add_node(self, node, mean, scale):
+        index = len(self.feature)
+        self.feature.append(0)
+        self.threshold.append(0.0)
+        self.nan_left.append(False)
+        self.left.append(index)
+        self.right.append(index)
+        self.value.append(node.get("leaf_value", 0.0))
+        if "split_index" not in node:
+            return index
+        if node["decision_type"] != "<=" or node["missing_type"] not in ("None", "NaN"):
+            raise ValueError(f"Unsupported split: {node['decision_type']} with missing type {node['missing_type']}")
+        feature = node["split_feature"]
+        self.feature[index] = feature
+        # x_scaled <= t  <=>  x <= t * scale + mean
+        self.threshold[index] = node["threshold"] * scale[feature] + mean[feature]
+        if node["missing_type"] == "NaN":
+            self.nan_left[index] = node["default_left"]
+        else:
+            # LightGBM replaces missing values by 0 (in the scaled space) for these splits
+            self.nan_left[index] = 0.0 <= node["threshold"]
+        self.left[index] = self.add_node(node["left_child"], mean, scale)
+        self.right[index] = self.add_node(node["right_child"], mean, scale)
+        return index
+
+    # Depth of a tree (number of splits from the root to the deepest leaf)
+    def depth(self, node):
+        if "split_index" not in node:
+            return 0
+        return 1 + max(self.depth(node["left_child"]), self.depth(node["right_child"]))
+
+    # Raw scores (log-odds) of rows of raw features in model order
+    def predict_raw(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[np.newaxis, :]
+        if len(values) > CHUNK_SIZE:
+            return np.concatenate([
+                self.predict_raw(values[start:start + CHUNK_SIZE])
+                for start in range(0, len(values), CHUNK_SIZE)
+            ])
+        values = np.ascontiguousarray(values)
+        # Index of the first feature of every row in the flattened values
+        offsets = (np.arange(len(values)) * values.shape[1])[:, np.newaxis]
+        flat_values = values.ravel()
+        # Current node of every row in every tree
+        nodes = np.broadcast_to(self.roots, (len(values), len(self.roots)))
+        for _ in range(self.max_depth):
+            x = flat_values[offsets + self.feature[nodes]]
+            # x <= threshold goes left, a missing value goes to its default side
+            go_right = (x > self.threshold[nodes]) | (np.isnan(x) & self.nan_right[nodes])
+            nodes = self.left[nodes] + go_right * self.step[nodes]
+        return self.value[nodes].sum(axis=1)
+
+    # Probabilities of the two classes, like predict_proba of the pipeline
+    def predict_proba(self, values):
+        probabilities = 1 / (1 + np.exp(-self.sigmoid * self.predict_raw(values)))
+        return np.column_stack([1 - probabilities, probabilities])
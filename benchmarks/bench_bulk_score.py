@@ -0,0 +1,67 @@
+# Benchmark of the bulk scorer (common/bulk_score.py): customers scored per second with one
+# worker up to all the cores, and peak memory of the main process and of the workers, which
+# should not grow with the size of the input.
+# Run from the repository root: python benchmarks/bench_bulk_score.py --rows 30000
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from common.synthetic_data import MODEL_DIR, make_synthetic_data
+
+# Customers generated at once when writing the input
+WRITE_CHUNK_SIZE = 5000
+
+# Script scoring a file in a new process, printing the peak memory of the process and of its workers
+SCORE_SCRIPT = """
+import resource, sys, warnings
+warnings.simplefilter("ignore")
+from common.bulk_score import bulk_score
+bulk_score(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]), int(sys.argv[6]))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+"""
+
+# Synthetic CSV of n_rows customers, written by chunks
+def write_input(path, n_rows):
+    for start in range(0, n_rows, WRITE_CHUNK_SIZE):
+        data = make_synthetic_data(MODEL_DIR, min(WRITE_CHUNK_SIZE, n_rows - start), seed=start)
+        data["SK_ID_CURR"] += start * 7
+        data.to_csv(path, mode="a", header=start == 0, index=False)
+
+# Customers per second and peak memory (MB) of the main process and of a worker
+def run(input_path, output_path, workers, reasons, chunk_size):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", SCORE_SCRIPT, input_path, output_path, MODEL_DIR, str(reasons), str(workers), str(chunk_size)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.split()
+    elapsed = time.perf_counter() - start
+    return elapsed, int(output[-2]) / 1024, int(output[-1]) / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=30000, help="number of customers of the biggest input")
+    parser.add_argument("--reasons", type=int, default=0, help="number of SHAP reasons per customer")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="number of customers of a chunk")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'rows':>8} {'workers':>8} {'customers/s':>12} {'main RSS (MB)':>14} {'worker RSS (MB)':>16}")
+        sizes = [args.rows // 4, args.rows]
+        for n_rows in sizes:
+            input_path = os.path.join(directory, f"customers_{n_rows}.csv")
+            write_input(input_path, n_rows)
+            # Memory with one worker for a small and a big input, then the scaling on the big one
+            worker_counts = [1] if n_rows != args.rows else sorted({1, 2, 4, os.cpu_count()})
+            for workers in worker_counts:
+                elapsed, main_rss, worker_rss = run(
+                    input_path, os.path.join(directory, "scores.parquet"), workers, args.reasons, args.chunk_size
+                )
+                print(f"{n_rows:>8} {workers:>8} {n_rows / elapsed:>12.0f} {main_rss:>14.0f} {worker_rss:>16.0f}")
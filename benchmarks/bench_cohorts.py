@@ -0,0 +1,63 @@
+# Benchmark of the cohort engine (common/cohorts.py) against boolean masks on the dataframe:
+# time to select a cohort of several filters and to rank a customer in it, as the population grows.
+# The population is grown by resampling the customers of the cleaned data.
+# Run from the repository root: python benchmarks/bench_cohorts.py
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from common.customer_store import CustomerStore
+from common.feature_store import open_customer_store
+from common.cohorts import CohortEngine, COHORT_FEATURES
+
+DATA_PATH = "/data/cleaned_data/test_data_cleaned.csv"
+# Number of customers whose cohort is measured for each population size
+N_CUSTOMERS = 20
+RANKED_FEATURE = "AMT_CREDIT"
+
+# Median time of a call in milliseconds
+def measure(function, arguments):
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+# Cohort and rank with boolean masks over the dataframe, like a filter written on the dataframe would do
+def mask_rank(engine, data, customer_id):
+    mask = np.ones(len(data), dtype=bool)
+    for feature, level in engine.customer_filters(customer_id, COHORT_FEATURES).items():
+        mask &= engine.level_codes(feature, data[feature].to_numpy()) == level
+    values = data[RANKED_FEATURE].to_numpy()[mask]
+    values = values[~np.isnan(values)]
+    value = engine.store.value(customer_id, RANKED_FEATURE)
+    return 100 * ((values < value).sum() + (values == value).sum() / 2) / len(values)
+
+# Cohort and rank with the bitmaps and the presorted column
+def engine_rank(engine, customer_id):
+    filters = engine.customer_filters(customer_id, COHORT_FEATURES)
+    return engine.percentile_rank(filters, RANKED_FEATURE, engine.store.value(customer_id, RANKED_FEATURE))
+
+if __name__ == "__main__":
+    population = open_customer_store(DATA_PATH)
+    rng = np.random.default_rng(0)
+    print(f"{'customers':>10} {'build (ms)':>11} {'masks (ms)':>11} {'bitmaps (ms)':>13}")
+    for n_customers in [10000, 100000, 300000]:
+        values = population.values[rng.integers(0, len(population), n_customers)]
+        values[:, population.features.index("SK_ID_CURR")] = np.arange(n_customers)
+        store = CustomerStore(values, population.features)
+
+        start = time.perf_counter()
+        engine = CohortEngine(store)
+        engine.sorted_column(RANKED_FEATURE)
+        build_time = (time.perf_counter() - start) * 1000
+
+        customer_ids = rng.integers(0, n_customers, N_CUSTOMERS).tolist()
+        mask_time = measure(lambda customer_id: mask_rank(engine, store.data, customer_id), customer_ids)
+        engine_time = measure(lambda customer_id: engine_rank(engine, customer_id), customer_ids)
+        print(f"{n_customers:>10} {build_time:>11.1f} {mask_time:>11.2f} {engine_time:>13.2f}")
@@ -0,0 +1,63 @@
+# Benchmark of the cold start of the API: time to import api.py (model, customers and precomputed
+# stores loaded), resident memory after it, and the heavy libraries imported, with the model
+# loaded from the pickled pipeline or from its native export (common/native_model.py). Each
+# start is a new process, on synthetic customers whose stores were built by a first start.
+# Run from the repository root: python benchmarks/bench_cold_start.py
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from common.native_model import export_native_model
+from common.synthetic_data import write_synthetic_data
+
+# Number of starts of each artifact
+N_STARTS = 5
+# Libraries not needed to serve the scores
+HEAVY_MODULES = ["sklearn", "imblearn", "lightgbm", "shap"]
+
+# Code of a start: import the API, then print the time, the memory and the heavy modules imported
+START = f"""
+import json, os, sys, time
+start = time.perf_counter()
+sys.path[:0] = [{str(ROOT)!r}, {str(ROOT / "api")!r}]
+import api
+elapsed = time.perf_counter() - start
+with open("/proc/self/statm") as file:
+    rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+print(json.dumps([elapsed, rss, [name for name in {HEAVY_MODULES!r} if name in sys.modules]]))
+"""
+
+# Time (s), resident memory (MB) and heavy modules of a start of the API in a new process
+def start_api(environment):
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", START], env=environment, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000, help="number of synthetic customers")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_dir, data_path = write_synthetic_data(directory, args.rows)
+        export_native_model(model_dir)
+        environment = dict(
+            os.environ, MODEL_DIR=model_dir, DATA_PATH=data_path, MODEL_WATCH_INTERVAL="0", OMP_NUM_THREADS="1"
+        )
+        # First start: builds the neighbours index and the SHAP store for the next ones
+        start_api(environment)
+        print(f"{'artifact':>8} {'start p50 (s)':>14} {'RSS (MB)':>9}  heavy modules")
+        for artifact in ["pickle", "native"]:
+            starts = [start_api(dict(environment, MODEL_ARTIFACT=artifact)) for _ in range(N_STARTS)]
+            elapsed = np.median([start[0] for start in starts])
+            rss = np.median([start[1] for start in starts])
+            print(f"{artifact:>8} {elapsed:>14.2f} {rss:>9.0f}  {', '.join(starts[-1][2]) or '-'}")
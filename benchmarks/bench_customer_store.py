@@ -0,0 +1,48 @@
+# Microbenchmark of the customer lookup: full dataframe scan vs CustomerStore.
+# Run from the repository root: python benchmarks/bench_customer_store.py
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.customer_store import CustomerStore
+
+# Number of columns of the cleaned data and number of lookups per measure
+N_COLUMNS = 795
+N_LOOKUPS = 200
+
+# Build a fake dataset with the same layout as the cleaned data (int flags and float amounts)
+def make_data(n_rows, rng):
+    columns = {"SK_ID_CURR": rng.permutation(n_rows) + 100000}
+    for i in range(1, N_COLUMNS):
+        if i % 2:
+            columns[f"F{i}"] = rng.integers(0, 3, n_rows)
+        else:
+            columns[f"F{i}"] = rng.normal(size=n_rows)
+    return pd.DataFrame(columns)
+
+# Median time of one lookup in microseconds
+def measure(lookup, ids):
+    timings = []
+    for customer_id in ids:
+        start = time.perf_counter()
+        lookup(customer_id)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1e6
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} {'scan (us)':>12} {'index (us)':>12} {'row (us)':>12} {'build (ms)':>12}")
+    for n_rows in [1_000, 10_000, 50_000, 100_000]:
+        data = make_data(n_rows, rng)
+        ids = rng.choice(data["SK_ID_CURR"].to_numpy(), N_LOOKUPS)
+        start = time.perf_counter()
+        store = CustomerStore.from_frame(data)
+        build_time = (time.perf_counter() - start) * 1e3
+        scan_time = measure(lambda customer_id: data.loc[data["SK_ID_CURR"]==customer_id, :], ids)
+        index_time = measure(store.position, ids)
+        row_time = measure(store.row, ids)
+        print(f"{n_rows:>8} {scan_time:>12.1f} {index_time:>12.2f} {row_time:>12.1f} {build_time:>12.1f}")
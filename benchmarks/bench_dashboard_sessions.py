@@ -0,0 +1,79 @@
+# Benchmark of the memory and of the rerun time of the dashboard as sessions are added: each
+# session loads the page, picks a customer and asks for its score, then every session runs
+# again (like after a widget change). The sessions are Streamlit AppTests in this process, so
+# they share the cache_resource objects like the sessions of a dashboard server. The API is
+# served in a thread on synthetic customers.
+# Run from the repository root: python benchmarks/bench_dashboard_sessions.py
+import argparse
+import gc
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "api"))
+sys.path.insert(0, str(ROOT / "dashboard"))
+from common.synthetic_data import write_synthetic_data
+
+# Numbers of sessions open at once
+SESSIONS = [1, 5, 10, 20]
+
+# Resident memory of this process in MB (peak memory where /proc is missing), after a collection
+def rss_mb():
+    gc.collect()
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+# New session showing the score of a customer
+def open_session(dashboard_path):
+    from streamlit.testing.v1 import AppTest
+    session = AppTest.from_file(dashboard_path, default_timeout=120)
+    session.run()
+    picker = [selectbox for selectbox in session.selectbox if selectbox.label == "Pick a customer"][0]
+    picker.select(picker.options[1]).run()
+    [button for button in session.button if button.label == "Get score for this customer"][0].click().run()
+    return session
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000, help="number of synthetic customers")
+    parser.add_argument("--dashboard", default=str(ROOT / "dashboard" / "dashboard.py"), help="dashboard script")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_dir, data_path = write_synthetic_data(directory, args.rows)
+        os.environ.update(MODEL_DIR=model_dir, DATA_PATH=data_path, MODEL_WATCH_INTERVAL="0")
+        import api
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", 0, api.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["API_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+        print(f"{'sessions':>8} {'RSS (MB)':>9} {'rerun p50 (ms)':>15} {'rerun p95 (ms)':>15}")
+        print(f"{0:>8} {rss_mb():>9.0f}")
+        sessions = []
+        for n_sessions in SESSIONS:
+            while len(sessions) < n_sessions:
+                sessions.append(open_session(args.dashboard))
+            timings = []
+            for session in sessions:
+                start = time.perf_counter()
+                session.run()
+                timings.append(time.perf_counter() - start)
+            timings = np.array(timings) * 1000
+            print(f"{n_sessions:>8} {rss_mb():>9.0f} {np.percentile(timings, 50):>15.1f} {np.percentile(timings, 95):>15.1f}")
+        server.shutdown()
@@ -0,0 +1,72 @@
+# Benchmark of the micro-batching of single rows (api/micro_batcher.py): throughput and latency
+# of concurrent single-row requests, each one scored alone or batched with different windows.
+# Run from the repository root: python benchmarks/bench_micro_batching.py
+import os
+import pickle
+import sys
+import threading
+import time
+import warnings
+from pathlib import Path
+
+# One OpenMP thread like the gunicorn workers (see api/gunicorn.conf.py)
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "api"))
+from micro_batcher import MicroBatcher
+
+# Number of requests of each client thread
+N_REQUESTS = 100
+# Concurrent clients, and batching windows in milliseconds (None: every row scored alone)
+CONCURRENCIES = [1, 4, 16, 64]
+WINDOWS = [None, 0, 1, 2, 5]
+MAX_BATCH_SIZE = 64
+
+# Requests per second and latencies (ms) of clients scoring single rows at the same time
+def run_clients(predict_one, rows, n_clients):
+    latencies = [[] for _ in range(n_clients)]
+
+    def client(i):
+        for j in range(N_REQUESTS):
+            start = time.perf_counter()
+            predict_one(rows[(i * N_REQUESTS + j) % len(rows)])
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.concatenate(latencies) * 1000
+    return n_clients * N_REQUESTS / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore")
+    with open(ROOT / "data" / "model" / "model.pkl", "rb") as file:
+        pipeline = pickle.load(file)
+    features = list(pipeline.feature_names_in_)
+
+    # Random customers around the scaler statistics, with some missing values
+    rng = np.random.default_rng(0)
+    scaler = pipeline.named_steps["scaler"]
+    rows = rng.normal(scaler.mean_, scaler.scale_, size=(1000, len(features)))
+    rows[rng.random(rows.shape) < 0.1] = np.nan
+
+    # The pipeline gets a dataframe like in the API
+    predict = lambda values: pipeline.predict_proba(pd.DataFrame(values, columns=features))
+    print(f"{'clients':>8} {'window (ms)':>12} {'requests/s':>11} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for n_clients in CONCURRENCIES:
+        for window in WINDOWS:
+            if window is None:
+                predict_one = lambda row: predict(row[np.newaxis])[0]
+            else:
+                predict_one = MicroBatcher(predict, window / 1000, MAX_BATCH_SIZE).predict_one
+            throughput, p50, p99 = run_clients(predict_one, rows, n_clients)
+            label = "alone" if window is None else f"{window:g}"
+            print(f"{n_clients:>8} {label:>12} {throughput:>11.0f} {p50:>9.2f} {p99:>9.2f}")
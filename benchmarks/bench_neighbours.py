@@ -0,0 +1,58 @@
+# Benchmark of the similar customers index (common/neighbours.py) against a scan of the whole
+# population: query latency as the population grows, and share of the true neighbours found.
+# The population is grown by resampling the customers of the cleaned data with some noise.
+# Run from the repository root: python benchmarks/bench_neighbours.py
+import pickle
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from common.customer_store import CustomerStore
+from common.feature_store import open_customer_store
+from common.neighbours import NeighbourIndex
+
+DATA_PATH = "/data/cleaned_data/test_data_cleaned.csv"
+# Number of customers queried for each population size
+N_QUERIES = 20
+K = 10
+
+# Median time of a query in milliseconds and the results of the queries
+def measure(query, store, positions):
+    timings, results = [], []
+    for position in positions:
+        start = time.perf_counter()
+        results.append(query(store.values[position], K, exclude=position)[0])
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000, results
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore")
+    with open(ROOT / "data" / "model" / "model.pkl", "rb") as file:
+        pipeline = pickle.load(file)
+    features = list(pipeline.feature_names_in_)
+    scaler = pipeline.named_steps["scaler"]
+    population = open_customer_store(DATA_PATH, features)
+
+    rng = np.random.default_rng(0)
+    print(f"{'customers':>10} {'build (s)':>10} {'index (ms)':>11} {'scan (ms)':>10} {'recall':>7}")
+    for n_customers in [5000, 20000, 50000, 100000]:
+        # Resampled customers, with noise on the values and new IDs
+        values = population.values[rng.integers(0, len(population), n_customers)]
+        values = values + rng.normal(0, 0.05, values.shape) * scaler.scale_
+        values[:, features.index("SK_ID_CURR")] = np.arange(n_customers)
+        store = CustomerStore(values, features)
+
+        start = time.perf_counter()
+        index = NeighbourIndex.build(store, scaler.mean_, scaler.scale_)
+        build_time = time.perf_counter() - start
+
+        positions = rng.integers(0, n_customers, N_QUERIES)
+        index_time, found = measure(index.query, store, positions)
+        scan_time, expected = measure(index.brute_force_query, store, positions)
+        recall = np.mean([len(set(a) & set(b)) / K for a, b in zip(found, expected)])
+        print(f"{n_customers:>10} {build_time:>10.2f} {index_time:>11.2f} {scan_time:>10.2f} {recall:>7.3f}")
@@ -0,0 +1,49 @@
+# Benchmark of the compiled trees (api/tree_engine.py) against the sklearn pipeline:
+# single row and batch latency, and the largest difference between their probabilities.
+# Run from the repository root: python benchmarks/bench_tree_engine.py
+import pickle
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "api"))
+from tree_engine import TreeEngine
+
+# Number of repetitions of each measure
+N_REPEATS = 50
+
+# Median time of a call in milliseconds
+def measure(function, values):
+    timings = []
+    for _ in range(N_REPEATS):
+        start = time.perf_counter()
+        function(values)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore")
+    with open(ROOT / "data" / "model" / "model.pkl", "rb") as file:
+        pipeline = pickle.load(file)
+    engine = TreeEngine(pipeline)
+    features = list(pipeline.feature_names_in_)
+
+    # Random customers around the scaler statistics, with some missing values
+    rng = np.random.default_rng(0)
+    scaler = pipeline.named_steps["scaler"]
+    values = rng.normal(scaler.mean_, scaler.scale_, size=(10000, len(features)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+
+    # The pipeline gets a dataframe like in the API, the engine the raw rows
+    pipeline_predict = lambda rows: pipeline.predict_proba(pd.DataFrame(rows, columns=features))
+    difference = np.abs(pipeline_predict(values) - engine.predict_proba(values)).max()
+    print(f"Largest probability difference: {difference:.2e}")
+    print(f"{'rows':>8} {'pipeline (ms)':>14} {'engine (ms)':>12}")
+    for n_rows in [1, 10, 100, 1000, 10000]:
+        rows = values[:n_rows]
+        print(f"{n_rows:>8} {measure(pipeline_predict, rows):>14.3f} {measure(engine.predict_proba, rows):>12.3f}")
@@ -0,0 +1,61 @@
+# Load test of the customer endpoint: p50 / p99 latency and requests per second.
+# Start the API (python api.py for the development server, or
+# gunicorn -c gunicorn.conf.py api:app for the production one) then run from the repository root:
+#   python benchmarks/load_test.py --concurrency 16 --requests 2000
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+# One session per thread so connections are kept alive
+local = threading.local()
+
+def get_session():
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    return local.session
+
+# Time one request to the API, in seconds
+def timed_request(url, customer_id):
+    start = time.perf_counter()
+    response = get_session().get(url, params={"id": customer_id}, timeout=30)
+    elapsed = time.perf_counter() - start
+    return elapsed, response.status_code == 200 and "Error" not in response.text
+
+def run(url, ids, concurrency, n_requests):
+    picked = [random.choice(ids) for _ in range(n_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda customer_id: timed_request(url, customer_id), picked))
+    duration = time.perf_counter() - start
+    latencies = np.array([elapsed for elapsed, _ in results]) * 1000
+    errors = sum(not ok for _, ok in results)
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "p50 (ms)": np.percentile(latencies, 50),
+        "p99 (ms)": np.percentile(latencies, 99),
+        "req/s": n_requests / duration,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:5001/api/v1/customer")
+    parser.add_argument("--data", help="CSV of the customers to pick the IDs from (default: only 231433)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    ids = [231433]
+    if args.data:
+        ids = pd.read_csv(args.data, usecols=["SK_ID_CURR"])["SK_ID_CURR"].tolist()
+    # Warm the server up before measuring
+    run(args.url, ids, 1, 20)
+    results = pd.DataFrame([run(args.url, ids, concurrency, args.requests) for concurrency in args.concurrency])
+    print(results.to_string(index=False, float_format="%.1f"))
@@ -0,0 +1,172 @@
+# Performance suite of the API and of the dashboard helpers, run in-process on synthetic
+# customers generated from the MLmodel signature (common/synthetic_data.py):
+# - cold start: time and peak memory of a new process importing the API, the first time
+#   (SHAP store and neighbours index created) and once the files next to the model exist
+# - latency of the customer, explain and what-if endpoints through the Flask test client
+# - throughput of the batch endpoint and peak memory of the process
+# - time of the dashboard helpers on one customer
+# The results can be saved and compared with a previous run: a metric worse than the
+# baseline by more than its threshold is a regression and the run exits with an error.
+#
+# Run from the repository root:
+#   python benchmarks/suite.py --save results.json --baseline baseline.json
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "api"))
+sys.path.insert(0, str(ROOT / "dashboard"))
+from common.synthetic_data import FIRST_ID, write_synthetic_data
+
+# Metrics where a higher value is better, all the others are times or memory
+HIGHER_IS_BETTER = {"batch_rows_per_s"}
+# Allowed relative degradation before a metric is a regression
+DEFAULT_THRESHOLD = 0.25
+THRESHOLDS = {
+    "lookup_p99_ms": 0.5,
+    "cold_start_first_s": 0.5,
+}
+
+# Script timing the import of the API in a new process, with its peak memory
+COLD_START_SCRIPT = """
+import resource, time
+start = time.perf_counter()
+import api
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+# Peak resident memory of a process in MB (ru_maxrss is in KB on Linux, in bytes on macOS)
+def peak_rss_mb(max_rss):
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+# Wall time of a new process importing the API, time of the import alone and peak memory
+def measure_cold_start(env):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", COLD_START_SCRIPT],
+        cwd=ROOT / "api", env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return time.perf_counter() - start, float(output[-2]), peak_rss_mb(int(output[-1]))
+
+# Times of the calls of a function, in milliseconds
+def measure(function, arguments):
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+# Run every measure and return the metrics
+def run_suite(n_rows, n_requests, batch_size):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        model_dir, data_path = write_synthetic_data(directory, n_rows)
+        env = dict(os.environ, MODEL_DIR=model_dir, DATA_PATH=data_path, PYTHONPATH=str(ROOT))
+        results["cold_start_first_s"], _, _ = measure_cold_start(env)
+        results["cold_start_s"], results["import_s"], results["cold_start_peak_rss_mb"] = measure_cold_start(env)
+
+        # The API in this process, on the same files
+        os.environ.update(MODEL_DIR=model_dir, DATA_PATH=data_path)
+        import api
+        client = api.app.test_client()
+        rng = np.random.default_rng(0)
+        ids = (FIRST_ID + rng.integers(0, n_rows, n_requests) * 7).tolist()
+
+        timings = measure(lambda customer_id: client.get(f"/api/v1/customer?id={customer_id}"), ids)
+        results["lookup_p50_ms"] = float(np.percentile(timings, 50))
+        results["lookup_p99_ms"] = float(np.percentile(timings, 99))
+        # SHAP values computed on demand the first time, read from the store afterwards
+        model = api.registry.active
+        model.shap_store.fill()
+        timings = measure(lambda customer_id: client.get(f"/api/v1/customer/explain?id={customer_id}"), ids)
+        results["explain_p50_ms"] = float(np.percentile(timings, 50))
+        timings = measure(
+            lambda customer_id: client.post("/api/v1/score", json={"id": customer_id, "features": {"AMT_CREDIT": 500000}}),
+            ids
+        )
+        results["what_if_p50_ms"] = float(np.percentile(timings, 50))
+        batch = (FIRST_ID + rng.integers(0, n_rows, batch_size) * 7).tolist()
+        timings = measure(lambda ids: client.post("/api/v1/customers/score", json={"ids": ids}).get_data(), [batch] * 5)
+        results["batch_rows_per_s"] = float(batch_size / (np.median(timings) / 1000))
+
+        # Dashboard helpers, on the data and the SHAP values of the API
+        from common.explanations import (
+            get_global_feature_importance,
+            get_local_feature_importance,
+            get_main_important_features
+        )
+        from customer_data import get_customer_data
+        global_importance = model.shap_store.global_importance()
+        local_feature_importance = get_local_feature_importance(model.shap_store.values([0])[0], model.features)
+        global_feature_importance = get_global_feature_importance(global_importance, model.features)
+        helpers = {
+            "get_customer_data": lambda customer_id: get_customer_data(model.store, customer_id),
+            "get_global_feature_importance": lambda _: get_global_feature_importance(global_importance, model.features),
+            "get_main_important_features": lambda _: get_main_important_features(
+                local_feature_importance, global_feature_importance
+            ),
+        }
+        for name, helper in helpers.items():
+            results[f"{name}_us"] = float(np.median(measure(helper, ids)) * 1000)
+        results["peak_rss_mb"] = peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return results
+
+# Metrics worse than the baseline by more than their threshold, as (metric, baseline, value, change)
+def find_regressions(results, baseline):
+    regressions = []
+    for metric, value in results.items():
+        if metric not in baseline or baseline[metric] <= 0:
+            continue
+        change = value / baseline[metric] - 1
+        if metric in HIGHER_IS_BETTER:
+            change = -change
+        if change > THRESHOLDS.get(metric, DEFAULT_THRESHOLD):
+            regressions.append((metric, baseline[metric], value, change))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000, help="number of synthetic customers")
+    parser.add_argument("--requests", type=int, default=300, help="number of requests per latency measure")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of IDs of a batch request")
+    parser.add_argument("--save", help="JSON file to write the results in")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with, ignored if missing")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    results = run_suite(args.rows, args.requests, args.batch_size)
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    print(f"{'metric':<36} {'value':>12} {'baseline':>12}")
+    for metric, value in results.items():
+        print(f"{metric:<36} {value:>12.3f} {baseline.get(metric, float('nan')):>12.3f}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "rows": args.rows,
+                "results": results,
+            }, file, indent=2)
+
+    regressions = find_regressions(results, baseline)
+    for metric, reference, value, change in regressions:
+        print(f"Regression of {metric}: {reference:.3f} -> {value:.3f} ({change:+.0%})")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,218 @@
+# Bulk scoring of a file of applicants without the API: the customers of a CSV or Parquet file of
+# any size are scored chunk by chunk by a pool of processes, each one loading the model once, and
+# the probabilities, predictions and optionally the top SHAP reasons are written as they come in
+# the order of the input. Only a few chunks per worker are in memory at once.
+#
+# The workers read their chunks themselves (byte ranges of the CSV, row groups of the Parquet
+# file), so reading scales with the workers too. A Parquet file with fewer row groups than
+# workers is read in the main process and its batches are sent to the workers.
+#
+#   python -m common.bulk_score applicants.csv scores.parquet --model-dir /data/model --reasons 3
+
+# Import libraries
+import argparse
+import io
+import os
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common.mlmodel import load_pipeline
+
+# Number of customers of a chunk
+CHUNK_SIZE = 10000
+# Chunks read or scored at once for each worker, which bounds the memory
+CHUNKS_PER_WORKER = 2
+# Lines read to estimate the size of a CSV line
+SAMPLE_LINES = 100
+
+# Model of the worker process, loaded once by init_worker
+worker = {}
+
+# Load the model (and the SHAP explainer when reasons are asked for) in a worker process
+def init_worker(model_dir, reasons):
+    warnings.simplefilter("ignore")
+    pipeline, features, signature = load_pipeline(model_dir)
+    worker.update(pipeline=pipeline, features=features, reasons=reasons, explainer=None)
+    worker["required"] = [name for name in features if signature[name]["required"]]
+    if reasons > 0:
+        # Imported here, shap is slow to import and only needed for the reasons
+        from common.shap_store import ShapExplainer
+        worker["explainer"] = ShapExplainer(pipeline)
+
+# Columns of the output, for a number of reasons
+def output_schema(reasons):
+    fields = [
+        ("SK_ID_CURR", pa.int64()),
+        ("probability_good", pa.float64()),
+        ("probability_bad", pa.float64()),
+        ("prediction", pa.int8()),
+    ]
+    for i in range(1, reasons + 1):
+        fields += [(f"reason_{i}", pa.string()), (f"reason_{i}_impact", pa.float64())]
+    fields.append(("error", pa.string()))
+    return pa.schema(fields)
+
+# Chunks of a CSV file: byte ranges of about chunk_size lines, cut at the ends of lines
+def csv_chunks(path, chunk_size):
+    with open(path, "rb") as file:
+        columns = pd.read_csv(io.BytesIO(file.readline()), nrows=0).columns.tolist()
+        start = file.tell()
+        sample = [line for line in (file.readline() for _ in range(SAMPLE_LINES)) if line]
+        chunk_bytes = max(1, int(sum(map(len, sample)) / max(len(sample), 1) * chunk_size))
+        size = os.fstat(file.fileno()).st_size
+        while start < size:
+            file.seek(min(start + chunk_bytes, size))
+            # Move to the end of the line the range stops in
+            file.readline()
+            end = file.tell()
+            yield ("csv", path, start, end, columns)
+            start = end
+
+# Chunks of a Parquet file: its row groups, or batches read here when there are too few of them
+def parquet_chunks(path, chunk_size, workers):
+    parquet_file = pq.ParquetFile(path)
+    if parquet_file.metadata.num_row_groups >= workers:
+        for row_group in range(parquet_file.metadata.num_row_groups):
+            yield ("parquet", path, row_group, chunk_size)
+    else:
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield ("frame", batch.to_pandas())
+
+# Customers of a chunk, as dataframes of at most about chunk_size rows
+def read_chunk(chunk):
+    if chunk[0] == "csv":
+        _, path, start, end, columns = chunk
+        with open(path, "rb") as file:
+            file.seek(start)
+            yield pd.read_csv(io.BytesIO(file.read(end - start)), header=None, names=columns)
+    elif chunk[0] == "parquet":
+        _, path, row_group, chunk_size = chunk
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, row_groups=[row_group]):
+            yield batch.to_pandas()
+    else:
+        yield chunk[1]
+
+# Probabilities, predictions and reasons of the customers of a dataframe
+def score_frame(data):
+    features = worker["features"]
+    # Nullable, a customer without an ID is reported instead of getting the smallest int64
+    ids = data["SK_ID_CURR"].astype("Int64")
+    result = pd.DataFrame({"SK_ID_CURR": ids})
+    probabilities = np.full((len(data), 2), np.nan)
+    # Customers missing a required feature are not scored
+    missing = data[worker["required"]].isna().any(axis=1).to_numpy()
+    rows = data.loc[~missing, features]
+    if len(rows) > 0:
+        probabilities[~missing] = worker["pipeline"].predict_proba(rows)
+    result["probability_good"] = probabilities[:, 0]
+    result["probability_bad"] = probabilities[:, 1]
+    # Same rule as model.predict: 1 for a bad customer
+    result["prediction"] = pd.array(np.where(missing, None, probabilities[:, 1] > probabilities[:, 0]), dtype="Int8")
+    reasons = worker["reasons"]
+    if reasons > 0:
+        # Features raising the probability of being a bad customer the most
+        names = np.full((len(data), reasons), None, dtype=object)
+        impacts = np.full((len(data), reasons), np.nan)
+        if len(rows) > 0:
+            shap_values = worker["explainer"].explain(rows)
+            order = np.argsort(-shap_values, axis=1)[:, :reasons]
+            top_values = np.take_along_axis(shap_values, order, axis=1)
+            top_names = np.array(features, dtype=object)[order]
+            top_names[top_values <= 0] = None
+            names[~missing] = top_names
+            impacts[~missing] = np.where(top_values > 0, top_values, np.nan)
+        for i in range(reasons):
+            result[f"reason_{i + 1}"] = names[:, i]
+            result[f"reason_{i + 1}_impact"] = impacts[:, i]
+    error = np.where(missing, "Missing required features", None)
+    result["error"] = np.where(ids.isna().to_numpy(), "Missing customer ID", error)
+    return result
+
+# Score a chunk in a worker
+def score_chunk(chunk):
+    return pd.concat([score_frame(data) for data in read_chunk(chunk)], ignore_index=True)
+
+# Output file written chunk by chunk, Parquet or CSV after its extension
+class Output:
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.parquet = os.path.splitext(path)[1].lower() in [".parquet", ".pq"]
+        self.writer = pq.ParquetWriter(path, schema) if self.parquet else open(path, "w", newline="")
+        self.header = True
+
+    def write(self, result):
+        if self.parquet:
+            self.writer.write_table(pa.Table.from_pandas(result, schema=self.schema, preserve_index=False))
+        else:
+            result.to_csv(self.writer, header=self.header, index=False)
+            self.header = False
+
+    def close(self):
+        self.writer.close()
+
+# Score every customer of the input file into the output file. Returns the number of customers.
+def bulk_score(input_path, output_path, model_dir, reasons=0, workers=1, chunk_size=CHUNK_SIZE):
+    if workers > 1:
+        # LightGBM uses all the cores by default, one thread per worker avoids the contention.
+        # Set before load_pipeline imports LightGBM, OpenMP reads it once when it is loaded.
+        os.environ.setdefault("OMP_NUM_THREADS", "1")
+    # Check the columns before starting the workers
+    _, features, _ = load_pipeline(model_dir)
+    if os.path.splitext(input_path)[1].lower() in [".parquet", ".pq"]:
+        columns = pq.ParquetFile(input_path).schema_arrow.names
+        chunks = parquet_chunks(input_path, chunk_size, workers)
+    else:
+        columns = pd.read_csv(input_path, nrows=0).columns
+        chunks = csv_chunks(input_path, chunk_size)
+    missing = [feature for feature in features if feature not in columns]
+    if missing:
+        raise ValueError(f"Columns of the model signature missing from {input_path}: {missing[:10]}")
+
+    output = Output(output_path, output_schema(reasons))
+    n_rows = 0
+    try:
+        if workers == 1:
+            init_worker(model_dir, reasons)
+            for chunk in chunks:
+                result = score_chunk(chunk)
+                output.write(result)
+                n_rows += len(result)
+        else:
+            with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(model_dir, reasons)) as pool:
+                # Results written in the order of the input, with a bounded number of chunks in flight
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(score_chunk, chunk))
+                    if len(pending) >= workers * CHUNKS_PER_WORKER:
+                        result = pending.popleft().result()
+                        output.write(result)
+                        n_rows += len(result)
+                while pending:
+                    result = pending.popleft().result()
+                    output.write(result)
+                    n_rows += len(result)
+    finally:
+        output.close()
+    return n_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_path", help="CSV or Parquet file of the customers to score")
+    parser.add_argument("output_path", help="file to write the scores in, Parquet for a .parquet extension, CSV otherwise")
+    parser.add_argument("--model-dir", default="/data/model", help="MLflow model directory")
+    parser.add_argument("--reasons", type=int, default=0, help="number of SHAP reasons per customer")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="number of customers of a chunk")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    n_rows = bulk_score(args.input_path, args.output_path, args.model_dir, args.reasons, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"{n_rows} customers scored in {elapsed:.1f}s ({n_rows / elapsed:.0f} per second) into {args.output_path}")
@@ -0,0 +1,136 @@
+# Cohorts of customers sharing some characteristics (same gender, same number of children,
+# same income band...), used by the dashboard to compare a customer with similar ones.
+# Every level of the cohort features is indexed once by a bitmap of the customers having it,
+# so a cohort of several filters is a bitwise AND of a few bitmaps instead of a scan of the data.
+# The rank of a customer in a cohort is a binary search in the cohort values, taken
+# already sorted from the presorted column of the feature.
+
+# Import libraries
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+
+# Features a cohort can be filtered on
+COHORT_FEATURES = ["CODE_GENDER", "CNT_CHILDREN", "NAME_CONTRACT_TYPE", "FLAG_OWN_CAR", "AMT_INCOME_TOTAL"]
+# Features with more distinct values than this are split into quantile bands
+MAX_LEVELS = 10
+N_BANDS = 5
+# Number of cohorts, sorted columns and sorted cohort values kept in memory
+CACHE_SIZE = 128
+
+# Bitmaps of the cohorts of a customer store
+class CohortEngine:
+    def __init__(self, store, features=COHORT_FEATURES):
+        self.store = store
+        self.size = len(store)
+        self.lock = threading.Lock()
+        # Edges of the bands of the banded features, None for the features used as they are
+        self.edges = {}
+        # Packed bitmap of the customers of every level of every feature
+        self.bitmaps = {}
+        for feature in features:
+            column = self.column(feature)
+            known = column[~np.isnan(column)]
+            unique = np.unique(known)
+            if len(unique) <= MAX_LEVELS:
+                self.edges[feature] = None
+                levels = unique
+            else:
+                self.edges[feature] = np.unique(np.quantile(known, np.linspace(0, 1, N_BANDS + 1)))
+                levels = np.arange(len(self.edges[feature]) - 1)
+            codes = self.level_codes(feature, column)
+            self.bitmaps[feature] = {level: np.packbits(codes == level) for level in levels.tolist()}
+        self.cohorts = LRUCache(maxsize=CACHE_SIZE)
+        self.sorted_columns = LRUCache(maxsize=CACHE_SIZE)
+        self.sorted_cohorts = LRUCache(maxsize=CACHE_SIZE)
+
+    # Values of a feature as a (strided) view on the store matrix
+    def column(self, feature):
+        return self.store.values[:, self.store.features.index(feature)]
+
+    # Level of some values of a feature: the value itself, or the index of its band (NaN when missing)
+    def level_codes(self, feature, values):
+        edges = self.edges[feature]
+        if edges is None:
+            return values
+        bands = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2).astype(np.float64)
+        bands[np.isnan(values)] = np.nan
+        return bands
+
+    # Levels of a feature and their labels, to fill a filter
+    def levels(self, feature):
+        edges = self.edges[feature]
+        if edges is None:
+            return {level: f"{level:g}" for level in self.bitmaps[feature]}
+        return {level: f"{edges[level]:g} to {edges[level + 1]:g}" for level in self.bitmaps[feature]}
+
+    # Filters selecting the customers sharing the levels of a customer on some features
+    def customer_filters(self, customer_id, features):
+        position = self.store.position(customer_id)
+        filters = {}
+        for feature in features:
+            level = self.level_codes(feature, self.column(feature)[position:position + 1])[0]
+            if not np.isnan(level):
+                filters[feature] = level.item()
+        return filters
+
+    # Packed bitmap of the customers matching every filter (a dict from a feature to a level)
+    def cohort(self, filters):
+        key = tuple(sorted(filters.items()))
+        with self.lock:
+            bitmap = self.cohorts.get(key)
+        if bitmap is None:
+            bitmap = np.packbits(np.ones(self.size, dtype=bool))
+            for feature, level in filters.items():
+                level_bitmap = self.bitmaps[feature].get(level)
+                if level_bitmap is None:
+                    return np.zeros_like(bitmap)
+                bitmap = np.bitwise_and(bitmap, level_bitmap)
+            with self.lock:
+                self.cohorts[key] = bitmap
+        return bitmap
+
+    # Number of customers of a cohort
+    def count(self, filters):
+        return int(np.bitwise_count(self.cohort(filters)).sum())
+
+    # Positions in the store of the customers of a cohort
+    def positions(self, filters):
+        return np.flatnonzero(np.unpackbits(self.cohort(filters), count=self.size))
+
+    # Order of the customers by a feature and the sorted values, without the missing ones
+    def sorted_column(self, feature):
+        with self.lock:
+            sorted_column = self.sorted_columns.get(feature)
+        if sorted_column is None:
+            column = self.column(feature)
+            order = np.argsort(column, kind="stable")
+            order = order[:np.count_nonzero(~np.isnan(column))]
+            sorted_column = (order, column[order])
+            with self.lock:
+                self.sorted_columns[feature] = sorted_column
+        return sorted_column
+
+    # Sorted values of a feature in a cohort, picked from the presorted column (no sort needed)
+    def sorted_values(self, filters, feature):
+        key = (tuple(sorted(filters.items())), feature)
+        with self.lock:
+            values = self.sorted_cohorts.get(key)
+        if values is None:
+            order, sorted_column = self.sorted_column(feature)
+            members = np.unpackbits(self.cohort(filters), count=self.size).view(bool)
+            values = sorted_column[members[order]]
+            with self.lock:
+                self.sorted_cohorts[key] = values
+        return values
+
+    # Percentile rank of a value of a feature in a cohort (share of the cohort below it,
+    # counting half of the ties), None when the value or the cohort values are missing
+    def percentile_rank(self, filters, feature, value):
+        values = self.sorted_values(filters, feature)
+        if len(values) == 0 or value is None or np.isnan(value):
+            return None
+        below = np.searchsorted(values, value, side="left")
+        up_to = np.searchsorted(values, value, side="right")
+        return 100 * (below + (up_to - below) / 2) / len(values)
@@ -0,0 +1,60 @@
+# Search of the customers by ID: the IDs are sorted once, then the IDs starting with some digits
+# or between two values are found by binary search and only a page of them is returned, so the
+# cost of a search doesn't grow with the population.
+#
+# The IDs starting with "2314" are 2314, 23140 to 23149, 231400 to 231499 and so on: one range
+# of the sorted IDs per number of digits, the ranges following each other in the sorted order.
+
+# Import libraries
+import numpy as np
+
+# Number of customers of a page of results
+PAGE_SIZE = 20
+
+class CustomerIndex:
+    def __init__(self, ids):
+        self.ids = np.unique(np.asarray(ids, dtype=np.int64))
+        self.max_digits = len(str(int(self.ids.max()))) if len(self.ids) > 0 else 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Positions (start, stop) in the sorted IDs of the IDs between low and high, both included
+    def range(self, low, high):
+        return int(np.searchsorted(self.ids, low, side="left")), int(np.searchsorted(self.ids, high, side="right"))
+
+    # Ranges of positions of the IDs starting with some digits, in the sorted order
+    def prefix_ranges(self, prefix):
+        value = int(prefix)
+        ranges = []
+        for digits in range(len(prefix), self.max_digits + 1):
+            scale = 10 ** (digits - len(prefix))
+            # A prefix of zeros only matches the zero itself
+            low = max(value * scale, 10 ** (digits - 1) if digits > 1 else 0)
+            high = (value + 1) * scale - 1
+            if low <= high:
+                ranges.append(self.range(low, high))
+        return ranges
+
+    # Page of the IDs starting with some digits (all the IDs for an empty prefix) and between low
+    # and high when given. Returns the IDs of the page and the number of IDs matching.
+    def search(self, prefix="", low=None, high=None, offset=0, limit=PAGE_SIZE):
+        low = int(self.ids[0]) if low is None and len(self.ids) > 0 else low
+        high = int(self.ids[-1]) if high is None and len(self.ids) > 0 else high
+        if len(self.ids) == 0 or low > high:
+            return [], 0
+        bounds = self.range(low, high)
+        ranges = self.prefix_ranges(prefix) if prefix else [bounds]
+        page = []
+        total = 0
+        for start, stop in ranges:
+            # Keep the part of the range between low and high
+            start, stop = max(start, bounds[0]), min(stop, bounds[1])
+            if start >= stop:
+                continue
+            # Part of the page in this range
+            first = max(offset - total, 0)
+            if first < stop - start and len(page) < limit:
+                page.extend(self.ids[start + first:min(stop, start + first + limit - len(page))].tolist())
+            total += stop - start
+        return page, total
@@ -0,0 +1,59 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+
+# Index of the customers by SK_ID_CURR, built once when the data is loaded.
+# The features are kept in one row-major float matrix in model order, so looking a
+# customer up is a dict access and a slice instead of a scan of the whole dataframe.
+class CustomerStore:
+    def __init__(self, values, features):
+        self.values = values
+        self.features = list(features)
+        self.feature_positions = {feature: i for i, feature in enumerate(self.features)}
+        self.columns = pd.Index(self.features)
+        # Dataframe view on the matrix (no copy) for the code working with columns
+        self.data = pd.DataFrame(values, columns=self.columns, copy=False)
+        self.ids = values[:, self.features.index("SK_ID_CURR")].astype(np.int64)
+        # Hash index from the customer ID to its position in the data (and in the SHAP array)
+        self.positions = {}
+        for position, customer_id in enumerate(self.ids.tolist()):
+            self.positions.setdefault(customer_id, position)
+
+    # Build the store from a dataframe, keeping the given features order (the data order by default)
+    @classmethod
+    def from_frame(cls, data, features=None):
+        features = list(data.columns) if features is None else list(features)
+        values = data[features].to_numpy(dtype=np.float64)
+        # Shared by all the requests and sessions, like the memory-mapped matrix nobody may write in it
+        values.setflags(write=False)
+        return cls(values, features)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, customer_id):
+        return customer_id in self.positions
+
+    # Position of a customer in the data, None if it is unknown
+    def position(self, customer_id):
+        return self.positions.get(customer_id)
+
+    # Customer row as a one line dataframe ready for the model, with its position
+    def row(self, customer_id):
+        position = self.position(customer_id)
+        if position is None:
+            return None, None
+        row = pd.DataFrame(self.values[position:position + 1], columns=self.columns)
+        return row, position
+
+    # Rows at several positions as a dataframe ready for the model
+    def rows(self, positions):
+        return pd.DataFrame(self.values[np.asarray(positions, dtype=np.intp)], columns=self.columns)
+
+    # Value of a single column for a customer
+    def value(self, customer_id, column):
+        return self.values[self.positions[customer_id], self.feature_positions[column]]
+
+    # Values of some columns for a customer, without building a row of all the features
+    def values_of(self, customer_id, columns):
+        return self.values[self.positions[customer_id], [self.feature_positions[column] for column in columns]]
@@ -0,0 +1,42 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+
+# Compute global feature importance from the mean of the absolute shap values of each feature
+def get_global_feature_importance(global_importance, features):
+    global_feature_importance = pd.DataFrame(
+        global_importance,
+        columns=["Global Importance"],
+        index=features
+    ).reset_index(names="Feature")
+    return global_feature_importance
+
+# Return the local feature importance for a customer from its shap values
+def get_local_feature_importance(customer_shap_values, features):
+    local_feature_importance = pd.DataFrame(
+        customer_shap_values,
+        columns=["Local Importance"],
+        index=features
+    ).reset_index(names="Feature")
+    return local_feature_importance
+
+# Get the most important positive and negative features of a customer, with their global importance
+def get_main_important_features(local_feature_importance, global_feature_importance, top=10):
+    # Get the most important positive features
+    positive_important_features = local_feature_importance.loc[
+         local_feature_importance["Local Importance"] > 0, :
+    ].sort_values(by="Local Importance", ascending=False, key=abs).head(top)
+    # Get the most important negative features
+    negative_important_features = local_feature_importance.loc[
+         local_feature_importance["Local Importance"] < 0, :
+    ].sort_values(by="Local Importance", ascending=False, key=abs).head(top)
+
+    # Add global importance
+    positive_important_features = positive_important_features.merge(global_feature_importance)
+    negative_important_features = negative_important_features.merge(global_feature_importance)
+
+    # Put everything in absolute value
+    positive_important_features["Local Importance"] = np.abs(positive_important_features["Local Importance"])
+    negative_important_features["Local Importance"] = np.abs(negative_important_features["Local Importance"])
+
+    return positive_important_features, negative_important_features
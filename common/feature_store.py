@@ -0,0 +1,97 @@
+# Converted copy of the cleaned data: the features matrix in model order saved as a .npy file
+# next to the CSV, opened memory-mapped. Opening it is almost instant and the processes (and
+# containers) mounting the same /data volume share its pages through the OS page cache
+# instead of each one parsing the CSV into its own copy.
+#
+# Convert the data after each change of the CSV or of the model signature:
+#   python -m common.feature_store /data/cleaned_data/test_data_cleaned.csv --model-dir /data/model
+
+# Import libraries
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from common.customer_store import CustomerStore
+from common.mlmodel import file_checksum, read_signature_inputs
+
+# Paths of the matrix and of its description, next to the CSV
+def feature_store_paths(csv_path):
+    base = os.path.splitext(csv_path)[0]
+    return base + ".npy", base + ".json"
+
+# Description of the converted data if it is up to date with the CSV, None otherwise
+def read_feature_store_meta(csv_path):
+    matrix_path, meta_path = feature_store_paths(csv_path)
+    if not os.path.exists(matrix_path) or not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as file:
+        meta = json.load(file)
+    source = os.stat(csv_path)
+    if meta["source_size"] != source.st_size or meta["source_mtime_ns"] != source.st_mtime_ns:
+        return None
+    return meta
+
+# Convert the CSV into the matrix, with the columns in the order of the model signature
+def convert(csv_path, model_dir):
+    inputs = read_signature_inputs(model_dir)
+    features = [column["name"] for column in inputs]
+    data = pd.read_csv(csv_path)
+    missing = [feature for feature in features if feature not in data.columns]
+    if missing:
+        raise ValueError(f"Columns of the model signature missing from {csv_path}: {missing[:10]}")
+    # Check the data against the signature types before saving it
+    for column in inputs:
+        values = data[column["name"]]
+        if column["required"] and values.isna().any():
+            raise ValueError(f"Required column {column['name']} has missing values")
+        if column["type"] == "long" and (values.dropna() % 1 != 0).any():
+            raise ValueError(f"Column {column['name']} should only hold integers")
+
+    matrix_path, meta_path = feature_store_paths(csv_path)
+    # Write in temporary files first so a reader never opens a partial matrix
+    directory = os.path.dirname(matrix_path)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".npy", delete=False) as file:
+        np.save(file, np.ascontiguousarray(data[features].to_numpy(dtype=np.float64)))
+    # Temporary files are only readable by their owner, the services may run as another user
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, matrix_path)
+    source = os.stat(csv_path)
+    meta = {
+        "features": features,
+        "types": {column["name"]: column["type"] for column in inputs},
+        "source_size": source.st_size,
+        "source_mtime_ns": source.st_mtime_ns,
+        "source_checksum": file_checksum(csv_path),
+    }
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".json", delete=False) as file:
+        json.dump(meta, file)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, meta_path)
+    return matrix_path
+
+# Open the customers of the CSV, memory-mapped from the converted matrix when it is
+# up to date (and in the expected features order), parsing the CSV otherwise
+def open_customer_store(csv_path, features=None):
+    meta = read_feature_store_meta(csv_path)
+    if meta is not None and (features is None or list(features) == meta["features"]):
+        matrix_path, _ = feature_store_paths(csv_path)
+        return CustomerStore(np.load(matrix_path, mmap_mode="r"), meta["features"])
+    return CustomerStore.from_frame(pd.read_csv(csv_path), features)
+
+# Checksum of the CSV, read from the description of the converted data when it is up to date
+def data_checksum(csv_path):
+    meta = read_feature_store_meta(csv_path)
+    if meta is not None:
+        return meta["source_checksum"]
+    return file_checksum(csv_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_path", help="cleaned data CSV to convert")
+    parser.add_argument("--model-dir", default="/data/model", help="MLflow model directory holding the signature")
+    args = parser.parse_args()
+    print(f"Features matrix written to {convert(args.csv_path, args.model_dir)}")
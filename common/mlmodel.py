@@ -0,0 +1,74 @@
+# Import libraries
+import hashlib
+import json
+import math
+import os
+import pickle
+
+import yaml
+
+# YAML parser of the MLmodel files: the C one when PyYAML was built with libyaml, the pure
+# Python one takes a tenth of a second for the signature of the model
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# MLmodel files already read, by path, with the modification time they were read at
+mlmodel_cache = {}
+
+# Read the MLmodel file of an MLflow model directory, again only when it changed
+def read_mlmodel(model_dir):
+    path = os.path.join(model_dir, "MLmodel")
+    modified = os.stat(path).st_mtime_ns
+    cached = mlmodel_cache.get(path)
+    if cached is None or cached[0] != modified:
+        with open(path) as file:
+            cached = mlmodel_cache[path] = (modified, yaml.load(file, Loader=YAML_LOADER))
+    return cached[1]
+
+# Unique ID of the model, changes with every new MLflow model
+def read_model_uuid(model_dir):
+    return read_mlmodel(model_dir)["model_uuid"]
+
+# Input columns of the model signature, as a list of {"name", "type", "required"}
+def read_signature_inputs(model_dir):
+    return json.loads(read_mlmodel(model_dir)["signature"]["inputs"])
+
+# Load the pipeline of an MLflow model directory and check it against the signature. Returns the
+# pipeline, its features in the order it was fitted on and the signature inputs by name.
+def load_pipeline(model_dir):
+    with open(os.path.join(model_dir, "model.pkl"), "rb") as file:
+        pipeline = pickle.load(file)
+    if not hasattr(pipeline, "named_steps") or not {"scaler", "model"} <= set(pipeline.named_steps):
+        raise ValueError(f"The model of {model_dir} should be a pipeline with a scaler and a model step")
+    features = list(pipeline.feature_names_in_)
+    signature = {column["name"]: column for column in read_signature_inputs(model_dir)}
+    if set(signature) != set(features):
+        different = sorted(set(signature) ^ set(features))
+        raise ValueError(f"The signature of {model_dir} doesn't match the model features: {different[:10]}")
+    return pipeline, features, signature
+
+# Checksum of a file, read by blocks so big data files don't go in memory
+def file_checksum(path, block_size=1 << 20):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+# Check feature values (a dict) against the signature (a dict of the inputs by name),
+# returns the list of the problems found
+def check_feature_values(values, signature):
+    errors = []
+    for name, value in values.items():
+        if name not in signature:
+            errors.append(f"Unknown feature {name}.")
+        elif value is None:
+            if signature[name]["required"]:
+                errors.append(f"{name} is required and can't be null.")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            errors.append(f"{name} should be a number.")
+        elif signature[name]["type"] == "long" and not float(value).is_integer():
+            errors.append(f"{name} should be an integer.")
+    return errors
+
+# Required features of the signature missing from feature values (a dict)
+def missing_required_features(values, signature):
+    return [name for name, column in signature.items() if column["required"] and name not in values]
@@ -0,0 +1,195 @@
+# Pickle-free copy of the model of an MLflow model directory, for the API to start fast.
+# The pipeline (StandardScaler + LGBMClassifier) is exported once in native/ next to model.pkl:
+# - booster.txt: the booster in the text format of LightGBM
+# - scaler.npz: the mean and the scale of the scaler, the features in the order of the
+#   signature and the version of the model exported
+# Loading it only needs numpy: the trees are read from the text format here, and LightGBM is
+# only imported when something asks for the booster itself (SHAP values of new customers).
+#
+# Export the model of a directory (again after each new model):
+#   python -m common.native_model --model-dir /data/model
+
+# Import libraries
+import argparse
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from common.mlmodel import load_pipeline, read_model_uuid, read_signature_inputs
+
+# Directory of the export in the model directory, and its files
+NATIVE_DIR = "native"
+BOOSTER_FILE = "booster.txt"
+SCALER_FILE = "scaler.npz"
+# Files a model can be loaded from, see load_model
+ARTIFACTS = ["auto", "native", "pickle"]
+# Types of missing values of the splits, bits 2 and 3 of their decision type in the text format
+MISSING_TYPES = ["None", "Zero", "NaN"]
+
+# Scaler of an exported model, standardises like the StandardScaler of the pipeline
+class NativeScaler:
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, values):
+        return (np.asarray(values, dtype=np.float64) - self.mean_) / self.scale_
+
+# Booster of an exported model. Its trees are read without LightGBM (dump_model), the LightGBM
+# booster is only loaded the first time it is asked for.
+class NativeClassifier:
+    def __init__(self, booster_text):
+        self.booster_text = booster_text
+        self.booster = None
+        self.lock = threading.Lock()
+
+    @property
+    def booster_(self):
+        with self.lock:
+            if self.booster is None:
+                import lightgbm
+                # The parameters are not read from a model string, shap needs the objective
+                objective = next(line for line in self.booster_text.splitlines() if line.startswith("objective="))
+                params = {"objective": objective.partition("=")[2].split()[0]}
+                self.booster = lightgbm.Booster(params=params, model_str=self.booster_text)
+            return self.booster
+
+    # Trees of the booster, like Booster.dump_model()
+    def dump_model(self):
+        return parse_booster(self.booster_text)
+
+    # Probabilities of the two classes of scaled rows, like LGBMClassifier.predict_proba
+    def predict_proba(self, scaled):
+        probabilities = self.booster_.predict(np.asarray(scaled, dtype=np.float64))
+        return np.column_stack([1 - probabilities, probabilities])
+
+# Exported model, with the parts of the pipeline used by the API and the stores
+class NativePipeline:
+    def __init__(self, scaler, model, features):
+        self.named_steps = {"scaler": scaler, "model": model}
+        self.feature_names_in_ = np.array(features, dtype=object)
+
+    def predict_proba(self, rows):
+        return self.named_steps["model"].predict_proba(self.named_steps["scaler"].transform(rows))
+
+# Nodes of a tree of the text format, nested like the tree_structure of Booster.dump_model()
+def tree_structure(tree):
+    leaf_values = [float(value) for value in tree["leaf_value"].split()]
+    if int(tree["num_leaves"]) == 1:
+        return {"leaf_value": leaf_values[0]}
+    split_feature = [int(value) for value in tree["split_feature"].split()]
+    threshold = [float(value) for value in tree["threshold"].split()]
+    decision_type = [int(value) for value in tree["decision_type"].split()]
+    left_child = [int(value) for value in tree["left_child"].split()]
+    right_child = [int(value) for value in tree["right_child"].split()]
+
+    # A negative child is the leaf ~child
+    def node(index):
+        if index < 0:
+            return {"leaf_value": leaf_values[~index]}
+        decision = decision_type[index]
+        return {
+            "split_index": index,
+            "split_feature": split_feature[index],
+            "threshold": threshold[index],
+            "decision_type": "==" if decision & 1 else "<=",
+            "default_left": bool(decision & 2),
+            "missing_type": MISSING_TYPES[(decision >> 2) & 3],
+            "left_child": node(left_child[index]),
+            "right_child": node(right_child[index]),
+        }
+    return node(0)
+
+# Trees of a booster in the text format of LightGBM, like the parts of Booster.dump_model()
+# read by TreeEngine
+def parse_booster(text):
+    header = {}
+    trees = []
+    for line in text.splitlines():
+        if line == "end of trees":
+            break
+        if line.startswith("Tree="):
+            trees.append({})
+        elif "=" in line:
+            key, _, value = line.partition("=")
+            (trees[-1] if trees else header)[key] = value
+    return {
+        "objective": header["objective"],
+        "max_feature_idx": int(header["max_feature_idx"]),
+        "tree_info": [{"tree_structure": tree_structure(tree)} for tree in trees],
+    }
+
+# Directory of the export of a model directory
+def native_dir(model_dir):
+    return os.path.join(model_dir, NATIVE_DIR)
+
+# Whether the model of a directory was exported, for the version it holds now
+def has_native_model(model_dir):
+    directory = native_dir(model_dir)
+    if not os.path.exists(os.path.join(directory, SCALER_FILE)) or not os.path.exists(os.path.join(directory, BOOSTER_FILE)):
+        return False
+    with np.load(os.path.join(directory, SCALER_FILE)) as arrays:
+        return str(arrays["model_uuid"]) == read_model_uuid(model_dir)
+
+# Write a file of the export atomically, so the API never reads a half written one
+def write_atomically(path, write):
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=os.path.splitext(path)[1], delete=False) as file:
+        write(file)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+# Export the pickled pipeline of a model directory. The scaler is written last: it holds the
+# version of the model, so a half done export is never taken for the current one.
+def export_native_model(model_dir):
+    pipeline, features, _ = load_pipeline(model_dir)
+    # The booster reads the features by position: they have to be in the order of the signature
+    if [column["name"] for column in read_signature_inputs(model_dir)] != features:
+        raise ValueError(f"The model of {model_dir} was not fitted on the features in the order of its signature")
+    scaler = pipeline.named_steps["scaler"]
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(len(features))
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(len(features))
+    directory = native_dir(model_dir)
+    os.makedirs(directory, exist_ok=True)
+    booster_text = pipeline.named_steps["model"].booster_.model_to_string()
+    write_atomically(os.path.join(directory, BOOSTER_FILE), lambda file: file.write(booster_text.encode()))
+    write_atomically(os.path.join(directory, SCALER_FILE), lambda file: np.savez(
+        file,
+        mean=np.asarray(mean, dtype=np.float64),
+        scale=np.asarray(scale, dtype=np.float64),
+        features=np.array(features, dtype=str),
+        model_uuid=np.array(read_model_uuid(model_dir))
+    ))
+    return directory
+
+# Load the export of a model directory. Returns the model, its features and the signature
+# inputs by name, like load_pipeline.
+def load_native_model(model_dir):
+    if not has_native_model(model_dir):
+        raise ValueError(f"The model of {model_dir} has no native export for its version, run python -m common.native_model")
+    directory = native_dir(model_dir)
+    with np.load(os.path.join(directory, SCALER_FILE)) as arrays:
+        scaler = NativeScaler(arrays["mean"], arrays["scale"])
+        features = arrays["features"].tolist()
+    with open(os.path.join(directory, BOOSTER_FILE)) as file:
+        model = NativeClassifier(file.read())
+    signature = {column["name"]: column for column in read_signature_inputs(model_dir)}
+    if list(signature) != features:
+        raise ValueError(f"The signature of {model_dir} doesn't match the features of its native export")
+    return NativePipeline(scaler, model, features), features, signature
+
+# Load the model of a directory: from its native export when there is one for its version
+# (artifact "auto"), only from it ("native") or only from the pickle ("pickle")
+def load_model(model_dir, artifact="auto"):
+    if artifact not in ARTIFACTS:
+        raise ValueError(f"The model artifact should be one of {', '.join(ARTIFACTS)}, not {artifact}")
+    if artifact == "native" or (artifact == "auto" and has_native_model(model_dir)):
+        return load_native_model(model_dir)
+    return load_pipeline(model_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", default="/data/model", help="MLflow model directory")
+    args = parser.parse_args()
+    print(f"Model of {args.model_dir} exported to {export_native_model(args.model_dir)}")
@@ -0,0 +1,166 @@
+# Similar customers: nearest neighbours of a customer in the feature space seen by the model.
+# The features are standardised with the scaler of the pipeline (missing values at the mean)
+# and optionally weighted by their global SHAP importance, so two customers are close when
+# they differ little on the features that matter to the model.
+# The scaled rows are projected on their main axes and indexed by a KD-tree; the candidates
+# found there are ranked again with the exact distance on every feature.
+#
+# Build the index offline:
+#   python -m common.neighbours /data/cleaned_data/test_data_cleaned.csv --model-dir /data/model
+
+# Import libraries
+import argparse
+import os
+import pickle
+import tempfile
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from common.feature_store import data_checksum, open_customer_store
+from common.mlmodel import read_model_uuid
+
+# Number of axes of the projection indexed by the KD-tree
+INDEX_DIMENSIONS = 16
+# Number of candidates taken from the KD-tree for each neighbour returned
+CANDIDATES_FACTOR = 20
+# Number of customers used to find the axes of the projection, and to estimate the
+# SHAP importance when the SHAP store is not filled yet
+SAMPLE_SIZE = 20000
+SHAP_SAMPLE_SIZE = 1000
+# Number of customers projected together when the index is built
+BUILD_CHUNK_SIZE = 10000
+
+# Weights of the features: their global SHAP importance relative to the mean importance
+def importance_weights(importance):
+    importance = np.asarray(importance, dtype=np.float64)
+    return importance / max(importance.mean(), np.finfo(np.float64).tiny)
+
+# Scaled and weighted rows (factors are the weights square roots over the scales),
+# missing values put at the mean (0 once scaled)
+def transform_rows(values, mean, factors):
+    scaled = (values - mean) * factors
+    return np.nan_to_num(scaled, copy=False, nan=0.0)
+
+# Nearest neighbours index of the customers of a store
+class NeighbourIndex:
+    def __init__(self, store, mean, scale, weights, components, embedding):
+        self.store = store
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights
+        # Scaling and weighting folded together: one multiplication per value
+        self.factors = np.sqrt(weights) / scale
+        self.components = components
+        self.embedding = embedding
+        self.tree = cKDTree(embedding)
+
+    def transform(self, values):
+        return transform_rows(values, self.mean, self.factors)
+
+    # Find the main axes on a sample of the customers and project everybody on them, chunk by chunk
+    @classmethod
+    def build(cls, store, mean, scale, weights=None, seed=0):
+        weights = np.ones(len(store.features)) if weights is None else weights
+        factors = np.sqrt(weights) / scale
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(store), min(SAMPLE_SIZE, len(store)), replace=False))
+        scaled = transform_rows(store.values[sample], mean, factors)
+        scaled -= scaled.mean(axis=0)
+        components = np.linalg.svd(scaled, full_matrices=False)[2][:INDEX_DIMENSIONS]
+        embedding = np.empty((len(store), len(components)), dtype=np.float32)
+        for start in range(0, len(store), BUILD_CHUNK_SIZE):
+            chunk = transform_rows(store.values[start:start + BUILD_CHUNK_SIZE], mean, factors)
+            embedding[start:start + len(chunk)] = chunk @ components.T
+        return cls(store, mean, scale, weights, components, embedding)
+
+    # Exact weighted distances between a row and the customers at some positions
+    def distances(self, row, positions):
+        differences = self.transform(self.store.values[positions]) - self.transform(row[np.newaxis, :])
+        return np.sqrt(np.einsum("ij,ij->i", differences, differences))
+
+    # The k customers closest to a row, as positions in the store and distances.
+    # The position of the customer itself is excluded when given.
+    def query(self, row, k=10, exclude=None):
+        n_candidates = min(len(self.store), k * CANDIDATES_FACTOR + 1)
+        point = self.transform(row[np.newaxis, :]) @ self.components.T
+        candidates = np.atleast_1d(self.tree.query(point[0], k=n_candidates)[1])
+        candidates = candidates[candidates < len(self.store)]
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        distances = self.distances(row, candidates)
+        order = np.argsort(distances, kind="stable")[:k]
+        return candidates[order], distances[order]
+
+    # Scan of the whole store, the reference for the index
+    def brute_force_query(self, row, k=10, exclude=None):
+        distances = np.empty(len(self.store))
+        for start in range(0, len(self.store), BUILD_CHUNK_SIZE):
+            positions = np.arange(start, min(start + BUILD_CHUNK_SIZE, len(self.store)))
+            distances[positions] = self.distances(row, positions)
+        if exclude is not None:
+            distances[exclude] = np.inf
+        order = np.argsort(distances, kind="stable")[:k]
+        return order, distances[order]
+
+    @classmethod
+    def load(cls, path, store):
+        with np.load(path) as file:
+            if not np.array_equal(file["ids"], store.ids):
+                return None
+            return cls(store, file["mean"], file["scale"], file["weights"], file["components"], file["embedding"])
+
+    # Write the index in a temporary file first so a reader never sees a partial file
+    def save(self, path):
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".npz", delete=False) as file:
+            np.savez(
+                file,
+                ids=self.store.ids,
+                mean=self.mean,
+                scale=self.scale,
+                weights=self.weights,
+                components=self.components,
+                embedding=self.embedding
+            )
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+
+# Load the index of a model and a data file from the model directory, build and save it the first time.
+# With a SHAP store the features are weighted by their global importance, estimated on a sample
+# of customers when the store is not filled yet.
+def open_neighbour_index(model_dir, data_path, pipeline, store, shap_store=None):
+    weighting = "shap" if shap_store is not None else "scaled"
+    path = os.path.join(
+        model_dir,
+        f"neighbours_{read_model_uuid(model_dir)}_{data_checksum(data_path)[:16]}_{weighting}.npz"
+    )
+    if os.path.exists(path):
+        index = NeighbourIndex.load(path, store)
+        if index is not None:
+            return index
+    weights = None
+    if shap_store is not None:
+        if shap_store.completion() < 1:
+            rng = np.random.default_rng(0)
+            shap_store.values(np.sort(rng.choice(len(store), min(SHAP_SAMPLE_SIZE, len(store)), replace=False)))
+        weights = importance_weights(shap_store.global_importance())
+    scaler = pipeline.named_steps["scaler"]
+    index = NeighbourIndex.build(store, scaler.mean_, scaler.scale_, weights)
+    index.save(path)
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_path", help="cleaned data CSV of the customers to index")
+    parser.add_argument("--model-dir", default="/data/model", help="MLflow model directory")
+    parser.add_argument("--shap-weights", action="store_true", help="weight the features by their global SHAP importance")
+    args = parser.parse_args()
+    with open(os.path.join(args.model_dir, "model.pkl"), "rb") as file:
+        pipeline = pickle.load(file)
+    store = open_customer_store(args.data_path, list(pipeline.feature_names_in_))
+    shap_store = None
+    if args.shap_weights:
+        from common.shap_store import open_shap_store
+        shap_store = open_shap_store(args.model_dir, args.data_path, pipeline, store)
+    index = open_neighbour_index(args.model_dir, args.data_path, pipeline, store, shap_store)
+    print(f"Neighbours of {len(store)} customers indexed on {index.embedding.shape[1]} axes")
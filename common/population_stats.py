@@ -0,0 +1,91 @@
+# Aggregated view of the population of a customer store, used by the dashboard charts.
+# Instead of sending every customer value to the browser, a feature is summarised by
+# quantile-based histogram bins and a pair of features by a 2-D grid of counts.
+# The aggregates are computed lazily on first use and kept in LRU caches. The dashboard keeps one
+# PopulationStats per version of the data (see load_population_stats).
+
+# Import libraries
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+
+# Number of bins of a histogram and of each axis of a density grid
+HISTOGRAM_BINS = 50
+DENSITY_BINS = 40
+# Number of aggregates kept in memory
+HISTOGRAM_CACHE_SIZE = 256
+DENSITY_CACHE_SIZE = 64
+
+# Bin edges of some values: quantiles of the values, so every bin holds about the same number
+# of customers whatever the skew. Discrete features (flags, counts) get one bin per value.
+def quantile_edges(values, bins):
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.array([0.0, 1.0])
+    unique = np.unique(values)
+    if len(unique) <= bins:
+        if len(unique) == 1:
+            return np.array([unique[0] - 0.5, unique[0] + 0.5])
+        # Edges half way between the values
+        middles = (unique[1:] + unique[:-1]) / 2
+        return np.concatenate([[2 * unique[0] - middles[0]], middles, [2 * unique[-1] - middles[-1]]])
+    return np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)))
+
+# Histogram of a feature: edges of the bins, number of customers in each bin and missing values
+class Histogram:
+    def __init__(self, values, bins=HISTOGRAM_BINS):
+        self.edges = quantile_edges(values, bins)
+        self.counts = np.histogram(values[~np.isnan(values)], bins=self.edges)[0]
+        self.missing = int(np.isnan(values).sum())
+
+    # Number of customers per unit of the feature, comparable between bins of different widths
+    def density(self):
+        return self.counts / np.diff(self.edges)
+
+# Counts of customers on a grid of two features, without the customers missing one of them
+class DensityGrid:
+    def __init__(self, x, y, bins=DENSITY_BINS):
+        known = ~np.isnan(x) & ~np.isnan(y)
+        self.x_edges = quantile_edges(x[known], bins)
+        self.y_edges = quantile_edges(y[known], bins)
+        self.counts = np.histogram2d(x[known], y[known], bins=[self.x_edges, self.y_edges])[0].astype(np.int64)
+        self.missing = int((~known).sum())
+
+    # Number of customers per unit of area of the two features, like Histogram.density: the
+    # quantile cells of the tails are much wider than the central ones
+    def density(self):
+        return self.counts / np.outer(np.diff(self.x_edges), np.diff(self.y_edges))
+
+# Aggregates of the population of a customer store
+class PopulationStats:
+    def __init__(self, store):
+        self.store = store
+        self.histograms = LRUCache(maxsize=HISTOGRAM_CACHE_SIZE)
+        self.densities = LRUCache(maxsize=DENSITY_CACHE_SIZE)
+        self.lock = threading.Lock()
+
+    # Values of a feature as a (strided) view on the store matrix
+    def column(self, feature):
+        return self.store.values[:, self.store.features.index(feature)]
+
+    # Histogram of a feature, computed on first use
+    def histogram(self, feature):
+        with self.lock:
+            histogram = self.histograms.get(feature)
+        if histogram is None:
+            histogram = Histogram(self.column(feature))
+            with self.lock:
+                self.histograms[feature] = histogram
+        return histogram
+
+    # Density grid of two features, computed on first use
+    def density(self, x_feature, y_feature):
+        key = (x_feature, y_feature)
+        with self.lock:
+            grid = self.densities.get(key)
+        if grid is None:
+            grid = DensityGrid(self.column(x_feature), self.column(y_feature))
+            with self.lock:
+                self.densities[key] = grid
+        return grid
@@ -0,0 +1,145 @@
+# SHAP values of the customers of the data, saved on disk for one model and one data file.
+# The values are computed on demand for the customers not done yet, so nobody waits for the whole
+# population to be explained, and can be filled offline. The API doesn't fill the store itself:
+# until it is filled offline, the global importance is the mean over the customers explained so far.
+#
+# Fill the store offline:
+#   python -m common.shap_store /data/cleaned_data/test_data_cleaned.csv --model-dir /data/model
+
+# Import libraries
+import argparse
+import fcntl
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from common.feature_store import data_checksum, open_customer_store
+from common.mlmodel import read_model_uuid
+from common.native_model import NativeClassifier
+
+# Number of customers explained together when the store is filled
+FILL_CHUNK_SIZE = 256
+
+# TreeSHAP explanations of the pipeline, computed on the scaled data the booster actually sees.
+# shap (and LightGBM for the native models) is only imported for the first rows to explain.
+class ShapExplainer:
+    def __init__(self, pipeline):
+        self.scaler = pipeline.named_steps["scaler"]
+        self.model = pipeline.named_steps["model"]
+        self.explainer = None
+
+    # SHAP values of some rows (a dataframe in model order)
+    def explain(self, rows):
+        if self.explainer is None:
+            import shap
+            # The native models are explained through their LightGBM booster
+            self.explainer = shap.TreeExplainer(self.model.booster_ if isinstance(self.model, NativeClassifier) else self.model)
+        values = self.explainer.shap_values(self.scaler.transform(rows))
+        # Some shap versions return one array per class for binary classifiers
+        if isinstance(values, list):
+            values = values[1]
+        return np.asarray(values)
+
+# Create a memory-mapped .npy file atomically, so two processes never see a half created file
+def create_memmap(path, dtype, shape):
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".npy", delete=False) as file:
+        pass
+    array = open_memmap(file.name, mode="w+", dtype=dtype, shape=shape)
+    array.flush()
+    del array
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+# Create the files of a store once, whichever process gets there first. The creation is guarded
+# by a lock file, so every process opens the values and the done mask of the same creation, and
+# done.npy is written last: a store without it is created again from scratch.
+def create_store_files(directory, shape):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(os.path.join(directory, "done.npy")):
+            create_memmap(os.path.join(directory, "values.npy"), np.float32, shape)
+            create_memmap(os.path.join(directory, "done.npy"), np.bool_, shape[:1])
+
+# SHAP values of every customer of a customer store, memory-mapped from the disk
+class ShapStore:
+    def __init__(self, directory, explainer, store):
+        self.explainer = explainer
+        self.store = store
+        self.lock = threading.Lock()
+        shape = (len(store), len(store.features))
+        if not os.path.exists(os.path.join(directory, "done.npy")):
+            create_store_files(directory, shape)
+        self.shap_values = open_memmap(os.path.join(directory, "values.npy"), mode="r+")
+        # Which customers already have their values computed
+        self.done = open_memmap(os.path.join(directory, "done.npy"), mode="r+")
+        # Sum of the absolute values of each feature and number of customers in it,
+        # scanned once then kept up to date by compute()
+        self.importance_total = None
+        self.importance_count = 0
+
+    # Compute the values at some positions and append them to the store
+    # (one computation at a time, the explainer is shared by the threads)
+    def compute(self, positions):
+        with self.lock:
+            values = self.explainer.explain(self.store.rows(positions))
+            new = ~self.done[positions]
+            self.shap_values[positions] = values
+            self.shap_values.flush()
+            # Mark them done only once the values are written
+            self.done[positions] = True
+            self.done.flush()
+            if self.importance_total is not None:
+                self.importance_total += np.abs(values[new]).sum(axis=0)
+                self.importance_count += int(np.count_nonzero(new))
+
+    # SHAP values of the customers at some positions, computing the missing ones on demand
+    def values(self, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        missing = np.unique(positions[~self.done[positions]])
+        if len(missing) > 0:
+            self.compute(missing)
+        return np.asarray(self.shap_values[positions], dtype=np.float64)
+
+    # Compute every missing customer, chunk by chunk
+    def fill(self, chunk_size=FILL_CHUNK_SIZE):
+        for start in range(0, len(self.done), chunk_size):
+            positions = np.flatnonzero(~self.done[start:start + chunk_size]) + start
+            if len(positions) > 0:
+                self.compute(positions)
+
+    # Share of the customers already computed
+    def completion(self):
+        return float(np.mean(self.done))
+
+    # Mean of the absolute SHAP values of every feature, over the customers computed so far
+    def global_importance(self, chunk_size=10000):
+        with self.lock:
+            if self.importance_total is None:
+                self.importance_total = np.zeros(self.shap_values.shape[1])
+                for start in range(0, len(self.done), chunk_size):
+                    done = self.done[start:start + chunk_size]
+                    self.importance_total += np.abs(self.shap_values[start:start + chunk_size][done]).sum(axis=0)
+                self.importance_count = int(np.count_nonzero(self.done))
+            return self.importance_total / max(self.importance_count, 1)
+
+# Open the SHAP store of a model and a data file, next to the model
+def open_shap_store(model_dir, data_path, pipeline, store):
+    directory = os.path.join(model_dir, f"shap_{read_model_uuid(model_dir)}_{data_checksum(data_path)[:16]}")
+    return ShapStore(directory, ShapExplainer(pipeline), store)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_path", help="cleaned data CSV of the customers to explain")
+    parser.add_argument("--model-dir", default="/data/model", help="MLflow model directory")
+    args = parser.parse_args()
+    with open(os.path.join(args.model_dir, "model.pkl"), "rb") as file:
+        pipeline = pickle.load(file)
+    store = open_customer_store(args.data_path, list(pipeline.feature_names_in_))
+    shap_store = open_shap_store(args.model_dir, args.data_path, pipeline, store)
+    shap_store.fill()
+    print(f"SHAP values of {len(store)} customers written to {os.path.dirname(shap_store.shap_values.filename)}")
@@ -0,0 +1,69 @@
+# Synthetic customers generated from the MLmodel signature, for the tests and the benchmarks
+# (the real cleaned data is not in the repository). Every column of the signature is drawn
+# around the mean and the scale the pipeline scaler was fitted on, integers for the "long"
+# columns, with some missing values in the optional ones.
+#
+# Write a synthetic copy of the data and of the model next to each other:
+#   python -m common.synthetic_data /tmp/synthetic --rows 20000
+
+# Import libraries
+import argparse
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from common.feature_store import convert
+from common.mlmodel import read_signature_inputs
+
+# Model of the repository and files of an MLflow model directory needed by the API
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "model")
+MODEL_FILES = ["MLmodel", "model.pkl"]
+# Share of missing values in the optional columns
+MISSING_RATE = 0.1
+# First customer ID, the one used by the examples and the tests
+FIRST_ID = 231433
+
+# Dataframe of synthetic customers with the columns of the signature, in its order
+def make_synthetic_data(model_dir, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    inputs = read_signature_inputs(model_dir)
+    with open(os.path.join(model_dir, "model.pkl"), "rb") as file:
+        pipeline = pickle.load(file)
+    scaler = pipeline.named_steps["scaler"]
+    statistics = dict(zip(pipeline.feature_names_in_, zip(scaler.mean_, scaler.scale_)))
+    columns = {}
+    for column in inputs:
+        mean, scale = statistics[column["name"]]
+        values = rng.normal(mean, scale, n_rows)
+        if column["type"] == "long":
+            values = np.round(values)
+        if not column["required"]:
+            values[rng.random(n_rows) < MISSING_RATE] = np.nan
+        columns[column["name"]] = values
+    # Unique IDs starting with the example customer
+    columns["SK_ID_CURR"] = FIRST_ID + np.arange(n_rows) * 7
+    return pd.DataFrame(columns)
+
+# Copy the model into a directory and write synthetic data for it (CSV and converted matrix).
+# Returns the model directory and the data path, ready for MODEL_DIR and DATA_PATH.
+def write_synthetic_data(directory, n_rows, model_dir=MODEL_DIR, seed=0):
+    synthetic_model_dir = os.path.join(directory, "model")
+    os.makedirs(synthetic_model_dir, exist_ok=True)
+    for name in MODEL_FILES:
+        shutil.copy(os.path.join(model_dir, name), synthetic_model_dir)
+    data_path = os.path.join(directory, "cleaned_data.csv")
+    make_synthetic_data(synthetic_model_dir, n_rows, seed).to_csv(data_path, index=False)
+    convert(data_path, synthetic_model_dir)
+    return synthetic_model_dir, data_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", help="directory to write the model and the data in")
+    parser.add_argument("--rows", type=int, default=20000, help="number of customers")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="MLflow model directory to copy")
+    args = parser.parse_args()
+    model_dir, data_path = write_synthetic_data(args.directory, args.rows, args.model_dir)
+    print(f"{args.rows} synthetic customers written to {data_path} for the model in {model_dir}")
@@ -0,0 +1,112 @@
+# Client of the scoring API for the dashboard.
+# One keep-alive connection pool is shared by all the sessions, every call has a timeout and
+# is retried on connection errors, and the answers are kept in a bounded cache (LRU with a
+# time to live) which is emptied when the API starts answering with a model it didn't use before.
+# The calls never raise: a failure gives None and the reason, so the page can degrade.
+
+# Import libraries
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Address of the API and limits of the calls, overridable from the environment
+API_URL = os.environ.get("API_URL", "http://api:5001")
+API_CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", 2))
+API_READ_TIMEOUT = float(os.environ.get("API_READ_TIMEOUT", 10))
+API_RETRIES = int(os.environ.get("API_RETRIES", 2))
+API_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", 10))
+# Number of answers kept and how long they stay valid (seconds)
+API_CACHE_SIZE = int(os.environ.get("API_CACHE_SIZE", 512))
+API_CACHE_TTL = float(os.environ.get("API_CACHE_TTL", 600))
+
+# Header of the API responses holding the version of the model which answered
+MODEL_VERSION_HEADER = "X-Model-Version"
+
+class ApiClient:
+    def __init__(
+        self,
+        base_url=API_URL,
+        timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT),
+        retries=API_RETRIES,
+        pool_size=API_POOL_SIZE,
+        cache_size=API_CACHE_SIZE,
+        cache_ttl=API_CACHE_TTL
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # Keep-alive connections reused by every call, retried with a backoff when the API is unreachable
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.lock = threading.Lock()
+        self.model_version = None
+        # Versions of the models which answered since the start. With A/B routing the answers
+        # alternate between two versions, which only empties the cache the first time.
+        self.model_versions = set()
+
+    # Forget the cached answers when a new model answers behind the API. The answers of a
+    # version no longer served expire with their time to live.
+    def check_model_version(self, response):
+        model_version = response.headers.get(MODEL_VERSION_HEADER)
+        with self.lock:
+            if model_version is None:
+                return
+            if model_version not in self.model_versions:
+                if self.model_versions:
+                    self.cache.clear()
+                self.model_versions.add(model_version)
+            self.model_version = model_version
+
+    # JSON answer of a GET call and None, or None and the reason of the failure. The client is shared
+    # by the sessions, so the time of the call and the stages reported by the API (Server-Timing
+    # header) are written in the timings dict of the caller, by path.
+    def get(self, path, timings=None, **params):
+        key = (path, tuple(sorted(params.items())))
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key], None
+        start = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+        except requests.RequestException:
+            return None, "The API is unavailable for now. Please try again later !"
+        if timings is not None:
+            timings[path] = (time.perf_counter() - start, response.headers.get("Server-Timing", ""))
+        self.check_model_version(response)
+        # The API answers its errors with a text message
+        if response.status_code != 200:
+            return None, f"The API answered with an error ({response.status_code}). Please try again later !"
+        if response.text.startswith("Error"):
+            return None, response.text
+        data = response.json()
+        with self.lock:
+            self.cache[key] = data
+        return data, None
+
+    # Score of a customer
+    def score(self, customer_id, timings=None):
+        return self.get("/api/v1/customer", timings, id=customer_id)
+
+    # Main features explaining the score of a customer
+    def explain(self, customer_id, top=10, timings=None):
+        return self.get("/api/v1/customer/explain", timings, id=customer_id, top=top)
+
+    # Customers most similar to a customer
+    def neighbours(self, customer_id, k=20, timings=None):
+        return self.get("/api/v1/customer/neighbours", timings, id=customer_id, k=k)
+
+    # Score and explanations of a customer, asked at the same time
+    def score_and_explain(self, customer_id, top=10, timings=None):
+        score = self.executor.submit(self.score, customer_id, timings)
+        explanation = self.executor.submit(self.explain, customer_id, top, timings)
+        return score.result(), explanation.result()
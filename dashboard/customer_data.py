@@ -0,0 +1,24 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+
+# Main infos of a customer, read from the shared customer store
+CUSTOMER_COLUMNS = [
+    "CODE_GENDER",
+    "DAYS_BIRTH",
+    "CNT_CHILDREN",
+    "AMT_INCOME_TOTAL",
+    "AMT_CREDIT",
+    "AMT_ANNUITY",
+    "DAYS_EMPLOYED",
+    "FLAG_OWN_CAR",
+    "FLAG_OWN_REALTY"
+]
+
+# Once customer selected, get its main infos from the customer store.
+# Only these columns of its row are read, the shared data is never copied.
+def get_customer_data(store, customer_id):
+    customer_data = pd.Series(store.values_of(customer_id, CUSTOMER_COLUMNS), index=CUSTOMER_COLUMNS)
+    customer_data["AGE"] = np.round(-customer_data["DAYS_BIRTH"] / 365, 2)
+    customer_data["TIME_EMPLOYED"] = np.round(-customer_data["DAYS_EMPLOYED"] / 365, 2)
+    return customer_data.drop(["DAYS_BIRTH", "DAYS_EMPLOYED"])
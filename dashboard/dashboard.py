@@ -1,11 +1,17 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import requests
-import pickle
-import shap
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
+import os
+import time
+from contextlib import contextmanager
+from common.feature_store import data_checksum, open_customer_store
+from common.population_stats import PopulationStats, Histogram, DensityGrid
+from common.cohorts import CohortEngine, COHORT_FEATURES
+from common.customer_search import CustomerIndex, PAGE_SIZE
+from api_client import ApiClient
+from customer_data import get_customer_data
 
 # Page config
 st.set_page_config(page_title="Customer dashboard", layout="wide")
@@ -20,6 +26,11 @@ if "customer_id" not in st.session_state:
     st.session_state.customer_id = "231433"
 if "rerun" not in st.session_state:
     st.session_state.rerun = False
+if "picked_customer" not in st.session_state:
+    st.session_state.picked_customer = None
+# Time of the last calls of this session to the API, by path (the API client is shared by the sessions)
+if "api_timings" not in st.session_state:
+    st.session_state.api_timings = {}
 
 # Initialize temp variables for the form
 if "temp_font_size" not in st.session_state:
@@ -63,81 +74,65 @@ st.markdown(f"""
 st.title("Prêt à dépenser - Customer dashboard")
 
 ### UTILITY FUNCTIONS ###
-# Load the csv data and put it in cache
-@st.cache_data
-def load_data():
-    data = pd.read_csv(DATA_URL)
-    return data
-
-# Once customer selected, get its main infos from loaded data
-def get_customer_data(data, customer_id):
-    customer_data = data.loc[
-        data["SK_ID_CURR"]==customer_id,
-        [
-            "CODE_GENDER", 
-            "DAYS_BIRTH",
-            "CNT_CHILDREN",
-            "AMT_INCOME_TOTAL",
-            "AMT_CREDIT",
-            "AMT_ANNUITY",
-            "DAYS_EMPLOYED",
-            "FLAG_OWN_CAR",
-            "FLAG_OWN_REALTY"
-        ]
-    ]
-    customer_data["AGE"] = np.round(-customer_data["DAYS_BIRTH"] / 365, 2)
-    customer_data["TIME_EMPLOYED"] = np.round(-customer_data["DAYS_EMPLOYED"] / 365, 2)
-    customer_data = customer_data.drop(["DAYS_BIRTH", "DAYS_EMPLOYED"], axis=1)
-    return customer_data.iloc[0]
-
-# Load the model
-@st.cache_resource
-def load_model():
-    pkl_model = pickle.load(open(MODEL_PATH, "rb"))
-    return pkl_model
-
-# Extract scaler and model  from the pkl model
-@st.cache_resource
-def load_scaler_model(_pkl_model):
-    scaler = _pkl_model.named_steps["scaler"]
-    model = _pkl_model.named_steps["model"]
-    return scaler, model
-
-# Compute feature importance
-@st.cache_data
-def get_shap_values(_model, _scaler):
-    # Scale the data
-    data_transformed = _scaler.transform(data)
-    # Calculate the shap values
-    explainer = shap.TreeExplainer(_model)
-    shap_values = explainer.shap_values(data)
-    return shap_values
-
-# Compute global feature importance
-@st.cache_data
-def get_global_feature_importance(shap_values):
-    # First we get all values in absolute
-    shap_values_abs = np.abs(shap_values)
-    # Then when calculate the mean for each features
-    global_feature_importance = np.mean(shap_values_abs, axis=0)
-    global_feature_importance = pd.DataFrame(
-        global_feature_importance,
-        columns=["Global Importance"],
-        index=data.columns
-    ).reset_index(names="Feature")
-    return global_feature_importance
-
-# Return the local feature importance for a customer
-def get_local_feature_importance(shap_values, customer_index):
-    local_feature_importance = shap_values[customer_index]
-    local_feature_importance = pd.DataFrame(
-        local_feature_importance,
-        columns=["Local Importance"],
-        index=data.columns
-    ).reset_index(names="Feature")
-    return local_feature_importance
-
-@st.cache_data
+# Time spent in the steps of the page (seconds), shown in the sidebar when asked
+timings = {}
+@contextmanager
+def timed(step):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = time.perf_counter() - start
+
+# Checksum of the data, computed again only when the file changes (its size or its modification time)
+@st.cache_data(max_entries=1)
+def read_data_version(size, mtime_ns):
+    return data_checksum(DATA_URL)
+
+# Version of the data the resources below are loaded for: a new data file loads them again
+def get_data_version():
+    source = os.stat(DATA_URL)
+    return read_data_version(source.st_size, source.st_mtime_ns)
+
+# Load the data (memory-mapped when it was converted) and index the customers by ID, once per
+# data version for all the sessions
+@st.cache_resource(max_entries=1)
+def load_customer_store(data_version):
+    return open_customer_store(DATA_URL)
+
+# Histograms and density grids of the population, computed once per feature and data version for all the sessions
+@st.cache_resource(max_entries=1)
+def load_population_stats(data_version):
+    return PopulationStats(load_customer_store(data_version))
+
+# Bitmaps of the cohorts of customers, built once per data version for all the sessions
+@st.cache_resource(max_entries=1)
+def load_cohort_engine(data_version):
+    return CohortEngine(load_customer_store(data_version))
+
+# Sorted IDs of the customers for the search, once per data version for all the sessions
+@st.cache_resource(max_entries=1)
+def load_customer_index(data_version):
+    return CustomerIndex(load_customer_store(data_version).ids)
+
+# Read a search of customers: the first digits of an ID or a range of IDs like "231433-231500".
+# Returns the prefix, the bounds of the range, and whether the search is valid.
+def parse_customer_search(query):
+    query = query.replace(" ", "")
+    if "-" in query:
+        low, _, high = query.partition("-")
+        if low.isascii() and low.isdigit() and high.isascii() and high.isdigit():
+            return "", int(low), int(high), True
+        return "", None, None, False
+    if query == "" or (query.isascii() and query.isdigit()):
+        return query, None, None, True
+    return "", None, None, False
+
+# Go back to the first page of results when the search changes
+def on_customer_search_change():
+    st.session_state.customer_page = 1
+
+# Tables of the customer infos, cheap enough to build at each run (caching them would hash the infos at each call)
 def arrange_customer_data(customer_data):
     # Create a list of features to add to the returned dataframe
     general_attributes_list = [
@@ -151,7 +146,7 @@ def arrange_customer_data(customer_data):
     else :
         gender = "Woman"
     age = f"{customer_data["AGE"]} years old."
-    childrens = f"{customer_data["CNT_CHILDREN"]} childrens."
+    childrens = f"{int(customer_data["CNT_CHILDREN"])} childrens."
     employed = f"{customer_data["TIME_EMPLOYED"]} years."
     if customer_data["FLAG_OWN_CAR"] == 0 :
         car = f"Does not own a car."
@@ -162,8 +157,8 @@ def arrange_customer_data(customer_data):
     else :
         realty = f"Owns real estate."
     credit = customer_data["AMT_CREDIT"]
-    # Create a list with the values
-    general_values_list = [gender, age, childrens, employed, car, realty, credit]
+    # Create a list with the values (all text, so the table converts to Arrow without a fix at each run)
+    general_values_list = [gender, age, childrens, employed, car, realty, str(credit)]
     # Create the dataframe
     general_data = pd.DataFrame.from_dict({
         "Attributes": general_attributes_list,
@@ -185,69 +180,91 @@ def arrange_customer_data(customer_data):
 
     return general_data, financial_data
 
-@st.cache_data
-def get_main_important_features(local_feature_importance, global_feature_importance):
-    # Get 10 most important positive features
-    positive_important_features = local_feature_importance.loc[
-         local_feature_importance["Local Importance"] > 0, :
-    ].sort_values(by="Local Importance", ascending=False, key=abs).head(10)
-    # Get 10 most important negative features
-    negative_important_features = local_feature_importance.loc[
-         local_feature_importance["Local Importance"] < 0, :
-    ].sort_values(by="Local Importance", ascending=False, key=abs).head(10)
-
-    # Add global importance
-    positive_important_features = positive_important_features.merge(global_feature_importance)
-    negative_important_features = negative_important_features.merge(global_feature_importance)
-
-    # Put everything in absolute value
-    positive_important_features["Local Importance"] = np.abs(positive_important_features["Local Importance"])
-    negative_important_features["Local Importance"] = np.abs(negative_important_features["Local Importance"])
-
-    return positive_important_features, negative_important_features
-
-@st.cache_data
-def get_scoring_data(customer_id):
-    response = requests.get(f"http://api:5001/api/v1/customer?id={customer_id}")
-    # Check that we got a valid answer from the API
-    if response.status_code == 200:
-        response_data = response.json()
-        return response_data
-    else :
-        st.error("Invalid customer ID or error from API")
+# Vertical line with its text at the top right, like fig.add_vline which is much slower
+# (it goes through every axis of the figure at each call)
+def add_vertical_line(fig, x, color, text):
+    fig.add_shape(type="line", x0=x, x1=x, y0=0, y1=1, xref="x", yref="paper", line_color=color)
+    fig.add_annotation(x=x, y=1, xref="x", yref="paper", text=text, showarrow=False, xanchor="left", yanchor="top")
+
+# Client of the API (connection pool and cache of the answers), shared by all the sessions
+@st.cache_resource
+def load_api_client():
+    return ApiClient()
+
+# Get the score and the main features explaining it from the API, at the same time.
+# Each part is None when the API could not give it, with an error shown instead
+def get_scoring_and_explanation_data(customer_id):
+    (response_data, score_error), (explanation_data, explanation_error) = api_client.score_and_explain(
+        customer_id, top=10, timings=st.session_state.api_timings
+    )
+    if score_error is not None:
+        st.error(score_error)
+    if explanation_error is not None:
+        if explanation_error != score_error:
+            st.error(explanation_error)
+        return response_data, None, None, None
+    columns = ["Feature", "Local Importance", "Global Importance"]
+    positive_important_features = pd.DataFrame(explanation_data["Most positive features"], columns=columns)
+    negative_important_features = pd.DataFrame(explanation_data["Most negative features"], columns=columns)
+    return response_data, positive_important_features, negative_important_features, explanation_data
+
+# Get the customers most similar to the customer from the API, None if the API can't answer
+def get_neighbours_data(customer_id, k=20):
+    neighbours_data, error = api_client.neighbours(customer_id, k, timings=st.session_state.api_timings)
+    if error is not None:
+        st.error(error)
+        return None
+    return [neighbour["SK_ID_CURR"] for neighbour in neighbours_data["Neighbours"]]
 
 ### UTILITY FUNCTIONS ###
 
 ### DATA LOADING ###
 # Set data path
-DATA_URL = ("/data/cleaned_data/test_data_cleaned.csv")
-# Set model path
-MODEL_PATH = ("/data/model/model.pkl")
+DATA_URL = os.environ.get("DATA_PATH", "/data/cleaned_data/test_data_cleaned.csv")
 # Set columns description path
 COLUMNS_URL = ("/data/columns/HomeCredit_columns_description.csv")
 
 # Create a text element and let the reader know the data is loading.
 data_load_state = st.text('Loading data...')
-# Load data into the dataframe.
-data = load_data()
-# Load the model
-pkl_model = load_model()
-# Extract scaler and model
-scaler, model = load_scaler_model(pkl_model)
-# Get shap values
-shap_values = get_shap_values(model, scaler)
-# Get the global feature importance
-global_feature_importance = get_global_feature_importance(shap_values)
+# Load data into the customer store, shared read-only by all the sessions: the runs only read
+# slices of it (a customer, a column), never a copy of the whole data.
+with timed("Data loading"):
+    data_version = get_data_version()
+    store = load_customer_store(data_version)
+    population_stats = load_population_stats(data_version)
+    cohort_engine = load_cohort_engine(data_version)
+    api_client = load_api_client()
+    customer_index = load_customer_index(data_version)
 
 # Notify the reader that the data was successfully loaded.
 data_load_state.text('Loading data...done!')
 ### DATA LOADING ###
 
+# Search the customers: only a page of the matching IDs is sent to the browser, whatever the
+# number of customers
+st.write("Selection of the customer")
+query = st.text_input(
+    "Search a customer by the first digits of its ID, or a range of IDs like 231433-231500",
+    key="customer_query",
+    on_change=on_customer_search_change
+)
+prefix, low, high, valid_search = parse_customer_search(query)
+if not valid_search:
+    st.warning("The search should be the first digits of a customer ID, or two IDs separated by a dash.")
+total = customer_index.search(prefix, low, high, limit=0)[1]
+n_pages = max(-(-total // PAGE_SIZE), 1)
+page = st.number_input("Page of the results", min_value=1, max_value=n_pages, step=1, key="customer_page") if n_pages > 1 else 1
+customer_ids = customer_index.search(prefix, low, high, offset=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE)[0]
+st.caption(f"{total} customers found")
+
 # Create the form where the user have to select the customer ID
 with st.form("customer_selection_form"):
-    st.write("Selection of the customer")
-    customer_id = st.selectbox("Pick a customer", data["SK_ID_CURR"])
-    submit = st.form_submit_button("Get score for this customer")
+    picked_customer = st.selectbox("Pick a customer", customer_ids)
+    submit = st.form_submit_button("Get score for this customer", disabled=picked_customer is None)
+# The customer only changes when the form is sent, not when the search shows other customers
+if submit:
+    st.session_state.picked_customer = picked_customer
+customer_id = st.session_state.picked_customer
 
 # Initialize tabs if the customer has not changed
 if st.session_state.customer_id == customer_id:
@@ -265,19 +282,32 @@ if submit or st.session_state.rerun:
         st.session_state.customer_id = customer_id
 
     # Get customer data
-    customer_data = get_customer_data(data, st.session_state.customer_id)
-    customer_index = data.loc[data["SK_ID_CURR"] == st.session_state.customer_id, :].index[0]
-    local_feature_importance = get_local_feature_importance(shap_values, customer_index)
-    # Arrange customer data to display it
-    general_data, financial_data = arrange_customer_data(customer_data)
-
-    # Get main features by importance
-    positive_important_features, negative_important_features = get_main_important_features(
-        local_feature_importance, global_feature_importance
-    )
+    with timed("Customer data"):
+        customer_data = get_customer_data(store, st.session_state.customer_id)
+        # Arrange customer data to display it
+        general_data, financial_data = arrange_customer_data(customer_data)
+
+    # Get the score and the main features by importance from the API
+    with timed("API score and explanations"):
+        response_data, positive_important_features, negative_important_features, explanation_data = get_scoring_and_explanation_data(
+            st.session_state.customer_id
+        )
+
+    # Get the most similar customers from the API when asked, to compare the customer with them in the analysis tabs
+    show_neighbours = st.sidebar.checkbox("Compare with similar customers", key="show_neighbours")
+    with timed("API similar customers"):
+        neighbour_ids = get_neighbours_data(st.session_state.customer_id) if show_neighbours else None
 
-    # Get data from the API
-    response_data = get_scoring_data(st.session_state.customer_id)
+    # Get the cohort of the customers sharing some characteristics of the customer, to compare the customer with them
+    cohort_features = st.sidebar.multiselect(
+        "Compare with the customers having the same",
+        COHORT_FEATURES,
+        key="cohort_features"
+    )
+    with timed("Cohort selection"):
+        cohort_filters = cohort_engine.customer_filters(st.session_state.customer_id, cohort_features)
+        cohort_positions = cohort_engine.positions(cohort_filters) if cohort_filters else None
+    cohort_name = "the population" if cohort_positions is None else f"the {len(cohort_positions)} customers with the same {', '.join(cohort_filters)}"
 
     # In the first tab, we display the customer data
     with tab1:
@@ -292,48 +322,57 @@ if submit or st.session_state.rerun:
             y=financial_data["Attributes"],
             orientation="h"
         ))
-        fig.add_vline(
+        add_vertical_line(
+            fig,
             x=financial_data.loc[
                 financial_data["Attributes"] == "Income",
                 "Values"
             ].iloc[0] * 0.33,
-            line_color="red",
-            annotation_text="Max. debt ratio"
+            color="red",
+            text="Max. debt ratio"
         )
         st.plotly_chart(fig)
     # In the second tab we display the response of the model
     with tab2:
         st.header("Credit response")
-        score = response_data["Probability of the customer being a good one"]
-        st.progress(score, f"Probability of the customer being a good one : {np.round(score*100, 1)} %")
+        # The page stays usable without the API, only the answers of the model are missing
+        if response_data is None:
+            st.warning("The credit response is unavailable for now.")
+        else:
+            score = response_data["Probability of the customer being a good one"]
+            st.progress(score, f"Probability of the customer being a good one : {np.round(score*100, 1)} %")
         st.markdown("######")
 
-        with st.expander("See score explanations"):
-            st.subheader("Most positive features")
-            st.dataframe(
-               positive_important_features,
-               hide_index=True
-            )
-            st.subheader("Most negative features")
-            st.dataframe(
-                negative_important_features,
-                hide_index=True
-            )
-
-            # Add explanations about table displayed
-            st.markdown("""
-            **Notes :**
-            - The above tables are displaying which features of the customer are the most impacting its score.
-            - **Local importance** are the score obtained by the customer.
-            - It is compared to the **global importance** which is the mean of the score of every customers.
-            """)
+        if explanation_data is not None:
+            with st.expander("See score explanations"):
+                st.subheader("Most positive features")
+                st.dataframe(
+                   positive_important_features,
+                   hide_index=True
+                )
+                st.subheader("Most negative features")
+                st.dataframe(
+                    negative_important_features,
+                    hide_index=True
+                )
+
+                # Add explanations about table displayed
+                st.markdown("""
+                **Notes :**
+                - The above tables are displaying which features of the customer are the most impacting its score.
+                - **Local importance** are the score obtained by the customer.
+                - It is compared to the **global importance** which is the mean of the score of every customers.
+                """)
+                completion = explanation_data["Share of the customers in the global importance"]
+                if completion < 1:
+                    st.caption(f"Global importance computed on {np.round(completion*100, 1)} % of the customers so far.")
     # In the third tab, we display univariate analysis of a feature
     with tab3:
         st.header("Analyze a feature")
 
         # Create a session state variable to store the feature to analyze
         if "selected_feature" not in st.session_state:
-            st.session_state.selected_feature = data.columns[1]
+            st.session_state.selected_feature = store.features[1]
         if "selected_feature_tmp" not in st.session_state:
             st.session_state.selected_feature_tmp = st.session_state.selected_feature
 
@@ -343,52 +382,75 @@ if submit or st.session_state.rerun:
 
         st.selectbox(
             "Which feature do you want to analyze ?",
-            data.columns.tolist(),
+            store.features,
             key="selected_feature_tmp",
-            index=data.columns.get_loc(st.session_state.selected_feature),
+            index=store.feature_positions[st.session_state.selected_feature],
             placeholder="Select the feature from the list above",
             on_change=on_feature_change
         )
         st.session_state.rerun = True
 
         # Plot the histogram
-        st.write(f"Analysis of the {st.session_state.selected_feature} feature for our customer compared to the population")
+        st.write(f"Analysis of the {st.session_state.selected_feature} feature for our customer compared to {cohort_name}")
         # Create the plotly figure
         fig = go.Figure()
-        # Create the histogram for all the population
+        # Create the histogram for all the population from the precomputed bins, or for the cohort
+        if cohort_positions is None:
+            histogram = population_stats.histogram(st.session_state.selected_feature)
+        else:
+            histogram = Histogram(cohort_engine.column(st.session_state.selected_feature)[cohort_positions])
         fig.add_trace(
-            go.Histogram(
-                x=data[st.session_state.selected_feature]
+            go.Bar(
+                x=(histogram.edges[1:] + histogram.edges[:-1]) / 2,
+                y=histogram.density(),
+                width=np.diff(histogram.edges),
+                customdata=histogram.counts,
+                hovertemplate="%{customdata} customers<extra></extra>",
+                name="Population" if cohort_positions is None else "Cohort"
             )
         )
+        # Show where the most similar customers stand
+        if show_neighbours and neighbour_ids:
+            fig.add_trace(
+                go.Scatter(
+                    x=[store.value(neighbour_id, st.session_state.selected_feature) for neighbour_id in neighbour_ids],
+                    y=np.zeros(len(neighbour_ids)),
+                    mode="markers",
+                    name="Similar customers",
+                    marker={"color": "orange", "symbol": "line-ns-open", "size": 16}
+                )
+            )
         # Create a line for our customer
-        client_value = data.loc[
-            data["SK_ID_CURR"] == st.session_state.customer_id,
-            st.session_state.selected_feature
-        ].iloc[0]
-        fig.add_vline(
+        client_value = store.value(st.session_state.customer_id, st.session_state.selected_feature)
+        add_vertical_line(
+            fig,
             x=client_value,
-            line_color="red",
-            annotation_text=f"Customer {st.session_state.customer_id}"
+            color="red",
+            text=f"Customer {st.session_state.customer_id}"
         )
         # Decoration of the plot
         fig.update_layout(
             xaxis_title=f"{st.session_state.selected_feature}",
-            yaxis_title="Number of customers"
+            yaxis_title="Customers per unit of the feature",
+            bargap=0
         )
         # Plot everything in streamlit
         st.plotly_chart(fig)
+        # Rank of the customer among the customers compared
+        rank = cohort_engine.percentile_rank(cohort_filters, st.session_state.selected_feature, client_value)
+        if rank is not None:
+            st.write(f"The customer is above {np.round(rank, 1)} % of {cohort_name} for this feature.")
     # For the fourth tab, we display bivariate analysis of features
     with tab4:
         st.header("Analyze two features")
 
         # Create a session state variable to store the feature to analyze
         if "selected_feature1" not in st.session_state:
-            st.session_state.selected_feature1 = data.columns[1]
+            st.session_state.selected_feature1 = store.features[1]
         if "selected_feature_tmp1" not in st.session_state:
             st.session_state.selected_feature_tmp1 = st.session_state.selected_feature1
         if "selected_feature2" not in st.session_state:
-            st.session_state.selected_feature2 = data.columns[2]
+            st.session_state.selected_feature2 = store.features[2]
         if "selected_feature_tmp2" not in st.session_state:
             st.session_state.selected_feature_tmp2 = st.session_state.selected_feature2
 
@@ -400,9 +462,9 @@ if submit or st.session_state.rerun:
 
         st.selectbox(
             "Which is the first feature you want to plot ?",
-            data.columns.tolist(),
+            store.features,
             key="selected_feature_tmp1",
-            index=data.columns.get_loc(st.session_state.selected_feature1),
+            index=store.feature_positions[st.session_state.selected_feature1],
             placeholder="Select the feature from the list above",
             on_change=on_feature1_change
         )
@@ -410,35 +472,52 @@ if submit or st.session_state.rerun:
 
         st.selectbox(
             "Which is the second feature you want to plot ?",
-            data.columns.tolist(),
+            store.features,
             key="selected_feature_tmp2",
-            index=data.columns.get_loc(st.session_state.selected_feature2),
+            index=store.feature_positions[st.session_state.selected_feature2],
             placeholder="Select the feature from the list above",
             on_change=on_feature2_change
         )
         st.session_state.rerun = True
 
         # Plot the histogram
-        st.write(f"Analysis of the {st.session_state.selected_feature1} feature vs the {st.session_state.selected_feature2} feature comparing our customer and the population")
+        st.write(f"Analysis of the {st.session_state.selected_feature1} feature vs the {st.session_state.selected_feature2} feature comparing our customer and {cohort_name}")
         # Create the plotly figure
         fig = go.Figure()
-        # Create the histogram for all the population
+        # Create the density grid of the population from the precomputed counts, or of the cohort
+        if cohort_positions is None:
+            grid = population_stats.density(st.session_state.selected_feature1, st.session_state.selected_feature2)
+        else:
+            grid = DensityGrid(
+                cohort_engine.column(st.session_state.selected_feature1)[cohort_positions],
+                cohort_engine.column(st.session_state.selected_feature2)[cohort_positions]
+            )
+        # Customers per unit of area, the quantile cells having different sizes, and their number in the hover
         fig.add_trace(
-            go.Scatter(
-                x=data[st.session_state.selected_feature1],
-                y=data[st.session_state.selected_feature2],
-                mode="markers"
+            go.Heatmap(
+                x=grid.x_edges,
+                y=grid.y_edges,
+                z=grid.density().T,
+                customdata=grid.counts.T,
+                colorscale="Viridis",
+                colorbar={"title": "Density of customers"},
+                hovertemplate="%{customdata} customers<extra></extra>"
             )
         )
+        # Show where the most similar customers stand
+        if show_neighbours and neighbour_ids:
+            fig.add_trace(
+                go.Scatter(
+                    x=[store.value(neighbour_id, st.session_state.selected_feature1) for neighbour_id in neighbour_ids],
+                    y=[store.value(neighbour_id, st.session_state.selected_feature2) for neighbour_id in neighbour_ids],
+                    mode="markers",
+                    name="Similar customers",
+                    marker={"color": "orange", "symbol": "diamond", "size": 7}
+                )
+            )
         # Create a point for our customer
-        client_value1 = data.loc[
-            data["SK_ID_CURR"] == st.session_state.customer_id,
-            st.session_state.selected_feature1
-        ].iloc[0]
-        client_value2 = data.loc[
-            data["SK_ID_CURR"] == st.session_state.customer_id,
-            st.session_state.selected_feature2
-        ].iloc[0]
+        client_value1 = store.value(st.session_state.customer_id, st.session_state.selected_feature1)
+        client_value2 = store.value(st.session_state.customer_id, st.session_state.selected_feature2)
         fig.add_trace(
             go.Scatter(
                 x=[client_value1],
@@ -452,5 +531,25 @@ if submit or st.session_state.rerun:
                 }
             )
         )
+        # Decoration of the plot
+        fig.update_layout(
+            xaxis_title=f"{st.session_state.selected_feature1}",
+            yaxis_title=f"{st.session_state.selected_feature2}"
+        )
         # Plot everything in streamlit
         st.plotly_chart(fig)
+
+# Show where the time of the page went, with the stages of the last calls of this session to the API
+if st.sidebar.checkbox("Show timings", key="show_timings"):
+    st.sidebar.dataframe(
+        pd.DataFrame({"Step": list(timings), "Time (ms)": np.round(np.array(list(timings.values())) * 1000, 2)}),
+        hide_index=True
+    )
+    if st.session_state.api_timings:
+        st.sidebar.dataframe(
+            pd.DataFrame(
+                [(path, np.round(elapsed * 1000, 2), server_timing) for path, (elapsed, server_timing) in st.session_state.api_timings.items()],
+                columns=["API call", "Time (ms)", "API stages"]
+            ),
+            hide_index=True
+        )
@@ -0,0 +1,44 @@
+# Shared fixtures: the API imported in-process on synthetic customers generated from the
+# MLmodel signature, so the tests need neither the real data nor a running container.
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# Number of synthetic customers
+N_ROWS = 2000
+# Token of the admin endpoints in the tests
+ADMIN_TOKEN = "test-token"
+
+@pytest.fixture(scope="session")
+def api_module(tmp_path_factory):
+    for module in ["flask", "lightgbm", "imblearn", "shap", "prometheus_client"]:
+        pytest.importorskip(module)
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / "api"))
+    from common.synthetic_data import write_synthetic_data
+    model_dir, data_path = write_synthetic_data(str(tmp_path_factory.mktemp("synthetic")), N_ROWS)
+    # The API reads its paths when it is imported
+    os.environ["MODEL_DIR"] = model_dir
+    os.environ["DATA_PATH"] = data_path
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    import api
+    return api
+
+# Flask test client of the API
+@pytest.fixture(scope="session")
+def client(api_module):
+    return api_module.app.test_client()
+
+# The API served on a free local port, for the tests going through HTTP
+@pytest.fixture(scope="session")
+def api_server(api_module):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, api_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
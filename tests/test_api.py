@@ -1,41 +1,180 @@
-import requests
+import json
 import time
 
-api_url = f"http://localhost:5001/api/v1/customer"
-
-# Waiting for the API to be ready before starting tests
-def wait_for_api(url, timeout=300):
-    print("Waiting API to restart!")
-    start_time = time.time()
-    while True:
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                print("API is ready!")
-                return
-        except requests.exceptions.ConnectionError:
-            pass  # API is not ready yet
-        if time.time() - start_time > timeout:
-            raise TimeoutError(f"API not available after {timeout} seconds")
-        time.sleep(2)  # Retry every 2 seconds
-
-# Before lauching tests we use th e wait function
-wait_for_api(api_url + "?id=231433")
-
-def test_api_valid_customer():
-    response = requests.get(f"{api_url}?id=231433")
-    assert response.status_code == 200
-    json_data = response.json()
+# The API runs in-process on synthetic customers (see conftest.py), 231433 is the first of them
+api_url = "/api/v1/customer"
+score_url = "/api/v1/score"
+
+def test_api_valid_customer(client):
+    response = client.get(f"{api_url}?id=231433")
+    assert response.status_code == 200
+    json_data = response.json
     assert "Probability of the customer being a good one" in json_data
     assert "Probability of the customer being a bad one" in json_data
     assert "Result of the analysis" in json_data
 
-def test_api_no_id():
-    response = requests.get(api_url)
+def test_api_no_id(client):
+    response = client.get(api_url)
+    assert response.status_code == 200
+    assert "Error" in response.text
+
+def test_api_invalid_id(client):
+    response = client.get(f"{api_url}?id=0")
+    assert response.status_code == 200
+    assert "Error" in response.text
+
+def test_api_batch_scoring(client):
+    response = client.post(f"{api_url}s/score", json={"ids": [231433, 0, "abc"]})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["SK_ID_CURR"] == 231433
+    assert "Probability of the customer being a good one" in lines[0]
+    assert "Error" in lines[1]
+    assert "Error" in lines[2]
+
+def test_api_batch_rows(client):
+    response = client.post(f"{api_url}s/score", json={"rows": [{"SK_ID_CURR": 1}]})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["row"] == 0
+    assert "Error" in lines[0]
+
+def test_api_batch_no_body(client):
+    response = client.post(f"{api_url}s/score")
+    assert response.status_code == 200
+    assert "Error" in response.text
+
+def test_api_explain(client):
+    response = client.get(f"{api_url}/explain?id=231433&top=5")
+    assert response.status_code == 200
+    json_data = response.json
+    assert json_data["SK_ID_CURR"] == 231433
+    assert len(json_data["Most positive features"]) <= 5
+    assert len(json_data["Most negative features"]) <= 5
+    for feature in json_data["Most positive features"] + json_data["Most negative features"]:
+        assert set(feature) == {"Feature", "Local Importance", "Global Importance"}
+
+def test_api_explain_bad_top(client):
+    for top in ["-1", "0", "100000", "abc"]:
+        response = client.get(f"{api_url}/explain?id=231433&top={top}")
+        assert response.text.startswith("Error")
+        assert "top" in response.text
+
+def test_api_explain_invalid_id(client):
+    response = client.get(f"{api_url}/explain?id=0")
+    assert response.status_code == 200
+    assert "Error" in response.text
+
+def test_api_score_override(client):
+    response = client.post(score_url, json={"id": 231433, "features": {"AMT_CREDIT": 500000}})
+    assert response.status_code == 200
+    json_data = response.json
+    assert json_data["SK_ID_CURR"] == 231433
+    assert "Probability of the customer being a good one" in json_data
+
+def test_api_score_sweep(client):
+    response = client.post(score_url, json={"id": 231433, "sweep": {"AMT_CREDIT": {"start": 100000, "stop": 1000000, "num": 10}}})
+    assert response.status_code == 200
+    sweep = response.json["Sweep"]
+    assert len(sweep) == 10
+    assert sweep[0]["AMT_CREDIT"] == 100000
+    assert "Probability of the customer being a good one" in sweep[0]
+
+def test_api_score_sweep_too_big(client):
+    # Rejected before the values are built: neither the time nor the memory grow with num
+    for spec in [{"start": 0, "stop": 1, "num": 10 ** 12}, list(range(20000))]:
+        start = time.perf_counter()
+        response = client.post(score_url, json={"id": 231433, "sweep": {"AMT_CREDIT": spec}})
+        assert response.text.startswith("Error")
+        assert "points" in response.text
+        assert time.perf_counter() - start < 1
+
+def test_api_score_invalid_value(client):
+    response = client.post(score_url, json={"id": 231433, "features": {"AMT_CREDIT": "abc"}})
+    assert response.status_code == 200
+    assert "Error" in response.text
+
+def test_api_score_missing_features(client):
+    response = client.post(score_url, json={"features": {"AMT_CREDIT": 500000}})
+    assert response.status_code == 200
+    assert "Error" in response.text
+
+def test_api_neighbours(client):
+    response = client.get(f"{api_url}/neighbours?id=231433&k=5")
+    assert response.status_code == 200
+    json_data = response.json
+    assert json_data["SK_ID_CURR"] == 231433
+    neighbours = json_data["Neighbours"]
+    assert len(neighbours) == 5
+    assert all(neighbour["SK_ID_CURR"] != 231433 for neighbour in neighbours)
+    distances = [neighbour["Distance"] for neighbour in neighbours]
+    assert distances == sorted(distances)
+    assert "Probability of the customer being a good one" in neighbours[0]
+
+def test_api_neighbours_invalid_k(client):
+    response = client.get(f"{api_url}/neighbours?id=231433&k=0")
     assert response.status_code == 200
     assert "Error" in response.text
 
-def test_api_invalid_id():
-    response = requests.get(f"{api_url}?id=0")
+def test_api_metrics(client):
+    response = client.get(f"{api_url}?id=231433")
+    assert "lookup;dur=" in response.headers["Server-Timing"]
+    client.get(f"{api_url}?id=0")
+    response = client.get("/metrics")
     assert response.status_code == 200
-    assert "Error" in response.text
\ No newline at end of file
+    counters = [line for line in response.text.splitlines() if line.startswith("api_requests_total{")]
+    for outcome in ["success", "bad_id"]:
+        assert any('endpoint="api_id"' in line and f'outcome="{outcome}"' in line for line in counters)
+    assert 'api_stage_seconds_bucket{endpoint="api_id"' in response.text
+
+def test_streamed_answer_timed_until_closed(client, api_module, monkeypatch):
+    import metrics
+    observed = []
+
+    # Histogram remembering the times observed
+    class Histogram:
+        def labels(self, *labels):
+            return self
+
+        def observe(self, seconds):
+            observed.append(seconds)
+
+    monkeypatch.setattr(metrics, "REQUEST_SECONDS", Histogram())
+    model = api_module.registry.active
+    score_values = model.score_values
+
+    # Each row scored takes some time after the first line is sent
+    def slow_score_values(values):
+        time.sleep(0.05)
+        return score_values(values)
+
+    monkeypatch.setattr(model, "score_values", slow_score_values)
+    rows = [{"SK_ID_CURR": 1, "AMT_CREDIT": 1000}] * 3
+    response = client.post(f"{api_url}s/score", json={"ids": [231433], "rows": rows}, buffered=False)
+    lines = response.get_data().splitlines()
+    assert len(lines) == 4
+    assert observed == []
+    response.close()
+    assert len(observed) == 1
+    assert observed[0] >= 0.05
+
+def test_api_search(client):
+    response = client.get(f"{api_url}s/search?q=2314&limit=5")
+    assert response.status_code == 200
+    json_data = response.json
+    assert json_data["Customers"][0] == 231433
+    assert len(json_data["Customers"]) == 5
+    assert all(str(customer_id).startswith("2314") for customer_id in json_data["Customers"])
+    assert json_data["Total"] >= 5
+    # Next page
+    next_page = client.get(f"{api_url}s/search?q=2314&limit=5&offset=5").json
+    assert next_page["Customers"][0] > json_data["Customers"][-1]
+    # Range of IDs
+    json_data = client.get(f"{api_url}s/search?min=231433&max=231447").json
+    assert json_data["Customers"] == [231433, 231440, 231447]
+
+def test_api_search_invalid(client):
+    assert "Error" in client.get(f"{api_url}s/search?q=abc").text
+    assert "Error" in client.get(f"{api_url}s/search?limit=0").text
+    assert "Error" in client.get(f"{api_url}s/search?min=x").text
@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("cachetools")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "dashboard"))
+from api_client import ApiClient
+
+def test_client_score_and_explain(api_server):
+    client = ApiClient(api_server)
+    (score, score_error), (explanation, explanation_error) = client.score_and_explain(231433, top=5)
+    assert score_error is None and explanation_error is None
+    assert "Probability of the customer being a good one" in score
+    assert explanation["SK_ID_CURR"] == 231433
+    assert client.model_version is not None
+    # The second call is answered by the cache
+    assert client.score(231433)[0] is score
+
+def test_client_bad_id(api_server):
+    data, error = ApiClient(api_server).score(0)
+    assert data is None
+    assert "Error" in error
+
+def test_client_api_down():
+    data, error = ApiClient("http://localhost:9", timeout=(0.5, 0.5), retries=0).score(231433)
+    assert data is None
+    assert "unavailable" in error
+
+# Response of the API with only its model version
+class VersionResponse:
+    def __init__(self, model_version):
+        self.headers = {"X-Model-Version": model_version}
+
+def test_cache_kept_while_ab_versions_alternate():
+    client = ApiClient("http://localhost:9")
+    client.check_model_version(VersionResponse("active"))
+    client.cache["answer"] = 1
+    # The candidate answers for the first time
+    client.check_model_version(VersionResponse("candidate"))
+    assert "answer" not in client.cache
+    client.cache["answer"] = 2
+    # The customers alternate between the two models of the A/B routing
+    for model_version in ["active", "candidate", "active"]:
+        client.check_model_version(VersionResponse(model_version))
+        assert client.cache["answer"] == 2
+    assert client.model_version == "active"
+    # A new model is deployed
+    client.check_model_version(VersionResponse("new"))
+    assert "answer" not in client.cache
+
+def test_timings_written_for_the_caller_only(api_server):
+    client = ApiClient(api_server)
+    first, second = {}, {}
+    client.score_and_explain(231440, top=5, timings=first)
+    client.neighbours(231440, 5, timings=second)
+    # Each session only sees the time of its own calls
+    assert set(first) == {"/api/v1/customer", "/api/v1/customer/explain"}
+    assert set(second) == {"/api/v1/customer/neighbours"}
+    elapsed, server_timing = first["/api/v1/customer"]
+    assert elapsed > 0
+    assert "lookup;dur=" in server_timing
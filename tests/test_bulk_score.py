@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+pytest.importorskip("lightgbm")
+pytest.importorskip("imblearn")
+from common.bulk_score import bulk_score
+from common.mlmodel import load_pipeline
+from common.synthetic_data import MODEL_DIR, make_synthetic_data
+
+# Number of synthetic customers, scored in several chunks
+N_ROWS = 1000
+CHUNK_SIZE = 150
+
+@pytest.fixture(scope="module")
+def customers():
+    data = make_synthetic_data(MODEL_DIR, N_ROWS)
+    # A customer missing a required feature can't be scored
+    _, _, signature = load_pipeline(MODEL_DIR)
+    required = [name for name, column in signature.items() if column["required"] and name != "SK_ID_CURR"]
+    data.loc[3, required[0]] = np.nan
+    # Nor a customer without an ID
+    data.loc[7, "SK_ID_CURR"] = np.nan
+    return data
+
+# Probabilities of the pipeline on the whole dataframe at once
+def expected_probabilities(data):
+    pipeline, features, _ = load_pipeline(MODEL_DIR)
+    return pipeline.predict_proba(data[features])[:, 1]
+
+@pytest.mark.parametrize("input_name, output_name, workers", [
+    ("customers.csv", "scores.parquet", 1),
+    ("customers.csv", "scores.csv", 2),
+    ("customers.parquet", "scores.parquet", 2),
+])
+def test_bulk_score_matches_the_pipeline(customers, tmp_path, input_name, output_name, workers):
+    input_path = tmp_path / input_name
+    if input_name.endswith(".csv"):
+        customers.to_csv(input_path, index=False)
+    else:
+        customers.to_parquet(input_path, index=False, row_group_size=CHUNK_SIZE)
+    output_path = tmp_path / output_name
+    assert bulk_score(str(input_path), str(output_path), MODEL_DIR, reasons=2, workers=workers, chunk_size=CHUNK_SIZE) == N_ROWS
+
+    scores = pd.read_parquet(output_path) if output_name.endswith(".parquet") else pd.read_csv(output_path)
+    # Same customers in the same order, the missing ID left empty
+    assert scores["SK_ID_CURR"].astype("Int64").tolist() == customers["SK_ID_CURR"].astype("Int64").tolist()
+    assert pd.isna(scores.loc[7, "SK_ID_CURR"])
+    expected = expected_probabilities(customers.drop(index=[3, 7]))
+    scored = scores.drop(index=[3, 7])
+    assert np.allclose(scored["probability_bad"], expected)
+    assert (scored["prediction"] == (scored["probability_bad"] > scored["probability_good"])).all()
+    assert scored["reason_1"].notna().any()
+    impacts = scored[["reason_1_impact", "reason_2_impact"]].dropna()
+    assert (impacts["reason_1_impact"] >= impacts["reason_2_impact"]).all()
+    # The customer missing a required feature is reported, not scored
+    assert np.isnan(scores.loc[3, "probability_bad"])
+    assert scores.loc[3, "error"] == "Missing required features"
+    assert np.isnan(scores.loc[7, "probability_bad"])
+    assert scores.loc[7, "error"] == "Missing customer ID"
+    assert scored["error"].isna().all()
+
+def test_bulk_score_needs_the_signature_columns(customers, tmp_path):
+    input_path = tmp_path / "customers.csv"
+    customers.drop(columns=["AMT_CREDIT"]).to_csv(input_path, index=False)
+    with pytest.raises(ValueError, match="AMT_CREDIT"):
+        bulk_score(str(input_path), str(tmp_path / "scores.csv"), MODEL_DIR)
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("cachetools")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.customer_store import CustomerStore
+from common.cohorts import CohortEngine
+
+@pytest.fixture(scope="module")
+def store():
+    rng = np.random.default_rng(0)
+    values = np.column_stack([
+        np.arange(5000, dtype=np.float64),
+        rng.integers(0, 2, 5000),
+        rng.integers(0, 4, 5000),
+        rng.lognormal(11, 0.5, 5000),
+        rng.normal(500000, 100000, 5000),
+    ])
+    values[rng.random(5000) < 0.05, 4] = np.nan
+    return CustomerStore(values, ["SK_ID_CURR", "CODE_GENDER", "CNT_CHILDREN", "AMT_INCOME_TOTAL", "AMT_CREDIT"])
+
+def test_cohort_matches_masks(store):
+    engine = CohortEngine(store, ["CODE_GENDER", "CNT_CHILDREN", "AMT_INCOME_TOTAL"])
+    assert len(engine.levels("AMT_INCOME_TOTAL")) == 5
+    filters = engine.customer_filters(42, ["CODE_GENDER", "CNT_CHILDREN", "AMT_INCOME_TOTAL"])
+    data = store.data
+    band = engine.level_codes("AMT_INCOME_TOTAL", data["AMT_INCOME_TOTAL"].to_numpy())
+    mask = (data["CODE_GENDER"] == data["CODE_GENDER"][42]) & (data["CNT_CHILDREN"] == data["CNT_CHILDREN"][42]) & (band == band[42])
+    assert np.array_equal(engine.positions(filters), np.flatnonzero(mask))
+    assert engine.count(filters) == mask.sum()
+
+def test_percentile_rank(store):
+    engine = CohortEngine(store, ["CODE_GENDER"])
+    filters = {"CODE_GENDER": 1.0}
+    values = store.data["AMT_CREDIT"][store.data["CODE_GENDER"] == 1].dropna().to_numpy()
+    for value in [300000.0, 500000.0, values[0]]:
+        expected = 100 * ((values < value).sum() + (values == value).sum() / 2) / len(values)
+        assert engine.percentile_rank(filters, "AMT_CREDIT", value) == pytest.approx(expected)
+    assert engine.percentile_rank(filters, "AMT_CREDIT", np.nan) is None
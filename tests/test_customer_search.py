@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.customer_search import CustomerIndex
+
+@pytest.fixture(scope="module")
+def ids():
+    rng = np.random.default_rng(0)
+    return np.concatenate([rng.choice(1000000, 5000, replace=False), [0, 7, 42, 100]])
+
+# IDs matching a search, found by looking at every ID
+def brute_force(ids, prefix="", low=None, high=None):
+    return sorted(
+        int(customer_id) for customer_id in ids
+        if str(customer_id).startswith(prefix)
+        and (low is None or customer_id >= low) and (high is None or customer_id <= high)
+    )
+
+@pytest.mark.parametrize("prefix", ["", "0", "1", "4", "42", "123", "99999", "023", "1000000"])
+def test_prefix_search(ids, prefix):
+    index = CustomerIndex(ids)
+    expected = brute_force(ids, prefix)
+    page, total = index.search(prefix, limit=len(ids))
+    assert total == len(expected)
+    assert page == expected
+
+def test_prefix_and_range_search(ids):
+    index = CustomerIndex(ids)
+    expected = brute_force(ids, "5", 50000, 520000)
+    page, total = index.search("5", low=50000, high=520000, limit=len(ids))
+    assert total == len(expected)
+    assert page == expected
+    assert index.search(low=10, high=5) == ([], 0)
+
+def test_pages_follow_each_other(ids):
+    index = CustomerIndex(ids)
+    expected = brute_force(ids, "1")
+    pages = []
+    for offset in range(0, len(expected) + 20, 20):
+        page, total = index.search("1", offset=offset, limit=20)
+        assert len(page) <= 20
+        pages.extend(page)
+    assert pages == expected
@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("imblearn")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from common.feature_store import convert, data_checksum, feature_store_paths, open_customer_store, read_feature_store_meta
+from common.mlmodel import file_checksum, read_signature_inputs
+from common.synthetic_data import MODEL_DIR, make_synthetic_data
+
+# Number of synthetic customers
+N_ROWS = 50
+
+# Columns of the model signature, in its order
+@pytest.fixture(scope="module")
+def inputs():
+    return read_signature_inputs(MODEL_DIR)
+
+# CSV of synthetic customers, its columns in another order than the signature
+@pytest.fixture
+def csv_path(tmp_path):
+    data = make_synthetic_data(MODEL_DIR, N_ROWS)
+    data = data[data.columns[::-1]]
+    path = str(tmp_path / "cleaned_data.csv")
+    data.to_csv(path, index=False)
+    return path
+
+def test_convert_writes_the_matrix_in_model_order(csv_path, inputs):
+    features = [column["name"] for column in inputs]
+    matrix_path = convert(csv_path, MODEL_DIR)
+    assert (matrix_path, matrix_path[:-4] + ".json") == feature_store_paths(csv_path)
+    expected = pd.read_csv(csv_path)[features].to_numpy(dtype=np.float64)
+    assert np.array_equal(np.load(matrix_path), expected, equal_nan=True)
+    meta = read_feature_store_meta(csv_path)
+    assert meta["features"] == features
+    assert meta["types"]["SK_ID_CURR"] == "long"
+    assert meta["source_checksum"] == file_checksum(csv_path)
+    # Readable by the services running as another user
+    assert os.stat(matrix_path).st_mode & 0o777 == 0o644
+
+    store = open_customer_store(csv_path, features)
+    assert isinstance(store.values, np.memmap)
+    assert np.array_equal(store.values, expected, equal_nan=True)
+    assert data_checksum(csv_path) == meta["source_checksum"]
+
+@pytest.mark.parametrize("change, message", [
+    ("drop", "missing"),
+    ("required", "Required column"),
+    ("long", "integers"),
+])
+def test_convert_checks_the_data(csv_path, inputs, change, message):
+    data = pd.read_csv(csv_path)
+    required = next(column["name"] for column in inputs if column["required"] and column["name"] != "SK_ID_CURR")
+    long = next(column["name"] for column in inputs if column["type"] == "long" and column["name"] != "SK_ID_CURR")
+    if change == "drop":
+        data = data.drop(columns=["AMT_CREDIT"])
+    elif change == "required":
+        data.loc[0, required] = np.nan
+    else:
+        data.loc[0, long] = 0.5
+    data.to_csv(csv_path, index=False)
+    with pytest.raises(ValueError, match=message):
+        convert(csv_path, MODEL_DIR)
+    # Nothing written for data that doesn't match the signature
+    assert not any(os.path.exists(path) for path in feature_store_paths(csv_path))
+
+# The CSV changed since the conversion: the matrix is stale and the CSV is read
+def rewrite_csv(csv_path):
+    data = pd.read_csv(csv_path)
+    data.loc[0, "AMT_CREDIT"] += 1000
+    data.to_csv(csv_path, index=False)
+    return pd.read_csv(csv_path)
+
+# Same content and size, only a newer modification time
+def touch_csv(csv_path):
+    source = os.stat(csv_path)
+    os.utime(csv_path, ns=(source.st_atime_ns, source.st_mtime_ns + 10**9))
+    return pd.read_csv(csv_path)
+
+@pytest.mark.parametrize("change", [rewrite_csv, touch_csv])
+def test_stale_matrix_falls_back_to_the_csv(csv_path, inputs, change):
+    features = [column["name"] for column in inputs]
+    convert(csv_path, MODEL_DIR)
+    data = change(csv_path)
+    assert read_feature_store_meta(csv_path) is None
+    store = open_customer_store(csv_path, features)
+    assert not isinstance(store.values, np.memmap)
+    assert np.array_equal(store.values, data[features].to_numpy(dtype=np.float64), equal_nan=True)
+    # The checksum is computed again from the CSV
+    assert data_checksum(csv_path) == file_checksum(csv_path)
+
+def test_other_features_order_falls_back_to_the_csv(csv_path, inputs):
+    features = [column["name"] for column in inputs]
+    convert(csv_path, MODEL_DIR)
+    # A model fitted on the columns in another order can't use the matrix as it is
+    reordered = features[1:] + features[:1]
+    store = open_customer_store(csv_path, reordered)
+    assert not isinstance(store.values, np.memmap)
+    assert store.features == reordered
+    assert np.array_equal(store.values, pd.read_csv(csv_path)[reordered].to_numpy(dtype=np.float64), equal_nan=True)
+    # The matrix is still used for the model order
+    assert isinstance(open_customer_store(csv_path, features).values, np.memmap)
+
+def test_description_without_its_matrix_is_ignored(csv_path):
+    matrix_path, meta_path = feature_store_paths(csv_path)
+    convert(csv_path, MODEL_DIR)
+    os.remove(matrix_path)
+    with open(meta_path) as file:
+        assert json.load(file)["source_size"] == os.stat(csv_path).st_size
+    assert read_feature_store_meta(csv_path) is None
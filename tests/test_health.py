@@ -0,0 +1,71 @@
+import threading
+
+# The API runs in-process on synthetic customers (see conftest.py), loaded when it is imported
+api_url = "/api/v1/customer"
+
+def test_health_of_the_loaded_api(client, api_module):
+    assert client.get("/health/live").json == {"Live": True}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json["Ready"] is True
+    assert response.json["Stages"]["models"] >= 0
+    load_seconds = response.json["Models"]["Active model"]["Load seconds"]
+    assert {"model", "customers", "check", "shap_store", "neighbours", "warm_up"} <= set(load_seconds)
+
+# A loading running in the background, held in its stage until released
+def start_loading(api_module, monkeypatch, fail=False):
+    from startup import Startup
+    loading = Startup()
+    started, released = threading.Event(), threading.Event()
+
+    def load(startup):
+        with startup.stage("models"):
+            started.set()
+            released.wait(10)
+            if fail:
+                raise ValueError("no model")
+
+    monkeypatch.setattr(api_module, "startup", loading)
+    loading.start(load)
+    assert started.wait(10)
+    return loading, released
+
+def test_only_health_answered_while_loading(client, api_module, monkeypatch):
+    loading, released = start_loading(api_module, monkeypatch)
+    assert client.get("/health/live").status_code == 200
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json["Stages"] == {"models": "running"}
+    response = client.get(f"{api_url}?id=231433")
+    assert response.status_code == 503
+    assert response.text.startswith("Error")
+    released.set()
+    loading.thread.join(10)
+    assert client.get("/health/ready").status_code == 200
+    assert client.get(f"{api_url}?id=231433").status_code == 200
+
+def test_failed_loading_is_not_live(client, api_module, monkeypatch):
+    loading, released = start_loading(api_module, monkeypatch, fail=True)
+    released.set()
+    loading.thread.join(10)
+    response = client.get("/health/live")
+    assert response.status_code == 503
+    assert "no model" in response.json["Error"]
+    assert client.get("/health/ready").json["Stages"] == {"models": "failed"}
+
+def test_ready_once_every_worker_is_loaded(client, api_module, monkeypatch, tmp_path):
+    from startup import Startup
+    loading = Startup(ready_dir=str(tmp_path), workers=2)
+    monkeypatch.setattr(api_module, "startup", loading)
+    loading.run(lambda startup: None)
+    # This worker answers, but the other one is still loading
+    assert client.get(f"{api_url}?id=231433").status_code == 200
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json["Workers ready"] == "1/2"
+    # The other worker is loaded
+    (tmp_path / "12345").touch()
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json["Ready"] is True
+    assert response.json["Workers ready"] == "2/2"
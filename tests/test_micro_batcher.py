@@ -0,0 +1,93 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "api"))
+from micro_batcher import MicroBatcher
+
+# Fake model giving the sum of the row and its opposite, remembering the size of the batches
+class SumModel:
+    def __init__(self):
+        self.batch_sizes = []
+        self.barrier = threading.Event()
+
+    def predict(self, rows):
+        # Hold the first batch so the other requests pile up behind it
+        self.barrier.wait(5)
+        self.batch_sizes.append(len(rows))
+        sums = rows.sum(axis=1)
+        return np.column_stack([sums, -sums])
+
+def test_concurrent_rows_are_batched_and_answered_separately():
+    model = SumModel()
+    batcher = MicroBatcher(model.predict, 0.001, 8)
+    results = {}
+
+    def request(i):
+        results[i] = batcher.predict_one(np.array([i, 1.0]))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    model.barrier.set()
+    for thread in threads:
+        thread.join()
+    assert all(np.array_equal(results[i], [i + 1.0, -i - 1.0]) for i in range(20))
+    assert sum(model.batch_sizes) == 20
+    assert max(model.batch_sizes) > 1
+    assert max(model.batch_sizes) <= 8
+
+def test_lone_row_is_scored_at_once():
+    model = SumModel()
+    model.barrier.set()
+    batcher = MicroBatcher(model.predict, 10, 8)
+    assert np.array_equal(batcher.predict_one(np.array([1.0, 2.0])), [3.0, -3.0])
+    assert model.batch_sizes == [1]
+
+def test_errors_reach_every_request():
+    def predict(rows):
+        raise ValueError("broken model")
+    batcher = MicroBatcher(predict, 0, 8)
+    with pytest.raises(ValueError):
+        batcher.predict_one(np.zeros(2))
+
+def test_stop_ends_the_thread_after_the_queued_rows():
+    model = SumModel()
+    predicting = threading.Event()
+
+    def predict(rows):
+        predicting.set()
+        return model.predict(rows)
+
+    batcher = MicroBatcher(predict, 0, 8)
+    results = {}
+
+    def request(i):
+        results[i] = batcher.predict_one(np.array([i, 1.0]))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(5)]
+    # The first row is held in predict, so the next ones stay in the queue
+    threads[0].start()
+    assert predicting.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.perf_counter() + 5
+    while batcher.queue.qsize() < 4 and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    assert batcher.queue.qsize() == 4
+    # Rows queued before the stop are still answered
+    batcher.stop()
+    model.barrier.set()
+    for thread in threads:
+        thread.join()
+    batcher.thread.join(5)
+    assert not batcher.thread.is_alive()
+    assert all(np.array_equal(results[i], [i + 1.0, -i - 1.0]) for i in range(5))
+    # A request still running on the model after the stop is scored without a new thread
+    thread = batcher.thread
+    assert np.array_equal(batcher.predict_one(np.array([1.0, 2.0])), [3.0, -3.0])
+    assert batcher.thread is thread
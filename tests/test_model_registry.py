@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import uuid
+
+import pytest
+import yaml
+
+from conftest import ADMIN_TOKEN
+
+# The API runs in-process on synthetic customers (see conftest.py), 231433 is the first of them
+api_url = "/api/v1/customer"
+admin_url = "/api/v1/admin"
+headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+# Copy of the model of the API under a new version, with some signature columns removed
+def copy_model(api_module, directory, drop_features=()):
+    model_dir = os.path.join(directory, uuid.uuid4().hex)
+    os.makedirs(model_dir)
+    shutil.copy(os.path.join(api_module.MODEL_DIR, "model.pkl"), model_dir)
+    with open(os.path.join(api_module.MODEL_DIR, "MLmodel")) as file:
+        mlmodel = yaml.safe_load(file)
+    mlmodel["model_uuid"] = uuid.uuid4().hex
+    inputs = json.loads(mlmodel["signature"]["inputs"])
+    mlmodel["signature"]["inputs"] = json.dumps([column for column in inputs if column["name"] not in drop_features])
+    with open(os.path.join(model_dir, "MLmodel"), "w") as file:
+        yaml.safe_dump(mlmodel, file)
+    return model_dir, mlmodel["model_uuid"]
+
+# Serve the model of the API alone again after a test
+@pytest.fixture
+def registry(api_module):
+    yield api_module.registry
+    assert api_module.registry.update_state(
+        active=api_module.MODEL_DIR, candidate=None, routing="active", candidate_share=0.0
+    ) is None
+
+def test_admin_requires_token(client, api_module):
+    assert client.get(f"{admin_url}/models").text.startswith("Error")
+    assert client.get(f"{admin_url}/models", headers={"Authorization": "Bearer wrong"}).text.startswith("Error")
+    response = client.get(f"{admin_url}/models", headers=headers)
+    assert response.json["Active model"]["Model version"] == api_module.registry.active.uuid
+
+def test_candidate_ab_shadow_and_promote(client, api_module, registry, tmp_path):
+    active_version = registry.active.uuid
+    candidate_dir, candidate_version = copy_model(api_module, tmp_path)
+
+    # Every customer answered by the candidate
+    response = client.post(f"{admin_url}/reload", json={"candidate": candidate_dir, "routing": "ab", "candidate_share": 1.0}, headers=headers)
+    assert response.json["Candidate model"]["Model version"] == candidate_version
+    assert client.get(f"{api_url}?id=231433").headers["X-Model-Version"] == candidate_version
+    # Unless a version is asked for
+    assert client.get(f"{api_url}?id=231433&model={active_version}").headers["X-Model-Version"] == active_version
+    assert client.get(f"{api_url}?id=231433&model=unknown").text.startswith("Error")
+
+    # The candidate only scored in the shadow of the active model
+    client.post(f"{admin_url}/reload", json={"routing": "shadow"}, headers=headers)
+    response = client.get(f"{api_url}?id=231433")
+    assert response.headers["X-Model-Version"] == active_version
+    # Wait for the shadow scoring, done after the answer
+    api_module.shadow_executor.submit(lambda: None).result()
+    assert f'shadow_version="{candidate_version}"' in client.get("/metrics").text
+
+    # The candidate becomes the active model, the previous one stays to roll back
+    response = client.post(f"{admin_url}/reload", json={"promote": True, "routing": "active"}, headers=headers)
+    assert response.json["Active model"]["Model version"] == candidate_version
+    assert response.json["Candidate model"]["Model version"] == active_version
+    assert client.get(f"{api_url}?id=231433").headers["X-Model-Version"] == candidate_version
+
+def test_swapped_out_model_stops_its_batcher(api_module, registry, tmp_path):
+    from micro_batcher import MicroBatcher
+    candidate_dir, _ = copy_model(api_module, tmp_path)
+    assert registry.update_state(candidate=candidate_dir) is None
+    candidate = registry.candidate
+    candidate.batcher = MicroBatcher(candidate.score_values, 0, 8)
+    assert candidate.predict_values(candidate.store.values[:1]).shape == (1, 2)
+    assert candidate.batcher.thread.is_alive()
+    # The candidate removed, its thread ends and no longer holds the model
+    assert registry.update_state(candidate=None) is None
+    candidate.batcher.thread.join(5)
+    assert not candidate.batcher.thread.is_alive()
+    assert registry.active.batcher is None or not registry.active.batcher.stopped
+
+def test_reload_keeps_models_on_bad_candidate(client, api_module, registry, tmp_path):
+    active = registry.active
+    candidate_dir, _ = copy_model(api_module, tmp_path, drop_features=["AMT_CREDIT"])
+    response = client.post(f"{admin_url}/reload", json={"candidate": candidate_dir}, headers=headers)
+    assert response.text.startswith("Error")
+    assert "AMT_CREDIT" in response.text
+    assert registry.active is active
+    assert registry.candidate is None
+    assert client.get(f"{api_url}?id=231433").status_code == 200
+
+def test_reload_of_a_model_replaced_in_place(api_module, tmp_path):
+    from model_registry import ModelRegistry
+    model_dir, _ = copy_model(api_module, tmp_path)
+    registry = ModelRegistry(api_module.DATA_PATH, model_dir, str(tmp_path / "state.json"))
+    old = registry.active
+    # A new MLflow model written over the old one
+    new_dir, new_version = copy_model(api_module, tmp_path)
+    shutil.copy(os.path.join(new_dir, "MLmodel"), model_dir)
+    assert registry.check() is None
+    assert registry.active.uuid == new_version
+    # The requests already running keep the model they started with
+    assert old.predict_positions([0]).shape == (1, 2)
+
+def test_candidate_loaded_from_its_native_export(client, api_module, registry, tmp_path):
+    from common.native_model import export_native_model
+    candidate_dir, candidate_version = copy_model(api_module, tmp_path)
+    export_native_model(candidate_dir)
+    response = client.post(f"{admin_url}/reload", json={"candidate": candidate_dir}, headers=headers)
+    assert response.json["Candidate model"]["Model artifact"] == "native"
+    # Same scores as the pickled pipeline of the active model
+    active_score = client.get(f"{api_url}?id=231433").json
+    candidate_score = client.get(f"{api_url}?id=231433&model={candidate_version}").json
+    assert candidate_score == pytest.approx(active_score)
+    explanation = client.get(f"{api_url}/explain?id=231440&top=5&model={candidate_version}")
+    assert explanation.status_code == 200 and not explanation.text.startswith("Error")
+
+def test_reload_refuses_to_remove_the_active_model(client, api_module, registry):
+    active = registry.active
+    for body in [{"active": None}, {"active": ""}]:
+        response = client.post(f"{admin_url}/reload", json=body, headers=headers)
+        assert response.text.startswith("Error")
+        assert registry.active is active
+    assert client.get(f"{api_url}?id=231433").status_code == 200
+    if os.path.exists(api_module.MODEL_STATE_PATH):
+        with open(api_module.MODEL_STATE_PATH) as file:
+            assert json.load(file)["active"]
+
+def test_unavailable_candidate_of_the_state_file_is_dropped(api_module, tmp_path):
+    from model_registry import ModelRegistry
+    model_dir, version = copy_model(api_module, tmp_path)
+    # A candidate deleted since the state was written
+    state_path = tmp_path / "state.json"
+    state_path.write_text(json.dumps({"active": model_dir, "candidate": str(tmp_path / "deleted"), "routing": "ab", "candidate_share": 0.5}))
+    registry = ModelRegistry(api_module.DATA_PATH, model_dir, str(state_path))
+    assert registry.active.uuid == version
+    assert registry.candidate is None
+    assert "dropped" in registry.last_error
+    assert registry.pick(231433) is registry.active
+    # A candidate whose model can't be loaded
+    broken_dir, _ = copy_model(api_module, tmp_path)
+    with open(os.path.join(broken_dir, "model.pkl"), "wb") as file:
+        file.write(b"not a pickle")
+    state_path.write_text(json.dumps({"active": model_dir, "candidate": broken_dir, "routing": "ab", "candidate_share": 0.5}))
+    assert registry.check() is None
+    assert registry.active.uuid == version
+    assert registry.candidate is None
+    assert "dropped" in registry.last_error
@@ -0,0 +1,71 @@
+import shutil
+import sys
+import warnings
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("lightgbm")
+pytest.importorskip("imblearn")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "api"))
+from common.mlmodel import load_pipeline
+from common.native_model import NativePipeline, export_native_model, has_native_model, load_model
+from tree_engine import TreeEngine
+
+# Copy of the model of the repository, exported
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    warnings.simplefilter("ignore")
+    model_dir = tmp_path_factory.mktemp("model")
+    for name in ["MLmodel", "model.pkl"]:
+        shutil.copy(ROOT / "data" / "model" / name, model_dir)
+    export_native_model(str(model_dir))
+    return str(model_dir)
+
+def test_native_model_scores_like_the_pipeline(model_dir):
+    pipeline, features, signature = load_pipeline(model_dir)
+    native, native_features, native_signature = load_model(model_dir, "native")
+    assert native_features == features and native_signature == signature
+    scaler = pipeline.named_steps["scaler"]
+    rng = np.random.default_rng(0)
+    values = rng.normal(scaler.mean_, scaler.scale_, size=(500, len(features)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    expected = pipeline.predict_proba(pd.DataFrame(values, columns=features))
+    # Trees read from the text format without LightGBM, and the LightGBM booster
+    assert np.allclose(TreeEngine(native).predict_proba(values), expected, rtol=0, atol=1e-9)
+    assert np.allclose(native.predict_proba(values), expected, rtol=0, atol=1e-12)
+
+def test_native_model_explained_like_the_pipeline(model_dir):
+    pytest.importorskip("shap")
+    from common.shap_store import ShapExplainer
+    pipeline, features, _ = load_pipeline(model_dir)
+    native, _, _ = load_model(model_dir, "native")
+    scaler = pipeline.named_steps["scaler"]
+    rng = np.random.default_rng(1)
+    values = rng.normal(scaler.mean_, scaler.scale_, size=(200, len(features)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    rows = pd.DataFrame(values, columns=features)
+    # SHAP values of the booster read back from the text export, and of the pickled classifier
+    expected = ShapExplainer(pipeline).explain(rows)
+    native_values = ShapExplainer(native).explain(rows)
+    assert native_values.shape == expected.shape
+    assert np.allclose(native_values, expected, rtol=0, atol=1e-9)
+
+def test_load_model_picks_the_export_of_the_current_version(model_dir, tmp_path):
+    assert isinstance(load_model(model_dir)[0], NativePipeline)
+    assert not isinstance(load_model(model_dir, "pickle")[0], NativePipeline)
+    # A new model in the directory makes the export stale
+    shutil.copytree(model_dir, tmp_path / "model")
+    mlmodel = (tmp_path / "model" / "MLmodel").read_text()
+    (tmp_path / "model" / "MLmodel").write_text(mlmodel.replace("model_uuid: ", "model_uuid: new"))
+    assert not has_native_model(str(tmp_path / "model"))
+    assert not isinstance(load_model(str(tmp_path / "model"))[0], NativePipeline)
+    with pytest.raises(ValueError):
+        load_model(str(tmp_path / "model"), "native")
+    with pytest.raises(ValueError):
+        load_model(model_dir, "onnx")
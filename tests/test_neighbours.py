@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("scipy")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.customer_store import CustomerStore
+from common.neighbours import NeighbourIndex
+
+def test_index_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(0, 5, size=(20, 30))
+    values = centers[rng.integers(0, 20, 3000)] + rng.normal(0, 1, size=(3000, 30))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:, 0] = np.arange(3000)
+    store = CustomerStore(values, ["SK_ID_CURR"] + [f"F{i}" for i in range(29)])
+    weights = np.ones(30)
+    weights[1] = 5
+    index = NeighbourIndex.build(store, np.zeros(30), np.ones(30), weights)
+    index.save(str(tmp_path / "index.npz"))
+    index = NeighbourIndex.load(str(tmp_path / "index.npz"), store)
+    for position in range(0, 3000, 300):
+        positions, distances = index.query(values[position], k=10, exclude=position)
+        expected, expected_distances = index.brute_force_query(values[position], k=10, exclude=position)
+        assert position not in positions
+        assert np.allclose(distances, expected_distances)
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("cachetools")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.customer_store import CustomerStore
+from common.population_stats import PopulationStats
+
+@pytest.fixture(scope="module")
+def stats():
+    rng = np.random.default_rng(0)
+    values = np.column_stack([
+        np.arange(10000, dtype=np.float64),
+        rng.lognormal(10, 1, 10000),
+        rng.integers(0, 2, 10000).astype(np.float64),
+    ])
+    values[rng.random(10000) < 0.05, 1] = np.nan
+    return PopulationStats(CustomerStore(values, ["SK_ID_CURR", "AMT_INCOME_TOTAL", "FLAG_OWN_CAR"]))
+
+def test_histogram_quantile_bins(stats):
+    histogram = stats.histogram("AMT_INCOME_TOTAL")
+    assert histogram.counts.sum() + histogram.missing == 10000
+    # Quantile bins hold about the same number of customers, even on a skewed feature
+    assert histogram.counts.max() < 2 * histogram.counts.min()
+    assert stats.histogram("AMT_INCOME_TOTAL") is histogram
+
+def test_histogram_discrete_feature(stats):
+    histogram = stats.histogram("FLAG_OWN_CAR")
+    assert len(histogram.counts) == 2
+    assert histogram.counts.sum() == 10000
+
+def test_density_grid(stats):
+    grid = stats.density("AMT_INCOME_TOTAL", "FLAG_OWN_CAR")
+    assert grid.counts.shape == (len(grid.x_edges) - 1, 2)
+    assert grid.counts.sum() + grid.missing == 10000
+
+def test_density_grid_per_unit_of_area():
+    rng = np.random.default_rng(1)
+    # Independent features: the density of a cell is the product of the densities of its bins
+    values = np.column_stack([np.arange(20000, dtype=np.float64), rng.normal(0, 1, 20000), rng.lognormal(0, 1, 20000)])
+    stats = PopulationStats(CustomerStore(values, ["SK_ID_CURR", "X", "Y"]))
+    grid = stats.density("X", "Y")
+    density = grid.density()
+    assert np.allclose(density * np.outer(np.diff(grid.x_edges), np.diff(grid.y_edges)), grid.counts)
+    # Quantile cells hold about the same number of customers, but the central ones are denser
+    center = len(grid.x_edges) // 2
+    assert density[center].sum() > 10 * density[0].sum()
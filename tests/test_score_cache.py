@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "api"))
+from score_cache import ScoreCache, load_score_cache
+
+# Probability of the customers of the fake model, the cached one is told apart from a live score
+CACHED_PROBABILITY = 0.125
+
+# Customers of a store, only what the table needs
+class FakeStore:
+    def __init__(self, ids):
+        self.ids = np.array(ids, dtype=np.int64)
+        self.values = np.column_stack([self.ids, np.ones(len(self.ids))]).astype(np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+# Fake model counting the rows it scores
+class CountingModel:
+    def __init__(self):
+        self.scored = 0
+
+    def predict(self, rows):
+        self.scored += len(rows)
+        bad = (rows[:, 0] % 10) / 10
+        return np.column_stack([1 - bad, bad])
+
+def test_table_built_and_reused(tmp_path):
+    store = FakeStore(range(100, 130))
+    path = str(tmp_path / "score_cache.npz")
+    model = CountingModel()
+    cache = load_score_cache(model.predict, store, "uuid", "checksum", path)
+    assert model.scored == len(store)
+    assert np.allclose(cache.probabilities, model.predict(store.values))
+    # The next load reads the persisted file without scoring anyone
+    model.scored = 0
+    reloaded = load_score_cache(model.predict, store, "uuid", "checksum", path)
+    assert model.scored == 0
+    assert np.array_equal(reloaded.probabilities, cache.probabilities)
+    assert np.array_equal(reloaded.ids, store.ids)
+
+@pytest.mark.parametrize("model_uuid, data_checksum, ids", [
+    ("other uuid", "checksum", range(100, 130)),
+    ("uuid", "other checksum", range(100, 130)),
+    ("uuid", "checksum", range(200, 230)),
+])
+def test_stale_table_rebuilt(tmp_path, model_uuid, data_checksum, ids):
+    path = str(tmp_path / "score_cache.npz")
+    ScoreCache.build(CountingModel().predict, FakeStore(range(100, 130)), "uuid", "checksum").save(path)
+    # Another model, data file or list of customers than the ones of the file
+    store = FakeStore(ids)
+    model = CountingModel()
+    cache = load_score_cache(model.predict, store, model_uuid, data_checksum, path)
+    assert model.scored == len(store)
+    assert cache.is_valid_for(model_uuid, data_checksum)
+    assert np.array_equal(cache.ids, store.ids)
+    # And written over the stale one
+    assert ScoreCache.load(path).is_valid_for(model_uuid, data_checksum)
+
+def test_ad_hoc_rows_scored_live(client, api_module, monkeypatch):
+    model = api_module.registry.active
+    probabilities = np.tile([1 - CACHED_PROBABILITY, CACHED_PROBABILITY], (len(model.store), 1))
+    monkeypatch.setattr(model, "score_cache", ScoreCache(model.uuid, "checksum", model.store.ids, probabilities))
+    # The customers of the store are read from the table
+    response = client.get("/api/v1/customer?id=231433")
+    assert response.json["Probability of the customer being a bad one"] == CACHED_PROBABILITY
+    # A row changed by the user is scored by the model
+    response = client.post("/api/v1/score", json={"id": 231433, "features": {"AMT_CREDIT": 500000}})
+    row = model.store.values[model.store.position(231433)].copy()
+    row[model.feature_positions["AMT_CREDIT"]] = 500000
+    expected = model.score_values(row[np.newaxis, :])[0, 1]
+    assert expected != CACHED_PROBABILITY
+    assert response.json["Probability of the customer being a bad one"] == pytest.approx(expected)
@@ -0,0 +1,96 @@
+import sys
+import threading
+import warnings
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("lightgbm")
+pytest.importorskip("imblearn")
+pytest.importorskip("shap")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from common.customer_store import CustomerStore
+from common.mlmodel import load_pipeline
+from common.shap_store import ShapExplainer, ShapStore, create_store_files
+from common.synthetic_data import make_synthetic_data
+
+MODEL_DIR = str(ROOT / "data" / "model")
+
+@pytest.fixture(scope="module")
+def pipeline():
+    warnings.simplefilter("ignore")
+    return load_pipeline(MODEL_DIR)[0]
+
+@pytest.fixture(scope="module")
+def store(pipeline):
+    return CustomerStore.from_frame(make_synthetic_data(MODEL_DIR, 60), list(pipeline.feature_names_in_))
+
+# Explainer counting the rows it explains
+class CountingExplainer:
+    def __init__(self, explainer):
+        self.explainer = explainer
+        self.explained = []
+
+    def explain(self, rows):
+        self.explained.extend(rows.index.tolist())
+        return self.explainer.explain(rows)
+
+def test_values_computed_on_demand_and_persisted(pipeline, store, tmp_path):
+    explainer = CountingExplainer(ShapExplainer(pipeline))
+    shap_store = ShapStore(str(tmp_path), explainer, store)
+    assert shap_store.completion() == 0
+    values = shap_store.values([3, 5, 3])
+    expected = ShapExplainer(pipeline).explain(store.rows([3, 5]))
+    assert np.allclose(values, expected[[0, 1, 0]], atol=1e-5)
+    # Only the customers asked for are marked done, and only once
+    assert np.flatnonzero(shap_store.done).tolist() == [3, 5]
+    assert len(explainer.explained) == 2
+    shap_store.values([5])
+    assert len(explainer.explained) == 2
+
+    # A new process reads them from the disk without explaining them again
+    reopened_explainer = CountingExplainer(ShapExplainer(pipeline))
+    reopened = ShapStore(str(tmp_path), reopened_explainer, store)
+    assert np.array_equal(reopened.values([3, 5]), values[:2])
+    assert reopened_explainer.explained == []
+    assert reopened.completion() == pytest.approx(2 / len(store))
+
+def test_global_importance_kept_up_to_date(pipeline, store, tmp_path):
+    shap_store = ShapStore(str(tmp_path), ShapExplainer(pipeline), store)
+    shap_store.values(range(10))
+    importance = shap_store.global_importance()
+    assert np.allclose(importance, np.abs(shap_store.values(range(10))).mean(axis=0))
+    # New customers are added to the running sums, the ones already done are not counted twice
+    shap_store.values(range(5, 20))
+    assert np.allclose(shap_store.global_importance(), np.abs(shap_store.values(range(20))).mean(axis=0))
+    shap_store.fill(chunk_size=16)
+    assert shap_store.completion() == 1
+    assert np.allclose(shap_store.global_importance(), np.abs(shap_store.values(range(len(store)))).mean(axis=0))
+
+def test_explanations_of_the_scaled_matrix(pipeline, store):
+    rows = store.rows(range(5))
+    values = ShapExplainer(pipeline).explain(rows)
+    # The SHAP values add up to the raw score of the booster on the scaled rows
+    scaled = pipeline.named_steps["scaler"].transform(rows)
+    raw = pipeline.named_steps["model"].predict(scaled, raw_score=True)
+    expected_value = raw - values.sum(axis=1)
+    assert np.allclose(expected_value, expected_value[0], atol=1e-6)
+
+def test_files_created_once_by_concurrent_processes(pipeline, store, tmp_path):
+    shape = (len(store), len(store.features))
+    threads = [threading.Thread(target=create_store_files, args=(str(tmp_path), shape)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    first = ShapStore(str(tmp_path), ShapExplainer(pipeline), store)
+    second = ShapStore(str(tmp_path), ShapExplainer(pipeline), store)
+    # Values written by one process are seen by the other one
+    first.values([7])
+    assert second.done[7]
+    assert np.array_equal(second.shap_values[7], first.shap_values[7])
+    assert np.any(second.shap_values[7] != 0)
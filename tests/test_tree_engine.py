@@ -0,0 +1,32 @@
+import pickle
+import sys
+import warnings
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("lightgbm")
+pytest.importorskip("imblearn")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "api"))
+from tree_engine import TreeEngine
+
+@pytest.fixture(scope="module")
+def pipeline():
+    warnings.simplefilter("ignore")
+    with open(ROOT / "data" / "model" / "model.pkl", "rb") as file:
+        return pickle.load(file)
+
+def test_tree_engine_matches_pipeline(pipeline):
+    engine = TreeEngine(pipeline)
+    scaler = pipeline.named_steps["scaler"]
+    rng = np.random.default_rng(0)
+    values = rng.normal(scaler.mean_, scaler.scale_, size=(2000, len(scaler.mean_)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    expected = pipeline.predict_proba(pd.DataFrame(values, columns=pipeline.feature_names_in_))
+    assert np.allclose(engine.predict_proba(values), expected, rtol=0, atol=1e-9)
+    # A single row gives the same result as in a batch
+    assert np.allclose(engine.predict_proba(values[0]), expected[:1], rtol=0, atol=1e-9)